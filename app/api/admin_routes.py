@@ -0,0 +1,133 @@
+from sqlalchemy.orm import Session
+import os
+from fastapi import Depends, APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from typing import List
+import settings
+from schemas import admin_schema
+from db.database import get_db
+from db.slow_query_log import slow_query_log
+from exceptions.CustomException import CustomException
+from utils import consts, custom_declarators, memory_profiler, profiler
+from utils.routing import InstrumentedRoute
+from utils.status import get_responses
+import logging
+
+router = APIRouter(route_class=InstrumentedRoute)
+logger = logging.getLogger()
+print = logger.info
+
+
+@router.get("/admin/slow-queries", response_model=List[admin_schema.SlowQuery], responses=get_responses([401, 403, 426, 500]), tags=["Admin"], description=f"List the slowest SQL statement fingerprints of this process, with percentile latencies and a sampled EXPLAIN. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def list_slow_queries(request: Request, db: Session = Depends(get_db), limit: int = 20, order_by: admin_schema.SlowQueryOrder = admin_schema.SlowQueryOrder.TOTAL):
+    return slow_query_log.top(max(limit, 1), order_by.value)
+
+
+@router.get("/admin/profiles", response_model=List[admin_schema.Profile], responses=get_responses([401, 403, 426, 500]), tags=["Admin"], description=f"List the stored CPU profiles, most recent first. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def list_profiles(request: Request, db: Session = Depends(get_db)):
+    return profiler.store.list()
+
+
+@router.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, responses=get_responses([401, 403, 404, 426, 500]), tags=["Admin"], description=f"Get a CPU profile as collapsed stacks (flamegraph.pl, speedscope). Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def get_profile(profile_id: str, request: Request, db: Session = Depends(get_db)):
+    profile = profiler.store.get(profile_id)
+    if profile is None:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_404,
+            detail=consts.Consts.PROFILE_NOT_FOUND,
+            info=f"Profile {profile_id} not found"
+        )
+    return PlainTextResponse(profile["stacks"])
+
+
+@router.post("/admin/profiles", response_model=admin_schema.ProcessProfileStarted, status_code=202, responses=get_responses([401, 403, 409, 426, 500]), tags=["Admin"], description=f"Sample every thread of the worker answering this request for `seconds`, the profile is then listed on GET /admin/profiles. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def start_process_profile(request: Request, db: Session = Depends(get_db), seconds: int = 10):
+    seconds = min(max(seconds, 1), settings.env.PROFILING_MAX_SECONDS)
+    if not profiler.start_process_profile(seconds):
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_409,
+            detail=consts.Consts.PROFILE_ALREADY_RUNNING,
+            info="A process profile is already running in this worker"
+        )
+    return admin_schema.ProcessProfileStarted(seconds=seconds, pid=os.getpid())
+
+
+@router.get("/admin/memory/tracing", response_model=admin_schema.MemoryTracing, responses=get_responses([401, 403, 426, 500]), tags=["Admin"], description=f"Get the tracemalloc status of the worker answering this request. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def get_memory_tracing(request: Request, db: Session = Depends(get_db)):
+    return memory_profiler.status()
+
+
+@router.post("/admin/memory/tracing", response_model=admin_schema.MemoryTracing, responses=get_responses([401, 403, 426, 500]), tags=["Admin"], description=f"Start tracemalloc in the worker answering this request, storing `frames` frames per allocation. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def start_memory_tracing(request: Request, db: Session = Depends(get_db), frames: int = 1):
+    return memory_profiler.start(min(max(frames, 1), 64))
+
+
+@router.delete("/admin/memory/tracing", response_model=admin_schema.MemoryTracing, responses=get_responses([401, 403, 426, 500]), tags=["Admin"], description=f"Stop tracemalloc in the worker answering this request and drop its snapshots. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def stop_memory_tracing(request: Request, db: Session = Depends(get_db)):
+    return memory_profiler.stop()
+
+
+@router.get("/admin/memory/snapshots", response_model=List[admin_schema.MemorySnapshot], responses=get_responses([401, 403, 426, 500]), tags=["Admin"], description=f"List the memory snapshots of the worker answering this request. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def list_memory_snapshots(request: Request, db: Session = Depends(get_db)):
+    return memory_profiler.snapshots.list()
+
+
+@router.post("/admin/memory/snapshots", response_model=admin_schema.MemorySnapshot, status_code=201, responses=get_responses([201, 401, 403, 409, 426, 500]), tags=["Admin"], description=f"Take a memory snapshot. Requires tracemalloc to be started. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def take_memory_snapshot(request: Request, db: Session = Depends(get_db)):
+    if not memory_profiler.status()["tracing"]:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_409,
+            detail=consts.Consts.MEMORY_TRACING_NOT_STARTED,
+            info=f"tracemalloc is not started in worker {os.getpid()}"
+        )
+    return memory_profiler.snapshots.take()
+
+
+def get_snapshot_or_raise(db: Session, snapshot_id: str):
+    snapshot = memory_profiler.snapshots.get(snapshot_id)
+    if snapshot is None:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_404,
+            detail=consts.Consts.SNAPSHOT_NOT_FOUND,
+            info=f"Memory snapshot {snapshot_id} not found in worker {os.getpid()}"
+        )
+    return snapshot[1]
+
+
+@router.get("/admin/memory/snapshots/{snapshot_id}", response_model=List[admin_schema.MemoryStat], responses=get_responses([401, 403, 404, 426, 500]), tags=["Admin"], description=f"Top allocations of a snapshot, grouped by line or by file. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def get_memory_snapshot(snapshot_id: str, request: Request, db: Session = Depends(get_db), group_by: admin_schema.MemoryGroupBy = admin_schema.MemoryGroupBy.LINENO, limit: int = 20):
+    snapshot = get_snapshot_or_raise(db, snapshot_id)
+    return memory_profiler.top(snapshot, group_by.value, max(limit, 1))
+
+
+@router.get("/admin/memory/snapshots/{snapshot_id}/diff/{other_snapshot_id}", response_model=List[admin_schema.MemoryStat], responses=get_responses([401, 403, 404, 426, 500]), tags=["Admin"], description=f"Allocations that changed the most from `snapshot_id` to `other_snapshot_id`, grouped by line or by file. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def diff_memory_snapshots(snapshot_id: str, other_snapshot_id: str, request: Request, db: Session = Depends(get_db), group_by: admin_schema.MemoryGroupBy = admin_schema.MemoryGroupBy.LINENO, limit: int = 20):
+    old_snapshot = get_snapshot_or_raise(db, snapshot_id)
+    new_snapshot = get_snapshot_or_raise(db, other_snapshot_id)
+    return memory_profiler.diff(old_snapshot, new_snapshot, group_by.value, max(limit, 1))
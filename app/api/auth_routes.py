@@ -4,18 +4,19 @@ from schemas import user_schema, token_schema
 from repository import token_repository
 from crud import token_crud, user_crud
 from db.database import get_db
+from utils.routing import InstrumentedRoute
 from utils.status import Status, get_responses
 from utils import custom_declarators, rights, consts
 from exceptions.CustomException import CustomException
 import logging
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 logger = logging.getLogger()
 print = logger.info
 
 
-@router.post('/auth/token', response_model=token_schema.AuthToken, tags=["Auth"], responses=get_responses([401, 422, 426, 500]), description="Get refresh token. Permission=User")
+@router.post('/auth/token', response_model=token_schema.AuthToken, tags=["Auth"], responses=get_responses([401, 422, 426, 429, 500]), description="Get refresh token. Permission=User")
 @custom_declarators.version_check
 def login(request: Request, auth: token_schema.AuthLogin, db: Session = Depends(get_db)):
     if auth.username and auth.password:
@@ -30,7 +31,7 @@ def login(request: Request, auth: token_schema.AuthLogin, db: Session = Depends(
         return token_repository.create_token(db=db, user_id=db_user.id)
 
 
-@router.post('/auth/refresh', response_model=token_schema.AuthToken, tags=["Auth"], responses=get_responses([401, 422, 500, 426]), description="Get new access token from refresh token. Permission=User")
+@router.post('/auth/refresh', response_model=token_schema.AuthToken, tags=["Auth"], responses=get_responses([401, 422, 426, 429, 500]), description="Get new access token from refresh token. Permission=User")
 @custom_declarators.version_check
 def refresh_token(request: Request, refresh: token_schema.AuthRefresh, db: Session = Depends(get_db)):
 
@@ -1,20 +1,117 @@
 from sqlalchemy.orm import Session
-from fastapi import Depends, APIRouter, Request
-from models import item_model as models
-from crud import item_crud
+from fastapi import Depends, APIRouter, Request, Response
+from fastapi.responses import JSONResponse
+import settings
+from crud import item_crud, user_crud
 from schemas import item_schema
-from db.database import engine, get_db
+from db.database import get_db
+from utils.routing import InstrumentedRoute
 from utils.status import Status, get_responses
-from utils import custom_declarators, rights, consts
+from utils import custom_declarators, etags, fieldsets, rights, consts
 from exceptions.CustomException import CustomException
 import logging
 from typing import Optional
 
 
-router = APIRouter()
-models.Base.metadata.create_all(bind=engine)
+router = APIRouter(route_class=InstrumentedRoute)
 logger = logging.getLogger()
 print = logger.info
+EXPANSIONS = (consts.Consts.EXPAND_USER,)
+# The fields= and expand= responses are built without the response_model: their shapes are documented here
+SHAPED_ITEM_RESPONSE = {"model": item_schema.ItemShaped, "description": "The Item. With fields=, only the requested fields. With expand=user, its owner in user"}
+SHAPED_ITEM_LIST_RESPONSE = {"model": item_schema.ItemShapedList, "description": "The Items. With fields=, only the requested fields of each Item. With expand=user, their owners in user"}
+
+
+def _expanded_fields(requested_fields: list):
+    # Item fields (all of them without a sparse fieldset) followed by the embedded owner
+    return (requested_fields or list(item_schema.ItemResponse.model_fields)) + [consts.Consts.EXPAND_USER]
+
+
+def _selected_ids(db: Session, selection: item_schema.ItemSelection, allowed_user, is_admin: bool, not_description: str = None):
+    """
+    Ids of the items of a bulk write, and whether a filter matched more items than a request can write.
+    Listed ids are checked by the caller, filters are scoped to the ownership of the caller.
+    """
+    if (selection.ids is None) == (selection.filter is None):
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_400,
+            detail=consts.Consts.INVALID_BULK_SELECTION,
+            info="Bulk write without ids nor filter, or with both"
+        )
+    if selection.ids is not None:
+        item_ids = list(dict.fromkeys(selection.ids))
+        if len(item_ids) > settings.env.BULK_MAX_ITEMS:
+            raise CustomException(
+                db=db,
+                status_code=consts.Consts.ERROR_CODE_400,
+                detail=consts.Consts.TOO_MANY_ITEMS,
+                info=f"{len(item_ids)} items in a bulk write, at most {settings.env.BULK_MAX_ITEMS} allowed"
+            )
+        return item_ids, False
+
+    # An empty filter would select every item of the caller: an explicit user_id is needed for that
+    if selection.filter.name is None and selection.filter.description is None and selection.filter.user_id is None:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_400,
+            detail=consts.Consts.INVALID_BULK_FILTER,
+            info="Bulk write with an empty filter"
+        )
+    user_id = selection.filter.user_id or allowed_user.id
+    if user_id != allowed_user.id and not is_admin:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_403,
+            detail=consts.Consts.FORBIDDEN_ACCESS,
+            info=f"User {allowed_user.id} does not have rights to edit the Items of User {user_id}"
+        )
+    item_ids = item_crud.find_item_ids(db, user_id, selection.filter.name, selection.filter.description, not_description, limit=settings.env.BULK_MAX_ITEMS + 1)
+    return item_ids[:settings.env.BULK_MAX_ITEMS], len(item_ids) > settings.env.BULK_MAX_ITEMS
+
+
+def _result(item_id: int, status: int, detail: str = None):
+    return item_schema.ItemBulkResult(id=item_id, status=status, detail=detail)
+
+
+def _bulk_write(db: Session, item_ids: list, allowed_user, is_admin: bool, write, is_written):
+    """
+    Runs write(db, versions) once per chunk of BULK_CHUNK_SIZE items, after checking the owners of the whole chunk in
+    a single query. Only the rows still in the version checked are written: when fewer rows than allowed are written,
+    the chunk is read again and is_written(row, version) settles the result of each id.
+    Returns the number of items written and the result of each id.
+    """
+    user_id = allowed_user.id
+    count = 0
+    results = []
+    for start in range(0, len(item_ids), settings.env.BULK_CHUNK_SIZE):
+        chunk = item_ids[start:start + settings.env.BULK_CHUNK_SIZE]
+        rows = item_crud.get_item_states(db, chunk)
+        versions = {}
+        chunk_results = {}
+        for item_id in chunk:
+            row = rows.get(item_id)
+            if row is None:
+                chunk_results[item_id] = _result(item_id, consts.Consts.ERROR_CODE_404, consts.Consts.ITEM_NOT_FOUND)
+            elif not is_admin and row.user_id != user_id:
+                chunk_results[item_id] = _result(item_id, consts.Consts.ERROR_CODE_403, consts.Consts.FORBIDDEN_ACCESS)
+            else:
+                versions[item_id] = row.version
+                chunk_results[item_id] = _result(item_id, 200)
+        if versions and write(db, versions) != len(versions):
+            # Some rows were modified or deleted by another request since the check
+            rows = item_crud.get_item_states(db, list(versions))
+            for item_id, version in versions.items():
+                row = rows.get(item_id)
+                if is_written(row, version):
+                    continue
+                if row is None:
+                    chunk_results[item_id] = _result(item_id, consts.Consts.ERROR_CODE_404, consts.Consts.ITEM_NOT_FOUND)
+                else:
+                    chunk_results[item_id] = _result(item_id, consts.Consts.ERROR_CODE_412, consts.Consts.PRECONDITION_FAILED)
+        count += sum(1 for result in chunk_results.values() if result.status == 200)
+        results.extend(chunk_results[item_id] for item_id in chunk)
+    return count, results
 
 
 @router.post("/items", response_model=item_schema.ItemResponse, status_code=201, responses=get_responses([201, 401, 403, 409, 422, 426, 500]), tags=["Items"], description="Create an Item object. Permission=User")
@@ -38,10 +135,10 @@ def create_item(item: item_schema.ItemCreate, request: Request, db: Session = De
     return db_item
 
 
-@router.patch("/items/{item_id}", response_model=item_schema.ItemResponse, responses=get_responses([401, 403, 404, 409, 422, 426, 500]), tags=["Items"], description="Update an Item object. Permission=User")
+@router.patch("/items/{item_id}", response_model=item_schema.ItemResponse, responses=get_responses([401, 403, 404, 409, 412, 422, 426, 500]), tags=["Items"], description="Update an Item object. Honours If-Match header. Permission=User")
 @custom_declarators.version_check
 @custom_declarators.permission(consts.Consts.PERMISSION_ADMIN_OR_ITEM_OWNER)
-def update_item(item_id: int, item: item_schema.ItemUpdate, request: Request, db: Session = Depends(get_db)):
+def update_item(item_id: int, item: item_schema.ItemUpdate, request: Request, response: Response, db: Session = Depends(get_db)):
     # Check item exist
     db_item = item_crud.get_item(db, item_id=item_id)
     if not db_item:
@@ -52,6 +149,10 @@ def update_item(item_id: int, item: item_schema.ItemUpdate, request: Request, db
             info=f"Item {item_id} not found"
         )
 
+    # Prevent lost updates: checked here, then enforced by the UPDATE in case of a concurrent write
+    etags.check_if_match(request, db, etags.compute(db_item))
+    version = db_item.version if etags.has_if_match(request) else None
+
     db_item = item_crud.get_item_by_name(db, name=item.name)
     if db_item:
         raise CustomException(
@@ -62,16 +163,62 @@ def update_item(item_id: int, item: item_schema.ItemUpdate, request: Request, db
         )
 
     # Update Item
-    db_item = item_crud.update_item(db=db, item_id=item_id, item=item)
+    db_item = item_crud.update_item(db=db, item_id=item_id, item=item, version=version)
+    if not db_item and version is not None:
+        raise etags.precondition_failed(db, f"Item {item_id} modified since version {version}")
+    if not db_item:
+        # Deleted by another request since it was read
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_404,
+            detail=consts.Consts.ITEM_NOT_FOUND,
+            info=f"Item {item_id} not found"
+        )
+    response.headers[consts.Consts.HEADER_ETAG] = etags.compute(db_item)
     return db_item
 
 
-@router.get("/items/{item_id}", response_model=item_schema.ItemResponse, responses=get_responses([401, 403, 404, 426, 500]), tags=["Items"], description="Get an Item. Permission=User")
+@router.patch("/items", response_model=item_schema.ItemBulkResponse, responses=get_responses([400, 401, 403, 422, 426, 429, 500]), tags=["Items"], description=f"Set the description of the listed Items, or of the Items matching a filter (Items of the caller by default). At most {settings.env.BULK_MAX_ITEMS} Items per request, with a result per Item. Permission=Admin or Item owner")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_USER)
+def update_items(selection: item_schema.ItemBulkUpdate, request: Request, db: Session = Depends(get_db)):
+    allowed_user = rights.is_authenticated(db, rights.retrieve_token_from_header(request))
+    is_admin = user_crud.is_admin(db, allowed_user.id)
+
+    # With a filter, items already up to date are not selected again: repeating a truncated update makes progress
+    item_ids, truncated = _selected_ids(db, selection, allowed_user, is_admin, not_description=selection.description)
+    count, results = _bulk_write(
+        db, item_ids, allowed_user, is_admin,
+        write=lambda db, versions: item_crud.update_items(db, versions, selection.description),
+        is_written=lambda row, version: row is not None and row.version > version and row.description == selection.description
+    )
+    return item_schema.ItemBulkResponse(count=count, truncated=truncated, results=results)
+
+
+@router.get("/items/{item_id}", response_model=item_schema.ItemResponse, responses={**get_responses([304, 400, 401, 403, 404, 426, 500]), 200: SHAPED_ITEM_RESPONSE}, tags=["Items"], description="Get an Item. Honours If-None-Match header. fields=id,name only returns these fields, expand=user embeds the owner. Permission=User")
 @custom_declarators.version_check
 @custom_declarators.permission(consts.Consts.PERMISSION_USER)
-def get_item(item_id: int, request: Request, db: Session = Depends(get_db)):
+def get_item(item_id: int, request: Request, response: Response, db: Session = Depends(get_db), fields: Optional[str] = None, expand: Optional[str] = None):
+    requested_fields = fieldsets.parse(db, fields, item_schema.ItemResponse)
+    expand_user = consts.Consts.EXPAND_USER in fieldsets.parse_expand(db, expand, EXPANSIONS)
+
+    # Cheap validation query when the client already holds a version of the item
+    # (not for an embedded owner, which can change without the item)
+    if etags.has_if_none_match(request) and not expand_user:
+        db_item_version = item_crud.get_item_version(db, item_id=item_id)
+        if db_item_version:
+            etag = etags.compute(db_item_version, requested_fields)
+            if etags.is_not_modified(request, etag):
+                return etags.not_modified(etag)
+
     # Check item do not already exist
-    db_item = item_crud.get_item(db, item_id=item_id)
+    if expand_user:
+        db_item = item_crud.get_item_shaped(db, item_id, requested_fields, expand_user=True)
+    elif requested_fields:
+        # Requested columns, plus the ones of the ETag
+        db_item = item_crud.get_item_shaped(db, item_id, list(dict.fromkeys(requested_fields + etags.FIELDS)))
+    else:
+        db_item = item_crud.get_item(db, item_id=item_id)
     if not db_item:
         raise CustomException(
             db=db,
@@ -80,23 +227,49 @@ def get_item(item_id: int, request: Request, db: Session = Depends(get_db)):
             info=f"Item {item_id} not found"
         )
 
+    if expand_user:
+        return JSONResponse(fieldsets.dump(item_schema.ItemExpanded, _expanded_fields(requested_fields), db_item))
+    etag = etags.compute(db_item, requested_fields)
+    if requested_fields:
+        return JSONResponse(fieldsets.dump(item_schema.ItemResponse, requested_fields, db_item), headers={consts.Consts.HEADER_ETAG: etag})
+    response.headers[consts.Consts.HEADER_ETAG] = etag
     return db_item
 
 
-@router.get("/items", response_model=item_schema.ItemList, responses=get_responses([401, 403, 426, 500]), tags=["Items"], description="List Items. Permission=User")
+@router.get("/items", response_model=item_schema.ItemList, responses={**get_responses([400, 401, 403, 426, 429, 500]), 200: SHAPED_ITEM_LIST_RESPONSE}, tags=["Items"], description="List Items. fields=id,name only returns these fields of the items, expand=user embeds their owners. Permission=User")
 @custom_declarators.version_check
 @custom_declarators.permission(consts.Consts.PERMISSION_USER)
-def list_items(request: Request, db: Session = Depends(get_db), name: Optional[str] = None, description: Optional[str] = None, page: Optional[int] = 1, limit: Optional[int] = consts.Consts.MAX_RESULTS_PER_PAGE):
-    db_items = item_crud.list_items(db=db, name=name, description=description, page=page, limit=limit)
+def list_items(request: Request, db: Session = Depends(get_db), name: Optional[str] = None, description: Optional[str] = None, page: Optional[int] = 1, limit: Optional[int] = consts.Consts.MAX_RESULTS_PER_PAGE, fields: Optional[str] = None, expand: Optional[str] = None):
+    requested_fields = fieldsets.parse(db, fields, item_schema.ItemResponse)
+    expand_user = consts.Consts.EXPAND_USER in fieldsets.parse_expand(db, expand, EXPANSIONS)
+    db_items = item_crud.list_items(db=db, name=name, description=description, page=page, limit=limit, fields=requested_fields, expand_user=expand_user)
 
     if limit > consts.Consts.MAX_RESULTS_PER_PAGE:
         limit = consts.Consts.MAX_RESULTS_PER_PAGE
 
     total = item_crud.count_items(db=db, name=name, description=description)
+    if expand_user:
+        items = [fieldsets.dump(item_schema.ItemExpanded, _expanded_fields(requested_fields), db_item) for db_item in db_items]
+        return JSONResponse({"page": page, "limit": limit, "total": total, "items": items})
+    if requested_fields:
+        items = [fieldsets.dump(item_schema.ItemResponse, requested_fields, db_item) for db_item in db_items]
+        return JSONResponse({"page": page, "limit": limit, "total": total, "items": items})
     listing = item_schema.ItemList(page=page, limit=limit, total=total, items=db_items)
     return listing
 
 
+@router.delete("/items", response_model=item_schema.ItemBulkResponse, responses=get_responses([400, 401, 403, 422, 426, 429, 500]), tags=["Items"], description=f"Delete the listed Items, or the Items matching a filter (Items of the caller by default). At most {settings.env.BULK_MAX_ITEMS} Items per request, with a result per Item. Permission=Admin or Item owner")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_USER)
+def delete_items(selection: item_schema.ItemSelection, request: Request, db: Session = Depends(get_db)):
+    allowed_user = rights.is_authenticated(db, rights.retrieve_token_from_header(request))
+    is_admin = user_crud.is_admin(db, allowed_user.id)
+
+    item_ids, truncated = _selected_ids(db, selection, allowed_user, is_admin)
+    count, results = _bulk_write(db, item_ids, allowed_user, is_admin, write=item_crud.delete_items, is_written=lambda row, version: row is None)
+    return item_schema.ItemBulkResponse(count=count, truncated=truncated, results=results)
+
+
 @router.delete("/items/{item_id}", response_model=Status, responses=get_responses([401, 403, 404, 426, 500]), tags=["Items"], description="Delete an Item. Permission=Admin or Item owner")
 @custom_declarators.version_check
 @custom_declarators.permission(consts.Consts.PERMISSION_ADMIN_OR_ITEM_OWNER)
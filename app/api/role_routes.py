@@ -1,26 +1,28 @@
 from sqlalchemy.orm import Session
 from fastapi import Depends, APIRouter, Request
-from models import role_model
 from schemas import role_schema
 from crud import role_crud
-from db.database import engine, get_db
+from db.database import get_db
 from typing import List
-from utils import custom_declarators, consts
+from pydantic import TypeAdapter
+from utils import custom_declarators, consts, etags
+from utils.routing import InstrumentedRoute
 from utils.status import get_responses
 from exceptions.CustomException import CustomException
 import logging
 
-router = APIRouter()
-role_model.Base.metadata.create_all(bind=engine)
+router = APIRouter(route_class=InstrumentedRoute)
 logger = logging.getLogger()
 print = logger.info
+role_list_adapter = TypeAdapter(List[role_schema.Role])
 
 
-@router.get("/roles", response_model=List[role_schema.Role], responses=get_responses([426, 500]), tags=["Roles"], description="List Roles. Permission=None")
+@router.get("/roles", response_model=List[role_schema.Role], responses=get_responses([304, 426, 500]), tags=["Roles"], description="List Roles. Honours If-None-Match header. Permission=None")
 @custom_declarators.version_check
 def list_roles(request: Request, db: Session = Depends(get_db)):
     db_roles = role_crud.list_roles(db)
-    return db_roles
+    content = role_list_adapter.dump_json(role_list_adapter.validate_python(db_roles, from_attributes=True))
+    return etags.content_response(request, content)
 
 
 @router.get("/roles/{role_id}", response_model=role_schema.Role, tags=["Roles"], responses=get_responses([404, 426, 500]), description="Get a Role. Permission=None")
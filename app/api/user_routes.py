@@ -1,7 +1,8 @@
 from sqlalchemy.orm import Session
-from fastapi import Depends, APIRouter, Request
+from fastapi import Depends, APIRouter, Request, Response
+from fastapi.responses import JSONResponse
 from typing import Optional
-from models import user_model
+from utils.routing import InstrumentedRoute
 from utils.status import Status, get_responses
 from schemas import user_schema
 from crud import (
@@ -9,16 +10,19 @@ from crud import (
     role_crud,
     token_crud
 )
-from db.database import engine, get_db
-from utils import auth, consts, custom_declarators, rights
+from db.database import get_db
+from utils import auth, consts, custom_declarators, etags, fieldsets, rights
 from exceptions.CustomException import CustomException
 import logging
 
-router = APIRouter()
-user_model.Base.metadata.create_all(bind=engine)
+router = APIRouter(route_class=InstrumentedRoute)
 logger = logging.getLogger()
 print = logger.info
 
+# The fields= responses are built without the response_model: their shapes are documented here
+SHAPED_USER_RESPONSE = {"model": user_schema.UserShaped, "description": "The User. With fields=, only the requested fields"}
+SHAPED_USER_LIST_RESPONSE = {"model": user_schema.UserShapedList, "description": "The Users. With fields=, only the requested fields of each User"}
+
 
 @router.post("/users", response_model=user_schema.UserCreated, status_code=201, responses=get_responses([201, 400, 401, 403, 409, 422, 426, 500]), tags=["Users"], description=f"Create an activated User + Password generated randomly. Permission={consts.Consts.PERMISSION_ADMIN}")
 @custom_declarators.version_check
@@ -55,10 +59,24 @@ def create_user_as_admin(user: user_schema.UserCreate, request: Request, db: Ses
     return created_user
 
 
-@router.get("/users/{user_id}", response_model=user_schema.UserPublicInfo, tags=["Users"], responses=get_responses([404, 426, 500]), description="Get a User. Permission=None")
+@router.get("/users/{user_id}", response_model=user_schema.UserPublicInfo, tags=["Users"], responses={**get_responses([304, 400, 404, 426, 500]), 200: SHAPED_USER_RESPONSE}, description="Get a User. Honours If-None-Match header. fields=id,username only returns these fields. Permission=None")
 @custom_declarators.version_check
-def get_user(user_id: int, request: Request, db: Session = Depends(get_db)):
-    db_user = user_crud.get_user(db, user_id)
+def get_user(user_id: int, request: Request, response: Response, db: Session = Depends(get_db), fields: Optional[str] = None):
+    requested_fields = fieldsets.parse(db, fields, user_schema.UserPublicInfo)
+
+    # Cheap validation query when the client already holds a version of the user
+    if etags.has_if_none_match(request):
+        db_user_version = user_crud.get_user_version(db, user_id)
+        if db_user_version:
+            etag = etags.compute(db_user_version, requested_fields)
+            if etags.is_not_modified(request, etag):
+                return etags.not_modified(etag)
+
+    if requested_fields:
+        # Requested columns, plus the ones of the ETag
+        db_user = user_crud.get_user_fields(db, user_id, list(dict.fromkeys(requested_fields + etags.FIELDS)))
+    else:
+        db_user = user_crud.get_user(db, user_id)
     if not db_user:
         raise CustomException(
             db=db,
@@ -67,26 +85,34 @@ def get_user(user_id: int, request: Request, db: Session = Depends(get_db)):
             info=f"User {user_id} not found"
         )
 
+    etag = etags.compute(db_user, requested_fields)
+    if requested_fields:
+        return JSONResponse(fieldsets.dump(user_schema.UserPublicInfo, requested_fields, db_user), headers={consts.Consts.HEADER_ETAG: etag})
+    response.headers[consts.Consts.HEADER_ETAG] = etag
     return db_user
 
 
-@router.get("/users", response_model=user_schema.UserPublicInfoList, tags=["Users"], responses=get_responses([426, 500]), description="List Users. Permission=None")
+@router.get("/users", response_model=user_schema.UserPublicInfoList, tags=["Users"], responses={**get_responses([400, 426, 500]), 200: SHAPED_USER_LIST_RESPONSE}, description="List Users. fields=id,username only returns these fields of the users. Permission=None")
 @custom_declarators.version_check
-def list_users(request: Request, db: Session = Depends(get_db), username: Optional[str] = None, activated: Optional[bool] = True, page: Optional[int] = 1, limit: Optional[int] = consts.Consts.MAX_RESULTS_PER_PAGE):
-    db_users = user_crud.list_users(db=db, username=username, activated=activated, page=page, limit=limit)
+def list_users(request: Request, db: Session = Depends(get_db), username: Optional[str] = None, activated: Optional[bool] = True, page: Optional[int] = 1, limit: Optional[int] = consts.Consts.MAX_RESULTS_PER_PAGE, fields: Optional[str] = None):
+    requested_fields = fieldsets.parse(db, fields, user_schema.UserPublicInfo)
+    db_users = user_crud.list_users(db=db, username=username, activated=activated, page=page, limit=limit, fields=requested_fields)
 
     if limit > consts.Consts.MAX_RESULTS_PER_PAGE:
         limit = consts.Consts.MAX_RESULTS_PER_PAGE
 
     total = user_crud.count_users(db=db, username=username, activated=activated)
+    if requested_fields:
+        users = [fieldsets.dump(user_schema.UserPublicInfo, requested_fields, db_user) for db_user in db_users]
+        return JSONResponse({"page": page, "limit": limit, "total": total, "users": users})
     listing = user_schema.UserPublicInfoList(page=page, limit=limit, total=total, users=db_users)
     return listing
 
 
-@router.patch("/users/{user_id}", response_model=user_schema.UserPublicInfo, tags=["Users"], responses=get_responses([400, 401, 403, 404, 409, 422, 426, 500]), description="Update a User. Permission=Admin or User Owner")
+@router.patch("/users/{user_id}", response_model=user_schema.UserPublicInfo, tags=["Users"], responses=get_responses([400, 401, 403, 404, 409, 412, 422, 426, 500]), description="Update a User. Honours If-Match header. Permission=Admin or User Owner")
 @custom_declarators.version_check
 @custom_declarators.permission(permission_string=consts.Consts.PERMISSION_ADMIN_OR_USER_OWNER)
-def update_user(user: user_schema.UserUpdate, user_id: int, request: Request, db: Session = Depends(get_db)):
+def update_user(user: user_schema.UserUpdate, user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     allowed_user = rights.is_authenticated(db, rights.retrieve_token_from_header(request))
 
     db_user = user_crud.get_user(db=db, user_id=user_id, activated=None)
@@ -98,6 +124,10 @@ def update_user(user: user_schema.UserUpdate, user_id: int, request: Request, db
             info=f"User {user_id} not found"
         )
 
+    # Prevent lost updates: checked here, then enforced by the UPDATE in case of a concurrent write
+    etags.check_if_match(request, db, etags.compute(db_user))
+    version = db_user.version if etags.has_if_match(request) else None
+
     db_role_admin = role_crud.get_role_by_name(db, consts.Consts.ROLE_ADMIN)
     if not db_role_admin:
         raise CustomException(
@@ -170,8 +200,10 @@ def update_user(user: user_schema.UserUpdate, user_id: int, request: Request, db
                     info=f"User with same username {user.username} already exists"
                 )
 
-    db_user = user_crud.update_user(db, user_id, user)
+    db_user = user_crud.update_user(db, user_id, user, version)
     logger.info(user.__dict__)
+    if not db_user and version is not None:
+        raise etags.precondition_failed(db, f"User {user_id} modified since version {version}")
     if not db_user:
         raise CustomException(
             db=db,
@@ -180,6 +212,7 @@ def update_user(user: user_schema.UserUpdate, user_id: int, request: Request, db
             info=f"Error when trying to update User {user_id}"
         )
 
+    response.headers[consts.Consts.HEADER_ETAG] = etags.compute(db_user)
     return db_user
 
 
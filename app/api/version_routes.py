@@ -1,20 +1,39 @@
 from sqlalchemy.orm import Session
 from fastapi import Depends, APIRouter, Request
-from models import role_model
 from schemas import version_schema
 from crud import version_crud
-from db.database import engine, get_db
+from db.database import get_db
 from typing import List
+from pydantic import TypeAdapter
+from utils import custom_declarators, consts, etags
+from utils.routing import InstrumentedRoute
 from utils.status import get_responses
+from exceptions.CustomException import CustomException
 import logging
 
-router = APIRouter()
-role_model.Base.metadata.create_all(bind=engine)
+router = APIRouter(route_class=InstrumentedRoute)
 logger = logging.getLogger()
 print = logger.info
+version_list_adapter = TypeAdapter(List[version_schema.Version])
 
 
-@router.get("/versions", response_model=List[version_schema.Version], responses=get_responses([426, 500]), tags=["Versions"], description="List Versions. Permission=None")
+@router.get("/versions", response_model=List[version_schema.Version], responses=get_responses([304, 426, 500]), tags=["Versions"], description="List Versions. Honours If-None-Match header. Permission=None")
 def list_versions(request: Request, db: Session = Depends(get_db)):
     db_versions = version_crud.list_versions(db)
-    return db_versions
+    content = version_list_adapter.dump_json(version_list_adapter.validate_python(db_versions, from_attributes=True))
+    return etags.content_response(request, content)
+
+
+@router.patch("/versions/{version}", response_model=version_schema.Version, responses=get_responses([401, 403, 404, 422, 426, 500]), tags=["Versions"], description=f"Support or retire a Version. Applied at once by the worker answering, by the other workers at once with CACHE_BACKEND=redis and within REGISTRY_TTL seconds otherwise. Permission={consts.Consts.PERMISSION_ADMIN}")
+@custom_declarators.version_check
+@custom_declarators.permission(consts.Consts.PERMISSION_ADMIN)
+def update_version(version: str, version_update: version_schema.VersionUpdate, request: Request, db: Session = Depends(get_db)):
+    db_version = version_crud.update_version(db, version, version_update.supported)
+    if db_version is None:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_404,
+            detail=consts.Consts.VERSION_NOT_FOUND,
+            info=f"Version {version} not found"
+        )
+    return db_version
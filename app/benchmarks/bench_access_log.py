@@ -0,0 +1,119 @@
+"""
+Per-request overhead of the access log middleware.
+
+Compares the former @app.middleware("http") implementation (BaseHTTPMiddleware) with
+utils.access_log.AccessLogMiddleware on a minimal Starlette app, calling the ASGI app directly
+so that no network or HTTP client cost is measured.
+
+Usage (from the app folder): python -m benchmarks.bench_access_log [--requests 20000]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import time
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from utils.access_log import AccessLogMiddleware
+
+logger = logging.getLogger()
+
+
+async def legacy_log_requests(request, call_next):
+    # Former main.log_requests
+    start_time = time.time()
+    response = await call_next(request)
+    if request.url.path != '/':
+        process_time_seconds = (time.time() - start_time)
+        process_time_milli = process_time_seconds * 1000
+        request_time_milli = round(process_time_milli, 2)
+        request_time_sec = round(process_time_seconds, 2)
+        user_agent = request.headers.get("user-agent", "-")
+        response_size = response.headers.get("content-length", "-")
+        version = response.headers.get("x-version", "-")
+        accesslog = f"[zz999] {response.status_code} {request_time_sec} {request_time_milli} {response_size} {request.method} {request.url.path}?{str(request.query_params)} {version} {user_agent}"
+        logger.info(accesslog)
+    return response
+
+
+async def stream():
+    for _ in range(10):
+        yield b"x" * 1024
+
+
+async def items(request):
+    return JSONResponse({"page": 1, "limit": 20, "total": 0, "items": []})
+
+
+async def streamed(request):
+    return StreamingResponse(stream(), media_type="application/octet-stream")
+
+
+def build_app(middleware: str):
+    app = Starlette(routes=[Route("/items", items), Route("/stream", streamed)])
+    if middleware == "legacy":
+        app.add_middleware(BaseHTTPMiddleware, dispatch=legacy_log_requests)
+    elif middleware == "asgi":
+        app.add_middleware(AccessLogMiddleware)
+    return app
+
+
+async def call(app, path: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"page=1",
+        "headers": [(b"host", b"bench"), (b"user-agent", b"bench"), (b"x-version", b"1.0")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive():
+        # Like a server: the request body once, then block until the client disconnects
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_complete.set()
+
+    await app(scope, receive, send)
+
+
+async def run(app, path: str, requests: int):
+    for _ in range(200):
+        await call(app, path)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    # Format records as in production but write them to memory
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+
+    for path in ("/items", "/stream"):
+        results = {name: asyncio.run(run(build_app(name), path, args.requests)) for name in ("none", "legacy", "asgi")}
+        print(f"{path}")
+        for name in ("legacy", "asgi"):
+            overhead = (results[name] - results["none"]) * 1e6
+            print(f"  {name:<7} {results[name] * 1e6:8.1f} us/request  overhead {overhead:7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
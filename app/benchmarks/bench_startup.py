@@ -0,0 +1,48 @@
+"""
+Cold start time of the app: import of main.py, then the lifespan startup (schema check, pool warm-up,
+OpenAPI document, crons, metrics server), each measured in a fresh interpreter as during a scale-out.
+
+The database configured in the environment (.env) is used. Compare DB_CREATE_SCHEMA=true and false to see
+the cost of the schema check.
+
+Usage (from the app folder): python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def start_app():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+started = asyncio.run(start_app())
+print(json.dumps({"import": imported - start, "startup": started - imported}))
+"""
+
+
+def run_once():
+    output = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    for phase in ("import", "startup"):
+        durations = [result[phase] * 1000 for result in results]
+        print(f"{phase:<8} median {statistics.median(durations):8.1f} ms  min {min(durations):8.1f} ms  max {max(durations):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
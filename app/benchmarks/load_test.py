@@ -0,0 +1,392 @@
+"""
+Load test of the API: seeds a SQLite stand-in of the database, starts the app on it with server.py and drives
+a mixed workload of authenticated users (login, refresh, /auth/me, item CRUD, filtered item listing, user listing).
+
+Reports, per route, the latency percentiles (p50, p95, p99) and the SQL statements per request (read from the
+Server-Timing header, responses served by the response cache carry none). Results are saved as JSON so that
+two runs can be compared:
+
+    python -m benchmarks.load_test --output before.json
+    ... change ...
+    python -m benchmarks.load_test --output after.json --compare before.json
+    python -m benchmarks.load_test --report after.json --compare before.json
+
+Runs are reproducible: same seed data, same sequence of requests for a given --seed and --concurrency.
+The load generator shares the CPUs of the app: keep --workers below the number of CPUs.
+
+To load test a running app (e.g. on MySQL), seed its database with --seed-only (the DATABASE_URL or DB_*
+variables of the environment are used) then target it with --url.
+
+Usage (from the app folder): python -m benchmarks.load_test [--concurrency 20] [--duration 30] [--workers 1]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+import statistics
+import tempfile
+from datetime import datetime
+
+VERSION = "1.0"
+PASSWORD = "loadtest"
+USERNAME = "loadtest{}"
+DESCRIPTION_WORDS = ["red", "green", "blue", "small", "large", "metal", "wooden", "plastic", "vintage", "new"]
+
+# Share of each action in the workload
+WORKLOAD = {
+    "POST /auth/token": 2,
+    "POST /auth/refresh": 3,
+    "GET /auth/me": 15,
+    "GET /items": 20,
+    "GET /items/{item_id}": 20,
+    "POST /items": 6,
+    "PATCH /items/{item_id}": 5,
+    "DELETE /items/{item_id}": 4,
+    "GET /users": 10,
+}
+
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def configure_environment():
+    # Only the database settings are read when seeding, the other required variables may be missing
+    for name, placeholder in (("APP_PORT", "0"), ("DB_HOST", ""), ("DB_PORT", "0"), ("DB_NAME", ""), ("DB_USER", ""), ("DB_PASSWORD", "")):
+        os.environ.setdefault(name, placeholder)
+
+
+def seed(engine, users: int, items: int):
+    """
+    Seeds a database: roles, supported version, users sharing the same password and items with searchable descriptions.
+    """
+    from db import database
+    from models import item_model, role_model, token_model, user_model, version_model  # noqa: F401
+    from utils import auth, consts
+
+    database.Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    now = datetime.utcnow()
+    # Hashed once: bcrypt is paid by every login, not by every seeded user
+    password = auth.hash_password(PASSWORD)
+    rng = random.Random(0)
+    db = database.SessionLocal(bind=engine)
+    try:
+        for role_id, name in ((1, consts.Consts.ROLE_ADMIN), (2, consts.Consts.ROLE_USER)):
+            db.merge(role_model.Role(id=role_id, name=name))
+        if not db.query(version_model.Version).filter(version_model.Version.version == VERSION).first():
+            db.add(version_model.Version(version=VERSION, supported=True))
+        db.commit()
+
+        user_ids = []
+        for index in range(users):
+            username = USERNAME.format(index)
+            db_user = db.query(user_model.User).filter(user_model.User.username == username).first()
+            if db_user is None:
+                db_user = user_model.User(username=username, activated=True, role_id=2, created_at=now)
+                db.add(db_user)
+            db_user.salt = password.salt
+            db_user.hashed_password = password.hashed_password
+            db.flush()
+            user_ids.append(db_user.id)
+
+        existing = db.query(item_model.Item).filter(item_model.Item.name.like("seed-%")).count()
+        for index in range(existing, items):
+            db.add(item_model.Item(
+                name=f"seed-{index}",
+                description=" ".join(rng.sample(DESCRIPTION_WORDS, 3)),
+                created_at=now,
+                user_id=rng.choice(user_ids)
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url: str, workers: int, port: int):
+    env = {
+        **os.environ,
+        "APP_PORT": str(port),
+        "DATABASE_URL": database_url,
+        "DB_CREATE_SCHEMA": "false",
+        "SERVER_TIMING_ENABLED": "true",
+        "WORKERS": str(workers),
+        "WORKER_MAX_REQUESTS": "0",
+        # Every virtual user comes from the same address
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        "PROMETHEUS_MULTIPROC_DIR": tempfile.mkdtemp(prefix="loadtest-metrics-"),
+    }
+    return subprocess.Popen([sys.executable, "server.py"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(url: str, process, timeout: float = 60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/users", headers={"x-version": VERSION}).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The app did not answer on {url} within {timeout} s")
+
+
+class VirtualUser:
+    """
+    One authenticated user sending requests one after the other, as a client of the API would.
+    """
+
+    def __init__(self, client, index: int, users: int, items: int, rng: random.Random, results: list):
+        self.client = client
+        self.index = index
+        self.username = USERNAME.format(index % users)
+        self.items = items
+        self.rng = rng
+        self.results = results
+        self.record = False
+        self.access_token = None
+        self.refresh_token = None
+        self.own_items = []
+        self.created = 0
+
+    def headers(self):
+        return {"x-version": VERSION, "Authorization": f"Bearer {self.access_token}"}
+
+    async def request(self, route: str, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, path, **kwargs)
+        duration = time.perf_counter() - start
+        if self.record:
+            match = SERVER_TIMING_QUERIES.search(response.headers.get("server-timing", ""))
+            self.results.append((route, response.status_code, duration, int(match.group(1)) if match else None))
+        return response
+
+    async def login(self):
+        response = await self.request("POST /auth/token", "POST", "/auth/token", headers={"x-version": VERSION}, json={"username": self.username, "password": PASSWORD})
+        response.raise_for_status()
+        self.access_token = response.json()["access_token"]
+        self.refresh_token = response.json()["refresh_token"]
+
+    async def refresh(self):
+        response = await self.request("POST /auth/refresh", "POST", "/auth/refresh", headers={"x-version": VERSION}, json={"refresh_token": self.refresh_token})
+        if response.status_code == 200:
+            self.access_token = response.json()["access_token"]
+            self.refresh_token = response.json()["refresh_token"]
+
+    async def create_item(self):
+        self.created += 1
+        item = {"name": f"lt-{self.index}-{self.created}", "description": " ".join(self.rng.sample(DESCRIPTION_WORDS, 3))}
+        response = await self.request("POST /items", "POST", "/items", headers=self.headers(), json=item)
+        if response.status_code == 201:
+            self.own_items.append(response.json()["id"])
+
+    async def run_action(self, action: str):
+        if action == "POST /auth/token":
+            await self.login()
+        elif action == "POST /auth/refresh":
+            await self.refresh()
+        elif action == "GET /auth/me":
+            await self.request(action, "GET", "/auth/me", headers=self.headers())
+        elif action == "GET /items":
+            params = {"page": self.rng.randint(1, 3)}
+            params["description" if self.rng.random() < 0.7 else "name"] = self.rng.choice(DESCRIPTION_WORDS) if self.rng.random() < 0.7 else f"seed-{self.rng.randint(0, 99)}"
+            await self.request(action, "GET", "/items", headers=self.headers(), params=params)
+        elif action == "GET /items/{item_id}":
+            await self.request(action, "GET", f"/items/{self.rng.randint(1, self.items)}", headers=self.headers())
+        elif action == "POST /items" or not self.own_items:
+            # Updates and deletions only target items created by this user
+            await self.create_item()
+        elif action == "PATCH /items/{item_id}":
+            self.created += 1
+            item_id = self.rng.choice(self.own_items)
+            await self.request(action, "PATCH", f"/items/{item_id}", headers=self.headers(), json={"name": f"lt-{self.index}-{self.created}"})
+        elif action == "DELETE /items/{item_id}":
+            item_id = self.own_items.pop(self.rng.randrange(len(self.own_items)))
+            await self.request(action, "DELETE", f"/items/{item_id}", headers=self.headers())
+        elif action == "GET /users":
+            params = {"page": self.rng.randint(1, 3)}
+            if self.rng.random() < 0.3:
+                params["username"] = f"loadtest{self.rng.randint(0, 9)}"
+            await self.request(action, "GET", "/users", headers={"x-version": VERSION}, params=params)
+
+    async def run(self, warmup_end: float, end: float):
+        actions, weights = list(WORKLOAD), list(WORKLOAD.values())
+        await self.login()
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                return
+            self.record = now >= warmup_end
+            await self.run_action(self.rng.choices(actions, weights)[0])
+
+
+async def run_workload(url: str, concurrency: int, duration: float, warmup: float, users: int, items: int, seed_value: int):
+    import httpx
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.monotonic()
+        virtual_users = [VirtualUser(client, index, users, items, random.Random(seed_value * 100003 + index), results) for index in range(concurrency)]
+        await asyncio.gather(*(virtual_user.run(start + warmup, start + warmup + duration) for virtual_user in virtual_users))
+    return results
+
+
+def percentile(sorted_values: list, percent: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * percent / 100), len(sorted_values) - 1)]
+
+
+def summarize(results: list, duration: float):
+    routes = {}
+    for route in sorted({result[0] for result in results}):
+        route_results = [result for result in results if result[0] == route]
+        durations = sorted(result[2] * 1000 for result in route_results)
+        queries = sorted(result[3] for result in route_results if result[3] is not None)
+        statuses = {}
+        for result in route_results:
+            statuses[str(result[1])] = statuses.get(str(result[1]), 0) + 1
+        routes[route] = {
+            "requests": len(route_results),
+            "rps": round(len(route_results) / duration, 2),
+            "errors": sum(1 for result in route_results if result[1] >= 400),
+            "statuses": statuses,
+            "mean_ms": round(statistics.mean(durations), 2),
+            "p50_ms": round(percentile(durations, 50), 2),
+            "p95_ms": round(percentile(durations, 95), 2),
+            "p99_ms": round(percentile(durations, 99), 2),
+            "max_ms": round(durations[-1], 2),
+            "queries_mean": round(statistics.mean(queries), 2) if queries else None,
+            "queries_max": queries[-1] if queries else None,
+        }
+    durations = sorted(result[2] * 1000 for result in results)
+    total = {
+        "requests": len(results),
+        "rps": round(len(results) / duration, 2),
+        "errors": sum(1 for result in results if result[1] >= 400),
+        "p50_ms": round(percentile(durations, 50), 2) if durations else None,
+        "p95_ms": round(percentile(durations, 95), 2) if durations else None,
+        "p99_ms": round(percentile(durations, 99), 2) if durations else None,
+    }
+    return routes, total
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    print(f"{report['started_at']}  revision {report['revision']}  concurrency {report['config']['concurrency']}  workers {report['config']['workers']}  {report['config']['duration']} s")
+    print(f"{'route':<26}{'requests':>9}{'rps':>9}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for route, stats in list(report["routes"].items()) + [("total", {**report["total"], "queries_mean": None})]:
+        queries = "-" if stats["queries_mean"] is None else stats["queries_mean"]
+        print(f"{route:<26}{stats['requests']:>9}{stats['rps']:>9}{stats['errors']:>7}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{queries:>9}")
+
+
+def delta(new, old):
+    if new is None or old is None or not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def print_comparison(report: dict, baseline: dict):
+    print(f"\nCompared with {baseline['started_at']} (revision {baseline['revision']}), negative latencies are better")
+    print(f"{'route':<26}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>10}")
+    routes = list(report["routes"].items()) + [("total", report["total"])]
+    baseline_routes = {**baseline["routes"], "total": baseline["total"]}
+    for route, stats in routes:
+        old = baseline_routes.get(route)
+        if old is None:
+            continue
+        print(f"{route:<26}{delta(stats['rps'], old['rps']):>10}{delta(stats['p50_ms'], old['p50_ms']):>10}{delta(stats['p95_ms'], old['p95_ms']):>10}"
+              f"{delta(stats['p99_ms'], old['p99_ms']):>10}{delta(stats.get('queries_mean'), old.get('queries_mean')):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users sending requests at the same time")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured, after the warm-up")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before the measures start")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the app")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random sequence of requests")
+    parser.add_argument("--database", default=os.path.join(tempfile.gettempdir(), "fastapi-loadtest.db"), help="SQLite file, recreated by each run")
+    parser.add_argument("--url", help="load test an app already running (seeded with --seed-only) instead of starting one")
+    parser.add_argument("--seed-only", action="store_true", help="seed the database of the environment and exit")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    parser.add_argument("--report", help="print the JSON results of a previous run instead of running")
+    args = parser.parse_args()
+
+    if args.report:
+        with open(args.report) as f:
+            report = json.load(f)
+    else:
+        if not args.url or args.seed_only:
+            if not args.seed_only:
+                if os.path.exists(args.database):
+                    os.remove(args.database)
+                os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.database)}"
+            configure_environment()
+            from db import database
+            seed(database.engine, args.users, args.items)
+            if args.seed_only:
+                return
+
+        process = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process = start_server(os.environ["DATABASE_URL"], args.workers, port)
+        try:
+            wait_until_ready(url, process)
+            started_at = datetime.utcnow().isoformat(timespec="seconds")
+            results = asyncio.run(run_workload(url, args.concurrency, args.duration, args.warmup, args.users, args.items, args.seed))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+        routes, total = summarize(results, args.duration)
+        report = {
+            "started_at": started_at,
+            "revision": git_revision(),
+            "config": {key: getattr(args, key) for key in ("concurrency", "duration", "warmup", "workers", "users", "items", "seed", "url")},
+            "workload": WORKLOAD,
+            "routes": routes,
+            "total": total,
+        }
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
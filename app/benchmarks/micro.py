@@ -0,0 +1,493 @@
+"""
+Micro-benchmarks of the functions run by every request: tokens and passwords, authentication, the version_check
+and permission decorators, list serialization (20 and 1000 rows) and the crud functions, on SQLite or MySQL.
+
+Timings are divided by the timing of a pure Python calibration loop measured in the same run, so that the
+checked-in baseline (benchmarks/baseline.json) stays meaningful on another machine. A benchmark more than
+--tolerance slower than its baseline is reported as a regression (exit code 1, failing test with RUN_BENCHMARKS=1).
+
+SQLite runs on a seeded temporary file. MySQL uses the database of the environment (DB_* variables), which is
+seeded with the load test users and items (benchmarks/load_test.py).
+
+Usage (from the app folder):
+    python -m benchmarks.micro [--backend sqlite|mysql] [--filter crud.item] [--tolerance 0.5]
+    python -m benchmarks.micro --update-baseline    (after an intended change, commit benchmarks/baseline.json)
+    RUN_BENCHMARKS=1 python -m pytest test/test_benchmarks.py
+"""
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import tempfile
+from benchmarks import load_test
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Timings of a shared machine vary by about 25%: slowdowns above 50% are regressions
+DEFAULT_TOLERANCE = 0.5
+REPEAT = 5
+RETRIES = 2
+# Measures of each benchmark when the baseline is updated, the median one is saved
+BASELINE_RUNS = 3
+SEED_USERS = 20
+SEED_ITEMS = 1000
+
+BENCHMARKS = {}
+
+
+class Benchmark:
+
+    def __init__(self, name: str, factory, number: int, new_request: bool):
+        # factory(context, calls) prepares the data and returns the function to time, called `calls` times
+        self.name = name
+        self.factory = factory
+        self.number = number
+        # Each call runs as in a new request: without the rows memoized by the previous calls
+        self.new_request = new_request
+
+
+def benchmark(name: str, number: int = 1000, new_request: bool = False):
+    def decorator(factory):
+        BENCHMARKS[name] = Benchmark(name, factory, number, new_request)
+        return factory
+    return decorator
+
+
+class Context:
+    """
+    Seeded database, session and credentials shared by the benchmarks of a run.
+    """
+
+    def __init__(self, backend: str):
+        load_test.configure_environment()
+        from sqlalchemy import create_engine
+        from db import database
+        from crud import token_crud, user_crud
+
+        self.backend = backend
+        if backend == "sqlite":
+            self.path = os.path.join(tempfile.mkdtemp(prefix="benchmarks-"), "benchmarks.db")
+            self.engine = create_engine(f"sqlite:///{self.path}", connect_args={"check_same_thread": False})
+        else:
+            self.path = None
+            self.engine = database.engine
+        load_test.seed(self.engine, SEED_USERS, SEED_ITEMS)
+        self.db = database.SessionLocal(bind=self.engine)
+
+        self.username = load_test.USERNAME.format(0)
+        self.user_id = user_crud.get_user_by_username(self.db, self.username).id
+        # Tokens are created for another user by the token benchmarks, past MAX_TOKENS_PER_USER its oldest ones are deleted
+        self.other_user_id = user_crud.get_user_by_username(self.db, load_test.USERNAME.format(1)).id
+        db_token = token_crud.create_access_token(self.db, self.user_id)
+        self.access_token = db_token.access_token
+        self.item_id = self.items[0].id
+        self.item_name = self.items[0].name
+
+    @property
+    def items(self):
+        from crud import item_crud
+        return item_crud.list_items(self.db, name="seed-", limit=SEED_ITEMS, page=1)
+
+    def request(self):
+        from starlette.requests import Request
+        from utils import consts
+        headers = {consts.Consts.HEADER_AUTH: f"Bearer {self.access_token}", consts.Consts.HEADER_VERSION: load_test.VERSION}
+        return Request({"type": "http", "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()]})
+
+    def new_request(self):
+        from repository import entity_loader
+        self.db.info.pop(entity_loader.SESSION_INFO_KEY, None)
+
+    def close(self):
+        self.db.close()
+        if self.path:
+            self.engine.dispose()
+            os.remove(self.path)
+
+
+def calibration():
+    total = 0
+    for i in range(1000):
+        total += i * i
+    return total
+
+
+def timed(func, number: int):
+    # As timeit: collections depend on the objects left by the previous benchmarks, not on the function measured
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return (time.perf_counter() - start) / number
+    finally:
+        gc.enable()
+
+
+def measure_relative(bench: Benchmark, context: Context):
+    """
+    Best of REPEAT measures, divided by the best of the calibrations measured right after each of them:
+    the speed of a shared machine varies within seconds.
+    """
+    func = call = bench.factory(context, bench.number * REPEAT)
+    if bench.new_request:
+        def func():
+            context.new_request()
+            call()
+    durations, calibrations = [], []
+    for _ in range(REPEAT):
+        durations.append(timed(func, bench.number))
+        calibrations.append(timed(calibration, 200))
+    return {"us": round(min(durations) * 1e6, 3), "relative": round(min(durations) / min(calibrations), 4)}
+
+
+def run(bench: Benchmark, context: Context, runs: int = 1, baseline: dict = None, tolerance: float = DEFAULT_TOLERANCE):
+    """
+    Median of `runs` measures. A result slower than the baseline is measured again up to RETRIES times
+    and the best measure is kept: a single disturbed measure must not fail the build.
+    """
+    results = sorted((measure_relative(bench, context) for _ in range(runs)), key=lambda result: result["relative"])
+    result = results[len(results) // 2]
+    for _ in range(RETRIES):
+        if not is_regression(result, baseline, tolerance):
+            break
+        result = min(result, measure_relative(bench, context), key=lambda result: result["relative"])
+    return result
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f)
+
+
+def is_regression(result: dict, baseline: dict, tolerance: float):
+    return baseline is not None and result["relative"] > baseline["relative"] * (1 + tolerance)
+
+
+# Tokens and passwords
+
+@benchmark("auth.create_token", number=2000)
+def bench_create_token(context, calls):
+    from utils import auth
+    return auth.create_token
+
+
+@benchmark("auth.hash_password", number=2)
+def bench_hash_password(context, calls):
+    from utils import auth
+    return lambda: auth.hash_password(load_test.PASSWORD)
+
+
+@benchmark("auth.does_password_match", number=2)
+def bench_does_password_match(context, calls):
+    from utils import auth
+    password = auth.hash_password(load_test.PASSWORD)
+    return lambda: auth.does_password_match(password.salt, password.hashed_password, load_test.PASSWORD)
+
+
+# Authentication and decorators
+
+@benchmark("rights.retrieve_token_from_header", number=100000)
+def bench_retrieve_token_from_header(context, calls):
+    from utils import rights
+    request = context.request()
+    return lambda: rights.retrieve_token_from_header(request)
+
+
+@benchmark("rights.is_authenticated", number=200, new_request=True)
+def bench_is_authenticated(context, calls):
+    from utils import rights
+    request = context.request()
+    return lambda: rights.is_authenticated(context.db, rights.retrieve_token_from_header(request))
+
+
+@benchmark("custom_declarators.version_check", number=2000)
+def bench_version_check(context, calls):
+    from utils import custom_declarators
+    endpoint = custom_declarators.version_check(lambda request, db: None)
+    request = context.request()
+    return lambda: endpoint(request=request, db=context.db)
+
+
+@benchmark("custom_declarators.permission.user", number=200, new_request=True)
+def bench_permission_user(context, calls):
+    from utils import consts, custom_declarators
+    endpoint = custom_declarators.permission(consts.Consts.PERMISSION_USER)(lambda request, db: None)
+    request = context.request()
+    return lambda: endpoint(request=request, db=context.db)
+
+
+@benchmark("custom_declarators.permission.item_owner", number=200, new_request=True)
+def bench_permission_item_owner(context, calls):
+    from utils import consts, custom_declarators
+    endpoint = custom_declarators.permission(consts.Consts.PERMISSION_ADMIN_OR_ITEM_OWNER)(lambda request, db, item_id: None)
+    request = context.request()
+    item_id = next(item.id for item in context.items if item.user_id == context.user_id)
+    return lambda: endpoint(request=request, db=context.db, item_id=item_id)
+
+
+# Serialization of the list responses, as done by FastAPI for a response_model
+
+def serializer(schema):
+    from pydantic import TypeAdapter
+    from fastapi.responses import JSONResponse
+    adapter = TypeAdapter(schema)
+    response = JSONResponse(None)
+    return lambda content: response.render(adapter.dump_python(adapter.validate_python(content, from_attributes=True), mode="json"))
+
+
+def bench_item_list(rows: int):
+    def factory(context, calls):
+        from schemas import item_schema
+        serialize = serializer(item_schema.ItemList)
+        db_items = context.items[:rows]
+        return lambda: serialize(item_schema.ItemList(page=1, limit=rows, total=SEED_ITEMS, items=db_items))
+    return factory
+
+
+def bench_user_list(rows: int):
+    def factory(context, calls):
+        from models import user_model
+        from schemas import user_schema
+        serialize = serializer(user_schema.UserPublicInfoList)
+        db_user = context.db.query(user_model.User).first()
+        # Copies of a seeded user: only SEED_USERS users exist
+        db_users = [user_model.User(id=index, username=db_user.username, role_id=db_user.role_id, activated=True, created_at=db_user.created_at) for index in range(rows)]
+        return lambda: serialize(user_schema.UserPublicInfoList(page=1, limit=rows, total=rows, users=db_users))
+    return factory
+
+
+benchmark("serialization.ItemList.20", number=1000)(bench_item_list(20))
+benchmark("serialization.ItemList.1000", number=20)(bench_item_list(1000))
+benchmark("serialization.UserPublicInfoList.20", number=1000)(bench_user_list(20))
+benchmark("serialization.UserPublicInfoList.1000", number=20)(bench_user_list(1000))
+
+
+# crud
+
+@benchmark("crud.item.get_item", number=200, new_request=True)
+def bench_get_item(context, calls):
+    from crud import item_crud
+    return lambda: item_crud.get_item(context.db, context.item_id)
+
+
+@benchmark("crud.item.get_item_version", number=200, new_request=True)
+def bench_get_item_version(context, calls):
+    from crud import item_crud
+    return lambda: item_crud.get_item_version(context.db, context.item_id)
+
+
+@benchmark("crud.item.get_item_by_name", number=200, new_request=True)
+def bench_get_item_by_name(context, calls):
+    from crud import item_crud
+    return lambda: item_crud.get_item_by_name(context.db, context.item_name)
+
+
+@benchmark("crud.item.list_items", number=100, new_request=True)
+def bench_list_items(context, calls):
+    from crud import item_crud
+    return lambda: item_crud.list_items(context.db, description=load_test.DESCRIPTION_WORDS[0], limit=20, page=2)
+
+
+@benchmark("crud.item.count_items", number=100, new_request=True)
+def bench_count_items(context, calls):
+    from crud import item_crud
+    return lambda: item_crud.count_items(context.db, description=load_test.DESCRIPTION_WORDS[0])
+
+
+@benchmark("crud.item.create_item", number=50, new_request=True)
+def bench_create_item(context, calls):
+    from crud import item_crud
+    from schemas import item_schema
+    counter = itertools.count()
+    user_id = context.user_id
+    return lambda: item_crud.create_item(context.db, item_schema.ItemCreate(name=f"bench-{time.time_ns()}-{next(counter)}"), user_id)
+
+
+@benchmark("crud.item.update_item", number=50, new_request=True)
+def bench_update_item(context, calls):
+    from crud import item_crud
+    from schemas import item_schema
+    item = item_schema.ItemUpdate(description="benchmark")
+    return lambda: item_crud.update_item(context.db, context.item_id, item)
+
+
+@benchmark("crud.item.delete_item", number=50, new_request=True)
+def bench_delete_item(context, calls):
+    from crud import item_crud
+    from schemas import item_schema
+    user_id = context.user_id
+    item_ids = [item_crud.create_item(context.db, item_schema.ItemCreate(name=f"bench-delete-{time.time_ns()}-{index}"), user_id).id for index in range(calls)]
+    return lambda: item_crud.delete_item(context.db, item_ids.pop())
+
+
+@benchmark("crud.user.get_user", number=200, new_request=True)
+def bench_get_user(context, calls):
+    from crud import user_crud
+    user_id = context.user_id
+    return lambda: user_crud.get_user(context.db, user_id)
+
+
+@benchmark("crud.user.get_user_version", number=200, new_request=True)
+def bench_get_user_version(context, calls):
+    from crud import user_crud
+    user_id = context.user_id
+    return lambda: user_crud.get_user_version(context.db, user_id)
+
+
+@benchmark("crud.user.get_user_by_username", number=200, new_request=True)
+def bench_get_user_by_username(context, calls):
+    from crud import user_crud
+    return lambda: user_crud.get_user_by_username(context.db, context.username)
+
+
+@benchmark("crud.user.list_users", number=100, new_request=True)
+def bench_list_users(context, calls):
+    from crud import user_crud
+    return lambda: user_crud.list_users(context.db, limit=20, page=1)
+
+
+@benchmark("crud.user.count_users", number=100, new_request=True)
+def bench_count_users(context, calls):
+    from crud import user_crud
+    return lambda: user_crud.count_users(context.db, username="loadtest1")
+
+
+@benchmark("crud.user.update_user", number=50, new_request=True)
+def bench_update_user(context, calls):
+    from crud import user_crud
+    from schemas import user_schema
+    user_id = context.user_id
+    user = user_schema.UserUpdate(activated=True)
+    return lambda: user_crud.update_user(context.db, user_id, user)
+
+
+@benchmark("crud.user.check_authentication", number=2, new_request=True)
+def bench_check_authentication(context, calls):
+    from crud import user_crud
+    return lambda: user_crud.check_authentication(context.db, context.username, load_test.PASSWORD)
+
+
+@benchmark("crud.user.is_admin", number=200, new_request=True)
+def bench_is_admin(context, calls):
+    from crud import user_crud
+    user_id = context.user_id
+    return lambda: user_crud.is_admin(context.db, user_id)
+
+
+@benchmark("crud.role.get_role", number=200, new_request=True)
+def bench_get_role(context, calls):
+    from crud import role_crud
+    return lambda: role_crud.get_role(context.db, 1)
+
+
+@benchmark("crud.role.get_role_by_name", number=200, new_request=True)
+def bench_get_role_by_name(context, calls):
+    from crud import role_crud
+    from utils import consts
+    return lambda: role_crud.get_role_by_name(context.db, consts.Consts.ROLE_USER)
+
+
+@benchmark("crud.role.list_roles", number=200, new_request=True)
+def bench_list_roles(context, calls):
+    from crud import role_crud
+    return lambda: role_crud.list_roles(context.db)
+
+
+@benchmark("crud.version.get_version", number=200, new_request=True)
+def bench_get_version(context, calls):
+    from crud import version_crud
+    return lambda: version_crud.get_version(context.db, load_test.VERSION)
+
+
+@benchmark("crud.version.list_versions", number=200, new_request=True)
+def bench_list_versions(context, calls):
+    from crud import version_crud
+    return lambda: version_crud.list_versions(context.db)
+
+
+@benchmark("crud.token.get_token_by_access_token", number=200, new_request=True)
+def bench_get_token_by_access_token(context, calls):
+    from crud import token_crud
+    return lambda: token_crud.get_token_by_access_token(context.db, context.access_token)
+
+
+@benchmark("crud.token.get_number_tokens", number=200, new_request=True)
+def bench_get_number_tokens(context, calls):
+    from crud import token_crud
+    user_id = context.user_id
+    return lambda: token_crud.get_number_tokens(context.db, user_id)
+
+
+@benchmark("crud.token.create_access_token", number=50, new_request=True)
+def bench_create_access_token(context, calls):
+    from crud import token_crud
+    return lambda: token_crud.create_access_token(context.db, context.other_user_id)
+
+
+@benchmark("crud.token.update_access_and_refresh_tokens", number=50, new_request=True)
+def bench_update_access_and_refresh_tokens(context, calls):
+    from crud import token_crud
+    state = {"refresh_token": token_crud.create_access_token(context.db, context.other_user_id).refresh_token}
+
+    def update():
+        state["refresh_token"] = token_crud.update_access_and_refresh_tokens(context.db, state["refresh_token"]).refresh_token
+    return update
+
+
+@benchmark("repository.token.get_user_by_access_token", number=200, new_request=True)
+def bench_get_user_by_access_token(context, calls):
+    from repository import token_repository
+    return lambda: token_repository.get_user_by_access_token(context.db, context.access_token)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--filter", default="", help="only run the benchmarks whose name contains this")
+    parser.add_argument("--tolerance", type=float, default=None, help="allowed slowdown, 0.5 = 50%% (default: the one of the baseline)")
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the baseline of the backend")
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get("tolerance", DEFAULT_TOLERANCE)
+    backend_baseline = baseline.get(args.backend, {})
+    context = Context(args.backend)
+    regressions = []
+    results = {}
+    try:
+        print(f"{'benchmark':<48}{'us/op':>12}{'relative':>12}{'baseline':>12}{'change':>9}")
+        for name, bench in BENCHMARKS.items():
+            if args.filter not in name:
+                continue
+            expected = backend_baseline.get(name)
+            if args.update_baseline:
+                result = results[name] = run(bench, context, runs=BASELINE_RUNS)
+            else:
+                result = results[name] = run(bench, context, baseline=expected, tolerance=tolerance)
+            change = f"{(result['relative'] / expected['relative'] - 1) * 100:+.1f}%" if expected else "new"
+            if is_regression(result, expected, tolerance):
+                regressions.append(name)
+                change += " !"
+            print(f"{name:<48}{result['us']:>12}{result['relative']:>12}{expected['relative'] if expected else '-':>12}{change:>9}")
+    finally:
+        context.close()
+
+    if args.update_baseline:
+        baseline.setdefault("tolerance", DEFAULT_TOLERANCE)
+        baseline[args.backend] = {**backend_baseline, **results}
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) more than {tolerance:.0%} slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
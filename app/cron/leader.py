@@ -0,0 +1,112 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime
+from functools import wraps
+from sqlalchemy.exc import SQLAlchemyError
+import settings
+from crud import lease_crud
+from db.database import SessionLocal
+from utils.metrics import CRON_LAST_RUN, CRON_LEADER, CRON_RUN_DURATION, CRON_RUNS
+
+logger = logging.getLogger()
+
+
+class LeaderElection:
+    """
+    One lease per job in the leases table: among the processes scheduling a job (workers, pods), only the holder
+    of its lease runs it. Leases are renewed every CRON_LEASE_RENEW_INTERVAL seconds, including while a job runs.
+    When the holder stops, its leases are released; when it dies, another process takes them over once they expire.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.jobs = set()
+        self.held = set()
+        self.lock = threading.Lock()
+
+    def acquire(self, name: str):
+        db = SessionLocal()
+        try:
+            leader = lease_crud.acquire(db, name, self.holder, self.ttl)
+        except SQLAlchemyError as e:
+            # Without the database, nobody can be sure to be the only runner
+            logger.warning(f"Cron: cannot acquire the lease of {name}: {e}")
+            leader = False
+        finally:
+            db.close()
+        with self.lock:
+            if leader and name not in self.held:
+                logger.info(f"Cron: {self.holder} now runs {name}")
+                self.held.add(name)
+            elif not leader and name in self.held:
+                logger.warning(f"Cron: {self.holder} lost the lease of {name}")
+                self.held.discard(name)
+        CRON_LEADER.labels(name).set(1 if leader else 0)
+        return leader
+
+    def renew(self):
+        # Also elects a new runner for the jobs whose lease expired
+        for name in sorted(self.jobs):
+            self.acquire(name)
+
+    def release_all(self):
+        with self.lock:
+            held, self.held = self.held, set()
+        for name in held:
+            db = SessionLocal()
+            try:
+                lease_crud.release(db, name, self.holder)
+            except SQLAlchemyError as e:
+                logger.warning(f"Cron: cannot release the lease of {name}: {e}")
+            finally:
+                db.close()
+            CRON_LEADER.labels(name).set(0)
+
+
+election = LeaderElection(settings.env.CRON_LEASE_TTL)
+
+
+def elected(name: str):
+    """
+    Decorator of the cron jobs: the job only runs in the process holding its lease, and each run is recorded
+    in the cron metrics (skipped runs included).
+    """
+    def decorator(func):
+        election.jobs.add(name)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not election.acquire(name):
+                CRON_RUNS.labels(name, "skipped").inc()
+                return None
+            start_time = time.perf_counter()
+            outcome = "failure"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "success"
+                return result
+            except Exception:
+                logger.exception(f"Cron: {name} failed")
+            finally:
+                CRON_RUN_DURATION.labels(name).observe(time.perf_counter() - start_time)
+                CRON_RUNS.labels(name, outcome).inc()
+                CRON_LAST_RUN.labels(name, outcome).set_to_current_time()
+        return wrapper
+    return decorator
+
+
+def schedule_renewal(sched):
+    # First election as soon as the scheduler starts, however late after the import
+    sched.add_job(election.renew, 'interval', seconds=settings.env.CRON_LEASE_RENEW_INTERVAL, id="renew_cron_leases", next_run_time=datetime.now(), misfire_grace_time=None, max_instances=1, coalesce=True)
+
+
+def shutdown(sched):
+    # Leases are released so that another process takes the jobs over without waiting for their expiration
+    if sched.running:
+        sched.shutdown(wait=False)
+    election.release_all()
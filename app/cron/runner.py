@@ -0,0 +1,24 @@
+import signal
+import logging
+import threading
+from utils import logging_config, metrics_exporter
+
+logger = logging.getLogger()
+
+
+def run():
+    """
+    Entry point of the cron process of server.py. It is spawned rather than forked by the gunicorn master,
+    so that neither the master nor the workers it forks run scheduler threads or hold database connections.
+    """
+    logging_config.setup()
+    from cron import leader, token_cron
+
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stopped.set())
+
+    token_cron.sched.start()
+    stopped.wait()
+    leader.shutdown(token_cron.sched)
+    metrics_exporter.mark_process_dead()
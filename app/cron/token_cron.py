@@ -1,16 +1,22 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from crud import token_crud
+from cron import leader
 from db.database import SessionLocal
 import logging
 
 sched = BackgroundScheduler(daemon=True)
 logger = logging.getLogger()
+leader.schedule_renewal(sched)
 
 
-# Run the cron to remove expired tokens from database every day
+# Run the cron to remove expired tokens from database every day, in a single process across workers and pods
 @sched.scheduled_job('interval', days=1)
+@leader.elected("delete_expired_tokens")
 def delete_expired_tokens():
     db = SessionLocal()
-    db_tokens = token_crud.delete_expired_tokens(db=db)
-    logger.info(f"Tokens: Expired tokens deleted: {db_tokens}")
-    db.close()
+    try:
+        db_tokens = token_crud.delete_expired_tokens(db=db)
+        db.commit()
+        logger.info(f"Tokens: Expired tokens deleted: {db_tokens}")
+    finally:
+        db.close()
@@ -1,11 +1,35 @@
-from sqlalchemy.orm import Session
-from models import item_model as model
-from schemas import item_schema as schema
+from sqlalchemy import or_, tuple_
+from sqlalchemy.orm import Session, load_only, selectinload
+from models import item_model as model, user_model
+from schemas import item_schema as schema, user_schema
 from datetime import datetime
+from repository import entity_loader
+from utils import cache, consts, fieldsets
 
 
 def get_item(db: Session, item_id: int):
-    return db.query(model.Item).filter(model.Item.id == item_id).first()
+    # Shared with the permission check (rights.is_admin_or_item_owner) within a request
+    return entity_loader.get(db, model.Item, item_id)
+
+
+def get_item_version(db: Session, item_id: int):
+    # Only fetch the columns needed to compute an ETag
+    return db.query(model.Item.id, model.Item.version).filter(model.Item.id == item_id).first()
+
+
+def _shaped_query(db: Session, fields: list = None, expand_user: bool = False):
+    query = db.query(model.Item)
+    if fields:
+        # Sparse fieldset: only the requested columns (plus the primary key), and the owner key to expand it
+        query = query.options(load_only(*fieldsets.columns(model.Item, (fields + ["user_id"]) if expand_user else fields)))
+    if expand_user:
+        # Owners of all the rows in a single query, without the password columns
+        query = query.options(selectinload(model.Item.user).load_only(*fieldsets.columns(user_model.User, user_schema.User.model_fields)))
+    return query
+
+
+def get_item_shaped(db: Session, item_id: int, fields: list = None, expand_user: bool = False):
+    return _shaped_query(db, fields, expand_user).filter(model.Item.id == item_id).first()
 
 
 def get_item_by_name(db: Session, name: str):
@@ -24,18 +48,31 @@ def create_item(db: Session, item: schema.ItemCreate, user_id: int):
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    entity_loader.invalidate(db, model.Item, db_item.id)
+    cache.bus.publish(consts.Consts.CACHE_TAG_ITEMS, db_item.id)
     return db_item
 
 
-def update_item(db: Session, item_id: int, item: schema.ItemUpdate):
-    db_item = db.query(model.Item).filter(model.Item.id == item_id).first()
-    db_item.updated_at = datetime.utcnow()
+def update_item(db: Session, item_id: int, item: schema.ItemUpdate, version: int = None):
+    """
+    With a version (If-Match), the item is only written if it still has this version: returns None otherwise.
+    """
+    values = {model.Item.updated_at: datetime.utcnow(), model.Item.version: model.Item.version + 1}
     if item.name:
-        db_item.name = item.name
+        values[model.Item.name] = item.name
     if item.description:
-        db_item.description = item.description
+        values[model.Item.description] = item.description
+    query = db.query(model.Item).filter(model.Item.id == item_id)
+    if version is not None:
+        query = query.filter(model.Item.version == version)
+    updated_count = query.update(values, synchronize_session=False)
     db.commit()
-    return db.query(model.Item).filter(model.Item.id == item_id).first()
+    entity_loader.invalidate(db, model.Item, item_id)
+    if not updated_count:
+        return None
+    cache.bus.publish(consts.Consts.CACHE_TAG_ITEMS, item_id)
+    # Expired by the commit: reloaded once when serialized
+    return get_item(db, item_id)
 
 
 def count_items(db: Session, item_id: int = None, name: str = None, description: str = None):
@@ -49,8 +86,8 @@ def count_items(db: Session, item_id: int = None, name: str = None, description:
     return query.count()
 
 
-def list_items(db: Session, item_id: int = None, name: str = None, description: str = None, limit: int = None, page: int = None):
-    query = db.query(model.Item)
+def list_items(db: Session, item_id: int = None, name: str = None, description: str = None, limit: int = None, page: int = None, fields: list = None, expand_user: bool = False):
+    query = _shaped_query(db, fields, expand_user)
     if item_id:
         query = query.filter(model.Item.id == item_id)
     if name:
@@ -64,7 +101,51 @@ def list_items(db: Session, item_id: int = None, name: str = None, description:
     return query.all()
 
 
+def get_item_states(db: Session, item_ids: list):
+    # Permission check of a whole chunk of a bulk write in a single query: id -> (id, user_id, version, description)
+    rows = db.query(model.Item.id, model.Item.user_id, model.Item.version, model.Item.description).filter(model.Item.id.in_(item_ids)).all()
+    return {row.id: row for row in rows}
+
+
+def find_item_ids(db: Session, user_id: int, name: str = None, description: str = None, not_description: str = None, limit: int = None):
+    query = db.query(model.Item.id).filter(model.Item.user_id == user_id)
+    if name:
+        query = query.filter(model.Item.name.ilike(f"%{name}%"))
+    if description:
+        query = query.filter(model.Item.description.ilike(f"%{description}%"))
+    if not_description is not None:
+        # Items already up to date are left out
+        query = query.filter(or_(model.Item.description != not_description, model.Item.description.is_(None)))
+    return [row.id for row in query.order_by(model.Item.id).limit(limit).all()]
+
+
+def _bulk_query(db: Session, versions: dict):
+    # Only the rows still in the version checked (item id -> version) are written
+    return db.query(model.Item).filter(tuple_(model.Item.id, model.Item.version).in_(list(versions.items())))
+
+
+def _bulk_written(db: Session):
+    entity_loader.invalidate(db, model.Item)
+    cache.bus.publish(consts.Consts.CACHE_TAG_ITEMS)
+
+
+def delete_items(db: Session, versions: dict):
+    deleted_count = _bulk_query(db, versions).delete(synchronize_session=False)
+    db.commit()
+    _bulk_written(db)
+    return deleted_count
+
+
+def update_items(db: Session, versions: dict, description: str):
+    updated_count = _bulk_query(db, versions).update({model.Item.description: description, model.Item.updated_at: datetime.utcnow(), model.Item.version: model.Item.version + 1}, synchronize_session=False)
+    db.commit()
+    _bulk_written(db)
+    return updated_count
+
+
 def delete_item(db: Session, item_id: int):
     deleted_count = db.query(model.Item).filter(model.Item.id == item_id).delete()
     db.commit()
+    entity_loader.invalidate(db, model.Item, item_id)
+    cache.bus.publish(consts.Consts.CACHE_TAG_ITEMS, item_id)
     return deleted_count
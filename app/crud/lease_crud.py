@@ -0,0 +1,38 @@
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from models import lease_model as model
+
+
+def acquire(db: Session, name: str, holder: str, ttl: int):
+    """
+    Take or renew the lease `name` for `ttl` seconds. Succeeds when the lease is free, expired or already held by
+    `holder`: a single conditional UPDATE, so two processes can never both succeed.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    updated = db.query(model.Lease).filter(model.Lease.name == name).filter(
+        or_(model.Lease.holder == holder, model.Lease.expires_at < now)
+    ).update({model.Lease.holder: holder, model.Lease.expires_at: expires_at}, synchronize_session=False)
+    db.commit()
+    if updated:
+        return True
+    if db.query(model.Lease.name).filter(model.Lease.name == name).first() is not None:
+        return False
+    # First run of the job: the lease does not exist yet
+    try:
+        db.add(model.Lease(name=name, holder=holder, expires_at=expires_at))
+        db.commit()
+    except IntegrityError:
+        # Created by another process in the meantime
+        db.rollback()
+        return False
+    return True
+
+
+def release(db: Session, name: str, holder: str):
+    # Expired a second ago: DATETIME columns round to the second, a lease expiring "now" could still be held
+    db.query(model.Lease).filter(model.Lease.name == name).filter(model.Lease.holder == holder).update(
+        {model.Lease.expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+    db.commit()
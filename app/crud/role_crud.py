@@ -1,9 +1,10 @@
 from sqlalchemy.orm import Session
 from models import role_model
+from repository import entity_loader
 
 
 def get_role(db: Session, role_id: int):
-    return db.query(role_model.Role).filter(role_model.Role.id == role_id).first()
+    return entity_loader.get(db, role_model.Role, role_id)
 
 
 def get_role_by_name(db: Session, name: str):
@@ -1,8 +1,9 @@
 from sqlalchemy.orm import Session
 from datetime import datetime
 from datetime import timedelta
-from utils import auth, consts
+from utils import auth, cache, consts
 from models import token_model
+from repository import entity_loader
 
 
 def delete_oldest_token(db: Session, user_id: int):
@@ -11,6 +12,8 @@ def delete_oldest_token(db: Session, user_id: int):
         token_model.Token.refresh_token_expiration > now).order_by(token_model.Token.refresh_token_expiration).first()
     if db_token_to_delete:
         db.query(token_model.Token).filter(token_model.Token.id == db_token_to_delete.id).delete()
+        cache.revoke_tokens(db_token_to_delete.access_token)
+        entity_loader.invalidate(db, token_model.Token, db_token_to_delete.id)
 
 
 def get_number_tokens(db: Session, user_id: int):
@@ -49,6 +52,7 @@ def create_token(db: Session,
     db.add(db_token)
     db.commit()
     db.refresh(db_token)
+    entity_loader.invalidate(db, token_model.Token, db_token.id)
     return db_token
 
 
@@ -75,21 +79,24 @@ def create_access_token(db: Session,
 
 
 def get_token_by_access_token(db: Session, token: str):
-    now = datetime.utcnow()
-    query = db.query(token_model.Token).filter(token_model.Token.access_token == token).filter(
-        token_model.Token.access_token_expiration > now)
-    return query.first()
+    # Checked by the permission layer then by the route within a request: read once, expiration checked on the row
+    db_token = entity_loader.find(db, token_model.Token, token_model.Token.access_token, token)
+    if db_token is not None and db_token.access_token_expiration > datetime.utcnow():
+        return db_token
+    return None
 
 
 def get_token_by_refresh_token(db: Session, token: str):
-    now = datetime.utcnow()
-    query = db.query(token_model.Token).filter(token_model.Token.refresh_token == token).filter(
-        token_model.Token.refresh_token_expiration > now)
-    return query.first()
+    # Checked by the permission layer then by the route within a request: read once, expiration checked on the row
+    db_token = entity_loader.find(db, token_model.Token, token_model.Token.refresh_token, token)
+    if db_token is not None and db_token.refresh_token_expiration > datetime.utcnow():
+        return db_token
+    return None
 
 
 def update_access_and_refresh_tokens(db: Session, refresh_token: str):
     db_token = get_token_by_refresh_token(db=db, token=refresh_token)
+    previous_access_token = db_token.access_token
 
     access_token = auth.create_token()
     refresh_token = auth.create_token()
@@ -101,7 +108,10 @@ def update_access_and_refresh_tokens(db: Session, refresh_token: str):
     db_token.refresh_token = refresh_token
     db_token.refresh_token_expiration = refresh_token_expiration
 
+    # Before the commit, which expires db_token
+    entity_loader.invalidate(db, token_model.Token, db_token.id)
     db.commit()
+    cache.revoke_tokens(previous_access_token)
     return db_token
 
 
@@ -109,10 +119,18 @@ def logout(db: Session, user_id: int, access_token: str = None):
     query = db.query(token_model.Token).filter(token_model.Token.user_id == user_id)
     if access_token:
         query = query.filter(token_model.Token.access_token == access_token)
+        revoked_tokens = [access_token]
+    else:
+        # Read before the delete: the users of these tokens may be cached by any worker
+        revoked_tokens = [row.access_token for row in db.query(token_model.Token.access_token).filter(token_model.Token.user_id == user_id)]
     query.delete()
+    db.commit()
+    entity_loader.invalidate(db, token_model.Token)
+    cache.revoke_tokens(*revoked_tokens)
 
 
 def delete_expired_tokens(db: Session):
     now = datetime.utcnow()
     deleted_count = db.query(token_model.Token).filter(token_model.Token.refresh_token_expiration < now).delete()
+    entity_loader.invalidate(db, token_model.Token)
     return deleted_count
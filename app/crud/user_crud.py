@@ -1,13 +1,31 @@
 from sqlalchemy.orm import Session
 from schemas import user_schema
-from models import user_model, role_model
+from models import user_model
 from datetime import datetime
-from utils import auth, consts
+from utils import auth, cache, consts, fieldsets, registry
 from sqlalchemy.sql.expression import true
+from repository import entity_loader
 
 
 def get_user(db: Session, user_id: int, activated: bool = True):
-    query = db.query(user_model.User).filter(user_model.User.id == user_id)
+    # Shared with the permission checks within a request, the activated filter is applied on the loaded row
+    db_user = entity_loader.get(db, user_model.User, user_id)
+    if db_user is None or (activated is not None and db_user.activated != activated):
+        return None
+    return db_user
+
+
+def get_user_version(db: Session, user_id: int, activated: bool = True):
+    # Only fetch the columns needed to compute an ETag
+    query = db.query(user_model.User.id, user_model.User.version).filter(user_model.User.id == user_id)
+    if activated is not None:
+        query = query.filter(user_model.User.activated == activated)
+    return query.first()
+
+
+def get_user_fields(db: Session, user_id: int, fields: list, activated: bool = True):
+    # Sparse fieldset: only the requested columns
+    query = db.query(*fieldsets.columns(user_model.User, fields)).filter(user_model.User.id == user_id)
     if activated is not None:
         query = query.filter(user_model.User.activated == activated)
     return query.first()
@@ -20,8 +38,9 @@ def get_user_by_username(db: Session, username: str, activated: bool = True):
     return query.first()
 
 
-def list_users(db: Session, username: str = None, activated: bool = True, limit: int = True, page: int = True):
-    query = db.query(user_model.User)
+def list_users(db: Session, username: str = None, activated: bool = True, limit: int = True, page: int = True, fields: list = None):
+    # Rows only have the requested columns with a sparse fieldset
+    query = db.query(*fieldsets.columns(user_model.User, fields)) if fields else db.query(user_model.User)
     if activated is not None:
         query = query.filter(user_model.User.activated == activated)
     if username:
@@ -68,42 +87,70 @@ def create_user(db: Session, user: user_schema.UserCreate, activated: bool = Tru
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    entity_loader.invalidate(db, user_model.User, db_user.id)
+    cache.bus.publish(consts.Consts.CACHE_TAG_USERS, db_user.id)
     return db_user
 
 
 def delete_user(db: Session, user_id: int):
     deleted_count = db.query(user_model.User).filter(user_model.User.id == user_id).delete()
     db.commit()
+    entity_loader.invalidate(db, user_model.User, user_id)
+    cache.bus.publish(consts.Consts.CACHE_TAG_USERS, user_id)
     return deleted_count
 
 
-def update_user(db: Session, user_id: int, user: user_schema.UserUpdate):
-    db_user = db.query(user_model.User).filter(user_model.User.id == user_id).first()
-    db_user.updated_at = datetime.utcnow()
+def update_user(db: Session, user_id: int, user: user_schema.UserUpdate, version: int = None):
+    """
+    With a version (If-Match), the user is only written if it still has this version: returns None otherwise.
+    """
+    values = {user_model.User.updated_at: datetime.utcnow(), user_model.User.version: user_model.User.version + 1}
     if user.role_id:
-        db_user.role_id = user.role_id
+        values[user_model.User.role_id] = user.role_id
     if user.username:
-        db_user.username = user.username
+        values[user_model.User.username] = user.username
     if user.activated is not None:
-        db_user.activated = user.activated
+        values[user_model.User.activated] = user.activated
     if user.password:
         password_obj = auth.hash_password(user.password)
-        db_user.salt = password_obj.salt
-        db_user.hashed_password = password_obj.hashed_password
+        values[user_model.User.salt] = password_obj.salt
+        values[user_model.User.hashed_password] = password_obj.hashed_password
+    query = db.query(user_model.User).filter(user_model.User.id == user_id)
+    if version is not None:
+        query = query.filter(user_model.User.version == version)
+    updated_count = query.update(values, synchronize_session=False)
+    db.commit()
+    entity_loader.invalidate(db, user_model.User, user_id)
+    if not updated_count:
+        return None
+    cache.bus.publish(consts.Consts.CACHE_TAG_USERS, user_id)
+    # Expired by the commit: reloaded once when serialized
+    return get_user(db, user_id, activated=None)
+
+
+def disable_account(db: Session, user_id: int):
+    db_user = get_user(db, user_id, activated=None)
+    if not db_user:
+        return None
+    db_user.activated = False
+    db_user.updated_at = datetime.utcnow()
+    db_user.version = user_model.User.version + 1
     db.commit()
-    return db.query(user_model.User).filter(user_model.User.id == user_id).first()
+    entity_loader.invalidate(db, user_model.User, user_id)
+    cache.bus.publish(consts.Consts.CACHE_TAG_USERS, user_id)
+    return db_user
 
 
 # Auth
 def is_admin(db: Session, user_id: int):
-    db_user = db.query(user_model.User).filter(user_model.User.id == user_id).first()
-    db_role = db.query(role_model.Role).filter(role_model.Role.name == consts.Consts.ROLE_ADMIN).first()
+    db_user = get_user(db, user_id, activated=None)
+    db_role = registry.roles.find(db, name=consts.Consts.ROLE_ADMIN)
     return db_role.id == db_user.role_id
 
 
 def is_user(db: Session, user_id: int):
-    db_user = db.query(user_model.User).filter(user_model.User.id == user_id).first()
-    db_role = db.query(role_model.Role).filter(role_model.Role.name == consts.Consts.ROLE_USER).first()
+    db_user = get_user(db, user_id, activated=None)
+    db_role = registry.roles.find(db, name=consts.Consts.ROLE_USER)
     return db_role.id == db_user.role_id
 
 
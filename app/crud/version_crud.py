@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from models import version_model as model
+from utils import cache, consts
 
 
 def get_version(db: Session, version: str):
@@ -8,3 +9,14 @@ def get_version(db: Session, version: str):
 
 def list_versions(db: Session):
     return db.query(model.Version).all()
+
+
+def update_version(db: Session, version: str, supported: bool):
+    db_version = get_version(db, version)
+    if db_version is None:
+        return None
+    db_version.supported = supported
+    db.commit()
+    # Checked by every request through the versions registry of each worker
+    cache.bus.publish(consts.Consts.CACHE_TAG_VERSIONS, version)
+    return db_version
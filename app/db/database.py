@@ -1,11 +1,22 @@
-from sqlalchemy import create_engine
+import time
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, declarative_base
 import settings
+from db import instrumentation
+
+logger = logging.getLogger()
 
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URL,
-    pool_recycle=21600
+    pool_size=settings.env.DB_POOL_SIZE,
+    pool_recycle=21600,
+    # SQLite (load tests only): connections are used by several threads and wait for the write lock
+    connect_args={"check_same_thread": False, "timeout": 30} if settings.SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 )
+# Count statements and DB time of each request
+instrumentation.install(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=True)
 
 Base = declarative_base()
@@ -18,3 +29,43 @@ async def get_db():
         yield db
     finally:
         db.close()
+
+
+def create_schema():
+    # Every model must be registered on Base.metadata before a single create_all
+    from models import item_model, lease_model, role_model, token_model, user_model, version_model  # noqa: F401
+    Base.metadata.create_all(bind=engine)
+
+
+def warm_up():
+    # Open the whole pool and run a query on each connection so the first requests do not pay for the handshakes
+    connections = []
+    try:
+        for _ in range(settings.env.DB_POOL_SIZE):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def prepare():
+    """
+    Called once when the app starts. Retries while the database is unreachable, and gives up without raising:
+    the app still starts and connections are opened on demand once the database is back.
+    """
+    delay = settings.env.DB_STARTUP_RETRY_DELAY
+    for attempt in range(1, settings.env.DB_STARTUP_RETRIES + 1):
+        try:
+            if settings.env.DB_CREATE_SCHEMA:
+                create_schema()
+            warm_up()
+            return True
+        except SQLAlchemyError as e:
+            logger.warning(f"Database not ready (attempt {attempt}/{settings.env.DB_STARTUP_RETRIES}): {e}")
+            if attempt < settings.env.DB_STARTUP_RETRIES:
+                time.sleep(delay)
+                delay *= 2
+    logger.error("Database unreachable at startup: connections will be opened by the first requests")
+    return False
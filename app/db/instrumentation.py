@@ -0,0 +1,124 @@
+import time
+import logging
+from functools import wraps
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import settings
+from db.slow_query_log import is_slow, slow_query_log
+from utils.metrics import DB_QUERIES_PER_REQUEST, DB_QUERY_ALARMS, DB_TIME_PER_REQUEST
+
+logger = logging.getLogger()
+
+HEADER_SERVER_TIMING = b"server-timing"
+
+
+class RequestStats:
+    """
+    Statements executed while handling a request. The same object is shared with the threadpool
+    worker running the route (anyio copies the context into the thread).
+    """
+
+    def __init__(self):
+        self.route = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.endpoint_start = None
+        self.endpoint_end = None
+
+    def add_query(self, duration: float):
+        self.queries += 1
+        self.db_time += duration
+
+    def server_timing(self, response_start: float):
+        # db: time in SQL statements, app: rest of the route, serialize: from the route return to the response start
+        timings = [f'db;dur={round(self.db_time * 1000, 2)};desc="{self.queries} queries"']
+        if self.endpoint_start is not None and self.endpoint_end is not None:
+            app_time = max(self.endpoint_end - self.endpoint_start - self.db_time, 0)
+            timings.append(f"app;dur={round(app_time * 1000, 2)}")
+            timings.append(f"serialize;dur={round((response_start - self.endpoint_end) * 1000, 2)}")
+        return ", ".join(timings)
+
+
+current_stats: ContextVar = ContextVar("db_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context.query_start_time
+    stats = current_stats.get()
+    if stats is not None:
+        stats.add_query(duration)
+    if is_slow(statement, duration):
+        slow_query_log.record(conn, cursor, statement, parameters, executemany, duration, stats.route if stats else None)
+
+
+def install(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def instrument(func, route: str):
+    """
+    Wrap a route endpoint to label the statements of the request with its route template.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = current_stats.get()
+        if stats is None:
+            return func(*args, **kwargs)
+        stats.route = route
+        stats.endpoint_start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.endpoint_end = time.perf_counter()
+    return wrapper
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware counting the SQL statements and the DB time of each request, by route template.
+    Adds a Server-Timing header when SERVER_TIMING_ENABLED is set, and logs a warning when a request
+    exceeds DB_QUERY_ALARM_THRESHOLD statements.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and settings.env.SERVER_TIMING_ENABLED and stats.route is not None:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (HEADER_SERVER_TIMING, stats.server_timing(time.perf_counter()).encode('latin-1'))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            if stats.route is not None:
+                self.observe(scope, stats)
+
+    def observe(self, scope, stats: RequestStats):
+        DB_QUERIES_PER_REQUEST.labels(stats.route).observe(stats.queries)
+        DB_TIME_PER_REQUEST.labels(stats.route).observe(stats.db_time)
+        threshold = settings.env.DB_QUERY_ALARM_THRESHOLD
+        if threshold and stats.queries > threshold:
+            DB_QUERY_ALARMS.labels(stats.route).inc()
+            logger.warning(
+                "%s %s ran %s SQL statements (threshold %s) in %s ms",
+                scope["method"], stats.route, stats.queries, threshold, round(stats.db_time * 1000, 2),
+                extra={"route": stats.route, "queries": stats.queries, "db_time_ms": round(stats.db_time * 1000, 2)}
+            )
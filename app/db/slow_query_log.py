@@ -0,0 +1,186 @@
+import re
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import settings
+
+logger = logging.getLogger()
+
+# Bound parameters (pyformat, named, qmark), literals and IN lists are replaced so that
+# statements differing only by their values share the same fingerprint
+PARAMETER_PATTERN = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_PATTERN = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize(statement: str):
+    statement = PARAMETER_PATTERN.sub("?", statement)
+    statement = LITERAL_PATTERN.sub("?", statement)
+    statement = IN_LIST_PATTERN.sub("IN (...)", statement)
+    return WHITESPACE_PATTERN.sub(" ", statement).strip()
+
+
+def fingerprint(normalized_statement: str):
+    return hashlib.sha1(normalized_statement.encode('utf8')).hexdigest()[:16]
+
+
+def parameter_shape(parameters, executemany: bool):
+    # Types only: values may contain personal data and must never be logged
+    if executemany:
+        rows = list(parameters or [])
+        return f"{len(rows)} x {parameter_shape(rows[0], False)}" if rows else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+class SlowStatement:
+    """
+    Statistics of the slow executions of one statement fingerprint.
+    Durations are kept in a fixed-size reservoir (uniform sample) to compute percentiles in bounded memory.
+    """
+
+    def __init__(self, fingerprint: str, statement: str):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.reservoir = []
+        self.routes = set()
+        self.parameters = None
+        self.rowcount = None
+        self.last_seen = None
+        self.explain = None
+        self.explained_at = None
+
+    def add(self, duration: float, route: str, parameters: str, rowcount: int, reservoir_size: int):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if len(self.reservoir) < reservoir_size:
+            self.reservoir.append(duration)
+        else:
+            index = random.randrange(self.count)
+            if index < reservoir_size:
+                self.reservoir[index] = duration
+        if route:
+            self.routes.add(route)
+        self.parameters = parameters
+        self.rowcount = rowcount
+        self.last_seen = time.time()
+
+    def percentile(self, percent: float):
+        durations = sorted(self.reservoir)
+        if not durations:
+            return 0.0
+        return durations[min(int(len(durations) * percent / 100), len(durations) - 1)]
+
+    def to_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "routes": sorted(self.routes),
+            "parameters": self.parameters,
+            "rowcount": self.rowcount,
+            "explain": self.explain,
+            "explained_at": self.explained_at,
+        }
+
+
+class SlowQueryLog:
+    """
+    In-process slow query log: statements slower than SLOW_QUERY_THRESHOLD_MS are logged and aggregated
+    by fingerprint (SLOW_QUERY_MAX_FINGERPRINTS at most, least recently seen evicted first).
+    A sample of them is explained by a single background thread, never on the request path.
+    """
+
+    def __init__(self):
+        self.statements = OrderedDict()
+        self.lock = threading.Lock()
+        self.explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self.explain_pending = set()
+
+    def record(self, conn, cursor, statement: str, parameters, executemany: bool, duration: float, route: str):
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        shape = parameter_shape(parameters, executemany)
+        rowcount = getattr(cursor, "rowcount", None)
+
+        logger.warning(
+            "Slow query %s ms on %s (fingerprint %s): %s",
+            round(duration * 1000, 2), route or "-", key, normalized,
+            extra={"fingerprint": key, "duration_ms": round(duration * 1000, 2), "route": route, "rowcount": rowcount, "parameters": shape}
+        )
+
+        with self.lock:
+            slow_statement = self.statements.get(key)
+            if slow_statement is None:
+                slow_statement = self.statements[key] = SlowStatement(key, normalized)
+                if len(self.statements) > settings.env.SLOW_QUERY_MAX_FINGERPRINTS:
+                    self.statements.popitem(last=False)
+            else:
+                self.statements.move_to_end(key)
+            slow_statement.add(duration, route, shape, rowcount, settings.env.SLOW_QUERY_RESERVOIR_SIZE)
+            should_explain = self._should_explain(slow_statement, statement, executemany)
+            if should_explain:
+                self.explain_pending.add(key)
+
+        if should_explain:
+            # Parameters are only used to run the EXPLAIN, they are not stored
+            self.explain_executor.submit(self._explain, conn.engine, slow_statement, statement, parameters)
+
+    def _should_explain(self, slow_statement: SlowStatement, statement: str, executemany: bool):
+        if executemany or not statement.lstrip()[:6].upper() == "SELECT":
+            return False
+        if slow_statement.fingerprint in self.explain_pending:
+            return False
+        if slow_statement.explained_at and time.time() - slow_statement.explained_at < settings.env.SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        return random.random() < settings.env.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+
+    def _explain(self, engine, slow_statement: SlowStatement, statement: str, parameters):
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            with engine.connect() as connection:
+                result = connection.exec_driver_sql(prefix + statement, parameters)
+                plan = [dict(row._mapping) for row in result]
+            with self.lock:
+                slow_statement.explain = plan
+                slow_statement.explained_at = time.time()
+        except Exception:
+            logger.exception(f"Cannot explain slow query {slow_statement.fingerprint}")
+        finally:
+            with self.lock:
+                self.explain_pending.discard(slow_statement.fingerprint)
+
+    def top(self, limit: int, order_by: str):
+        with self.lock:
+            statements = [slow_statement.to_dict() for slow_statement in self.statements.values()]
+        return sorted(statements, key=lambda slow_statement: slow_statement[order_by], reverse=True)[:limit]
+
+    def clear(self):
+        with self.lock:
+            self.statements.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def is_slow(statement: str, duration: float):
+    threshold = settings.env.SLOW_QUERY_THRESHOLD_MS
+    # EXPLAIN statements run by this module are never recorded
+    return threshold > 0 and duration * 1000 >= threshold and not statement.startswith("EXPLAIN")
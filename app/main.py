@@ -1,15 +1,12 @@
-import uvicorn
-import time
 import settings
 import logging
-import traceback
+from contextlib import asynccontextmanager
+from anyio import to_thread
 
 # FastAPI imports
 from fastapi import Depends, FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
 from fastapi.exception_handlers import http_exception_handler
-from fastapi.openapi.utils import get_openapi
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.responses import RedirectResponse
 
@@ -17,13 +14,14 @@ from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
 # Prometheus client import
-from prometheus_client import start_http_server
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Project imports
 from starlette.responses import JSONResponse
+from db import database, instrumentation
 from db.database import get_db
 from api import (
+    admin_routes,
     auth_routes,
     item_routes,
     role_routes,
@@ -31,25 +29,49 @@ from api import (
     version_routes
 )
 from crud import user_crud
-from cron import token_cron
 from exceptions.VersionException import VersionException
 from exceptions.CustomException import CustomException
-from utils import consts
+from utils import access_log, cache, compression, consts, credentials_cache, logging_config, memory_profiler, metrics_exporter, profiler, rate_limit, registry, response_cache, single_flight, threadpool
+from utils.static_files import CachedStaticFiles
 
-# Imports needed to protect API documentation endpoints
-from fastapi.openapi.docs import get_redoc_html
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
+logging_config.setup()
 
 logger = logging.getLogger()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Database access and crons are started here rather than at import time.
+    """
+    threadpool.configure()
+    if settings.env.MEMORY_ROUTE_METRICS_ENABLED:
+        memory_profiler.start(frames=1)
+    # Already loaded when the app is preloaded by the gunicorn master (server.py): the workers share its rows
+    if await to_thread.run_sync(database.prepare) and not registry.is_loaded():
+        await to_thread.run_sync(registry.preload)
+    # In each worker: invalidations published by the other workers are applied from now on
+    cache.bus.start()
+    get_openapi_document()
+
+    # Crons (APScheduler is only imported when the server starts)
+    if settings.env.CRON_ENABLED:
+        from cron import leader, token_cron
+        token_cron.sched.start()
+
+    yield
+
+    if settings.env.CRON_ENABLED:
+        leader.shutdown(token_cron.sched)
+    await to_thread.run_sync(cache.bus.stop)
+    metrics_exporter.mark_process_dead()
+
+
 app = FastAPI(
     docs_url=None,
     redoc_url=None,
-    openapi_url=None
+    openapi_url=None,
+    lifespan=lifespan
 )
 
 # Dependencies
@@ -58,6 +80,24 @@ app.include_router(item_routes.router)
 app.include_router(role_routes.router)
 app.include_router(user_routes.router)
 app.include_router(version_routes.router)
+app.include_router(admin_routes.router)
+
+# Coalesce identical concurrent reads (inside the cache: only cache misses reach it)
+if settings.env.SINGLE_FLIGHT_ENABLED:
+    app.add_middleware(single_flight.SingleFlightMiddleware)
+# Serve public read endpoints from memory
+app.add_middleware(response_cache.ResponseCacheMiddleware)
+# SQL statements and DB time per route (outside the cache: cached responses carry no Server-Timing)
+app.add_middleware(instrumentation.QueryStatsMiddleware)
+if settings.env.PROFILING_ENABLED:
+    app.add_middleware(profiler.ProfileIdMiddleware)
+# Compress responses (added after the cache so that cached bodies are stored uncompressed)
+app.add_middleware(compression.CompressionMiddleware)
+# Throttle noisy clients before any work is done for them (cached responses included)
+if settings.env.RATE_LIMIT_ENABLED:
+    app.add_middleware(rate_limit.RateLimitMiddleware)
+# Access logs (outermost so that the logged size is the size sent over the wire)
+app.add_middleware(access_log.AccessLogMiddleware)
 
 
 # HTTP Handlers
@@ -65,7 +105,8 @@ app.include_router(version_routes.router)
 async def exception_handler(request: Request, exception: CustomException):
     ex = HTTPException(
         status_code=exception.status_code,
-        detail=exception.detail
+        detail=exception.detail,
+        headers=exception.headers
     )
     logging.error(exception.info)
     return await http_exception_handler(request, ex)
@@ -93,33 +134,14 @@ async def validation_exception_handler(request, exc):
     return await http_exception_handler(request, ex)
 
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    try:
-        start_time = time.time()
-        response = await call_next(request)
-        if request.url.path != '/':
-            process_time_seconds = (time.time() - start_time)
-            process_time_milli = process_time_seconds * 1000
-            request_time_milli = round(process_time_milli, 2)
-            request_time_sec = round(process_time_seconds, 2)
-            user_agent = request.headers.get("user-agent", "-")
-            response_size = response.headers.get("content-length", "-")
-            version = response.headers.get("x-version", "-")
-            accesslog = f"[zz999] {response.status_code} {request_time_sec} {request_time_milli} {response_size} {request.method} {request.url.path}?{str(request.query_params)} {version} {user_agent}"
-            logger.info(accesslog)
-        return response
-    except Exception as e:
-        logger.error("Can't log request")
-        logger.error(str(e))
-        logger.error(traceback.format_exc())
-
 security = HTTPBasic()
 
 
 # Docs
-@app.get("/openapi.json", include_in_schema=False)
-async def get_open_api_endpoint(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
+def check_docs_credentials(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
+    # Sync dependency: bcrypt runs in the threadpool, and only when the credentials are not already known
+    if credentials_cache.docs_credentials.get(credentials.username, credentials.password):
+        return
     db_user = user_crud.check_authentication(db, username=credentials.username, password=credentials.password)
     if not db_user:
         raise CustomException(
@@ -128,33 +150,41 @@ async def get_open_api_endpoint(credentials: HTTPBasicCredentials = Depends(secu
             detail=consts.Consts.INVALID_CREDENTIALS,
             info=f'Cannot find activated User with username {credentials.username} and specified password'
         )
+    credentials_cache.docs_credentials.add(credentials.username, credentials.password)
 
-    openapi_schema = get_openapi(
-        title="Sample API Documentation",
-        version="1.0.0",
-        routes=app.routes,
-        description="Postman Collection: https://api.postman.com/collections/1999344-93e21dc5-aa22-4fbf-a196-fcb5e5f1926c?access_key=PMAT-01HCWNW2JZVWXF79N5ESXY61TT",
-        openapi_version="3.0.3",
-    )
 
-    openapi_schema["info"]["x-logo"] = {
-        "url": "/logo.png"
-    }
-    app.openapi_schema = openapi_schema
-    return JSONResponse(openapi_schema)
+@app.get("/openapi.json", include_in_schema=False, dependencies=[Depends(check_docs_credentials)])
+async def get_open_api_endpoint(request: Request):
+    return get_openapi_document().response(request)
 
 
-@app.get("/docs", include_in_schema=False)
-async def get_documentation(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
-    db_user = user_crud.check_authentication(db, username=credentials.username, password=credentials.password)
-    if not db_user:
-        raise CustomException(
-            db=db,
-            status_code=consts.Consts.ERROR_CODE_401,
-            detail=consts.Consts.INVALID_CREDENTIALS,
-            info=f'Cannot find activated User with username {credentials.username} and specified password'
+openapi_document = None
+
+
+def get_openapi_document():
+    # Routes do not change once the app is started: generate, encode and compress the schema only once
+    global openapi_document
+    if openapi_document is None:
+        from fastapi.openapi.utils import get_openapi
+        openapi_schema = get_openapi(
+            title="Sample API Documentation",
+            version="1.0.0",
+            routes=app.routes,
+            description="Postman Collection: https://api.postman.com/collections/1999344-93e21dc5-aa22-4fbf-a196-fcb5e5f1926c?access_key=PMAT-01HCWNW2JZVWXF79N5ESXY61TT",
+            openapi_version="3.0.3",
         )
 
+        openapi_schema["info"]["x-logo"] = {
+            "url": "/logo.png"
+        }
+        app.openapi_schema = openapi_schema
+        openapi_document = compression.PrecompressedBody(JSONResponse(openapi_schema).body, "application/json")
+    return openapi_document
+
+
+@app.get("/docs", include_in_schema=False, dependencies=[Depends(check_docs_credentials)])
+async def get_documentation():
+    from fastapi.openapi.docs import get_redoc_html
     return get_redoc_html(openapi_url="/openapi.json", title="docs")
 
 
@@ -163,16 +193,14 @@ async def redirect():
     response = RedirectResponse(url='/docs')
     return response
 
-# Crons
-token_cron.sched.start()
-
-# Start up the server to expose the metrics.
-instrumentator = Instrumentator().instrument(app)
-start_http_server(8000)
+# Expose the metrics on /metrics. With several workers (PROMETHEUS_MULTIPROC_DIR set), the metrics of every worker are aggregated
+instrumentator = Instrumentator(excluded_handlers=["/metrics"]).instrument(app)
+instrumentator.expose(app, include_in_schema=False)
 
-# Mount static images folder
-app.mount("/", StaticFiles(directory="static/files/"))
+# Mount static images folder (files are indexed once: unknown paths never reach the filesystem)
+app.mount("/", CachedStaticFiles(directory="static/files/"))
 
 if __name__ == "__main__":
-    instrumentator.expose(app)
-    uvicorn.run(app, host='0.0.0.0', port=settings.env.APP_PORT)
+    import uvicorn
+    # Requests are already logged by AccessLogMiddleware
+    uvicorn.run(app, host='0.0.0.0', port=settings.env.APP_PORT, access_log=False)
@@ -1,5 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
 from db.database import Base
+from models import user_model
 
 
 class Item(Base):
@@ -10,4 +12,9 @@ class Item(Base):
     description = Column(String(255), nullable=True)
     created_at = Column(DateTime)
     updated_at = Column(DateTime, nullable=True)
+    # Incremented by every write: ETag of the item, and precondition of the conditional updates
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     user_id = Column(Integer, ForeignKey('users.id'))
+
+    # Owner, only loaded on demand (expand=user): item_crud loads it for a whole page with selectinload
+    user = relationship(user_model.User, lazy="select")
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, DateTime, String
+from db.database import Base
+
+
+class Lease(Base):
+    __tablename__ = "leases"
+
+    name = Column(String(64), primary_key=True)
+    holder = Column(String(255))
+    expires_at = Column(DateTime)
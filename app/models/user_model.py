@@ -13,3 +13,5 @@ class User(Base):
     role_id = Column(Integer, ForeignKey('roles.id'))
     created_at = Column(DateTime)
     updated_at = Column(DateTime, nullable=True)
+    # Incremented by every write: ETag of the user, and precondition of the conditional updates
+    version = Column(Integer, nullable=False, default=1, server_default="1")
@@ -0,0 +1,50 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+# Rows are memoized in the session: one session per request (db.database.get_db)
+SESSION_INFO_KEY = "entity_loader"
+
+
+def _rows(db: Session):
+    return db.info.setdefault(SESSION_INFO_KEY, {})
+
+
+def get(db: Session, model, entity_id: int):
+    """
+    Row of `model` with this primary key, read at most once per request (None if it does not exist).
+    The permission checks and the routes share the rows loaded through this function.
+    """
+    rows = _rows(db)
+    key = (model, "id", entity_id)
+    if key not in rows:
+        rows[key] = db.get(model, entity_id)
+    return rows[key]
+
+
+def find(db: Session, model, column, value):
+    """
+    Row of `model` whose unique `column` equals `value`, read at most once per request.
+    """
+    rows = _rows(db)
+    key = (model, column.key, value)
+    if key not in rows:
+        row = db.query(model).filter(column == value).first()
+        rows[key] = row
+        if row is not None:
+            rows[(model, "id", row.id)] = row
+    return rows[key]
+
+
+def invalidate(db: Session, model, entity_id: int = None):
+    """
+    Called by the crud functions writing `model`: the next get or find reads the row again.
+    Without entity_id, every row of the model is forgotten (bulk updates and deletes). Rows memoized as missing
+    are always forgotten: the write may have created them.
+    """
+    rows = _rows(db)
+    for key, row in list(rows.items()):
+        if key[0] is not model:
+            continue
+        # inspect() gives the primary key without loading an expired (or deleted) row
+        if entity_id is None or row is None or key == (model, "id", entity_id) or inspect(row).identity == (entity_id,):
+            del rows[key]
@@ -3,7 +3,8 @@ from sqlalchemy.orm import Session
 from crud import token_crud
 from models import token_model
 from utils import consts
-from sqlalchemy.sql.expression import true
+from repository import entity_loader
+from utils import cache
 
 
 def create_token(db: Session, user_id: int):
@@ -23,18 +24,22 @@ def get_token_output(token: token_model.Token):
 
 
 def get_user_by_access_token(db: Session, token: str, activated: bool = True):
-    db_token = token_crud.get_token_by_access_token(db, token=token)
-    if db_token:
-        query = db.query(user_model.User).filter(user_model.User.id == db_token.user_id)
-        if activated is not None:
-            query = query.filter(user_model.User.activated == true())
-        return query.first()
+    # Tokens are evicted from the cache when deleted or rotated (token_crud), the user is always read
+    user_id = cache.access_tokens.get(token)
+    if user_id is None:
+        db_token = token_crud.get_token_by_access_token(db, token=token)
+        if not db_token:
+            return None
+        user_id = db_token.user_id
+        cache.access_tokens.add(token, user_id, db_token.access_token_expiration)
+    db_user = entity_loader.get(db, user_model.User, user_id)
+    if db_user is not None and (activated is None or db_user.activated):
+        return db_user
 
 
 def get_user_by_refresh_token(db: Session, token: str, activated: bool = True):
     db_token = token_crud.get_token_by_refresh_token(db, token=token)
     if db_token:
-        query = db.query(user_model.User).filter(user_model.User.id == db_token.user_id)
-        if activated is not None:
-            query = query.filter(user_model.User.activated == true())
-        return query.first()
+        db_user = entity_loader.get(db, user_model.User, db_token.user_id)
+        if db_user is not None and (activated is None or db_user.activated):
+            return db_user
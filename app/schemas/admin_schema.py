@@ -0,0 +1,166 @@
+from typing import List
+from enum import Enum
+from pydantic import BaseModel
+
+
+class SlowQueryOrder(str, Enum):
+    TOTAL = 'total_ms'
+    P95 = 'p95_ms'
+    MAX = 'max_ms'
+    COUNT = 'count'
+
+
+class SlowQuery(BaseModel):
+    fingerprint: str
+    statement: str
+    count: int
+    total_ms: float
+    max_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    routes: List[str]
+    parameters: str | None = None
+    rowcount: int | None = None
+    explain: List[dict] | None = None
+    explained_at: float | None = None
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "fingerprint": "3f0c8c3a9d1e2b47",
+                    "statement": "SELECT items.id, items.name FROM items WHERE items.name LIKE ? LIMIT ? OFFSET ?",
+                    "count": 12,
+                    "total_ms": 2513.4,
+                    "max_ms": 402.1,
+                    "p50_ms": 180.3,
+                    "p95_ms": 390.6,
+                    "p99_ms": 402.1,
+                    "routes": ["/items"],
+                    "parameters": "{name_1: str, param_1: int, param_2: int}",
+                    "rowcount": 20,
+                    "explain": [{"id": 1, "select_type": "SIMPLE", "table": "items", "type": "ALL", "rows": 120000}],
+                    "explained_at": 1700000000.0
+                }
+            ]
+        }
+    }
+
+
+class ProfileKind(str, Enum):
+    REQUEST = 'request'
+    PROCESS = 'process'
+
+
+class Profile(BaseModel):
+    id: str
+    kind: ProfileKind
+    route: str | None = None
+    pid: int
+    started_at: float
+    duration_ms: float
+    samples: int
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "id": "0b8e5c1f2a7d4e6f9c3b1a2d4e6f8a0c",
+                    "kind": "request",
+                    "route": "/users/{user_id}",
+                    "pid": 12,
+                    "started_at": 1700000000.0,
+                    "duration_ms": 84.2,
+                    "samples": 16
+                }
+            ]
+        }
+    }
+
+
+class ProcessProfileStarted(BaseModel):
+    seconds: int
+    pid: int
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "seconds": 10,
+                    "pid": 12
+                }
+            ]
+        }
+    }
+
+
+class MemoryGroupBy(str, Enum):
+    LINENO = 'lineno'
+    FILENAME = 'filename'
+
+
+class MemoryTracing(BaseModel):
+    tracing: bool
+    pid: int
+    frames: int
+    traced_bytes: int
+    peak_bytes: int
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "tracing": True,
+                    "pid": 12,
+                    "frames": 1,
+                    "traced_bytes": 18350080,
+                    "peak_bytes": 20971520
+                }
+            ]
+        }
+    }
+
+
+class MemorySnapshot(BaseModel):
+    id: str
+    pid: int
+    taken_at: float
+    size_bytes: int
+    count: int
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "id": "5d0e4a8c1b2f4e6a9c7d3b1a0e2f4c6d",
+                    "pid": 12,
+                    "taken_at": 1700000000.0,
+                    "size_bytes": 18350080,
+                    "count": 120544
+                }
+            ]
+        }
+    }
+
+
+class MemoryStat(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+    size_diff_bytes: int | None = None
+    count_diff: int | None = None
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "location": "/usr/local/lib/python3.11/site-packages/sqlalchemy/orm/identity.py:135",
+                    "size_bytes": 2097152,
+                    "count": 8192,
+                    "size_diff_bytes": 1048576,
+                    "count_diff": 4096
+                }
+            ]
+        }
+    }
@@ -1,6 +1,7 @@
 from typing import List
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from schemas import user_schema
 
 
 class ItemCreate(BaseModel):
@@ -67,3 +68,80 @@ class ItemList(BaseModel):
     limit: int
     total: int
     items: List[Item]
+
+
+class ItemFilter(BaseModel):
+    # Items of user_id (the caller by default) whose name and description contain these values
+    name: str | None = None
+    description: str | None = None
+    user_id: int | None = None
+
+
+class ItemSelection(BaseModel):
+    ids: List[int] | None = None
+    filter: ItemFilter | None = None
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "ids": [1, 2, 3],
+                },
+                {
+                    "filter": {"name": "item"},
+                }
+            ]
+        }
+    }
+
+
+class ItemBulkUpdate(ItemSelection):
+    description: str
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "ids": [1, 2, 3],
+                    "description": "item description",
+                }
+            ]
+        }
+    }
+
+
+class ItemBulkResult(BaseModel):
+    id: int
+    status: int
+    detail: str | None = None
+
+
+class ItemBulkResponse(BaseModel):
+    # Items deleted or updated
+    count: int
+    # A filter matched more than BULK_MAX_ITEMS items: only the first ones were written
+    truncated: bool = False
+    results: List[ItemBulkResult]
+
+
+class ItemExpanded(Item):
+    # Owner of the item, with expand=user
+    user: user_schema.User | None = None
+
+
+class ItemShaped(BaseModel):
+    # Documented shape of the items read with fields= (only the requested fields are present) and expand=user
+    id: int | None = None
+    name: str | None = None
+    description: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    user_id: int | None = None
+    user: user_schema.User | None = None
+
+
+class ItemShapedList(BaseModel):
+    page: int
+    limit: int
+    total: int
+    items: List[ItemShaped]
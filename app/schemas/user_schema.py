@@ -97,3 +97,20 @@ class UserPublicInfoList(BaseModel):
     limit: int
     total: int
     users: List[User]
+
+
+class UserShaped(BaseModel):
+    # Documented shape of the users read with fields=: only the requested fields are present
+    id: int | None = None
+    username: str | None = None
+    role_id: int | None = None
+    activated: bool | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
+class UserShapedList(BaseModel):
+    page: int
+    limit: int
+    total: int
+    users: List[UserShaped]
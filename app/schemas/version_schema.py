@@ -17,3 +17,17 @@ class Version(BaseModel):
             ]
         }
     }
+
+
+class VersionUpdate(BaseModel):
+    supported: bool
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "supported": False
+                }
+            ]
+        }
+    }
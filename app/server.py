@@ -0,0 +1,130 @@
+"""
+Production entry point: a gunicorn master process preloading the app, then forking WORKERS uvicorn workers.
+
+- The app (routes, OpenAPI document, static files index, roles and versions) is loaded once in the master
+  before the fork, so this read-only state is shared copy-on-write by every worker
+- The schema check runs once, in the master, instead of once per worker
+- The crons run in a process of their own (CRON_ENABLED), spawned by the master once the workers are started
+- Workers are restarted after WORKER_MAX_REQUESTS requests (+ jitter so they do not all restart at once)
+
+Usage (from the app folder): python server.py
+"""
+import os
+import math
+import logging
+import multiprocessing
+from gunicorn.app.base import BaseApplication
+from uvicorn_worker import UvicornWorker
+import settings
+from utils import metrics_exporter
+
+logger = logging.getLogger()
+
+
+class Worker(UvicornWorker):
+    # Requests are already logged by AccessLogMiddleware
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "access_log": False}
+
+
+def available_cpus():
+    cpus = len(os.sched_getaffinity(0))
+    # A container is usually limited by a CFS quota rather than by the CPUs it can see
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            max_quota, period = f.read().split()
+            if max_quota != "max":
+                quota = int(max_quota) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f_quota, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f_period:
+                max_quota = int(f_quota.read())
+                if max_quota > 0:
+                    quota = max_quota / int(f_period.read())
+        except (OSError, ValueError):
+            pass
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def when_ready(server):
+    # A single cron process per pod, rather than one per worker: one lease candidate per pod
+    if server.app.cron_enabled:
+        from cron import runner
+        server.app.cron_process = multiprocessing.get_context("spawn").Process(target=runner.run, name="crons")
+        server.app.cron_process.start()
+
+
+def post_fork(server, worker):
+    from db import database
+    from utils import logging_config
+    # Connections opened by the master must not be shared with the workers
+    database.engine.dispose(close=False)
+    logging_config.after_fork()
+
+
+def child_exit(server, worker):
+    metrics_exporter.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    # The cron process releases its leases before exiting
+    if server.app.cron_process is not None:
+        server.app.cron_process.terminate()
+        server.app.cron_process.join(timeout=settings.env.WORKER_GRACEFUL_TIMEOUT)
+
+
+class Server(BaseApplication):
+
+    def __init__(self, options: dict):
+        self.options = options
+        self.cron_enabled = settings.env.CRON_ENABLED
+        self.cron_process = None
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Called once in the master because of preload_app
+        from db import database
+        from utils import cache, registry
+        import main
+
+        if isinstance(cache.backend, cache.MemoryBackend) and self.cfg.workers > 1 and cache.access_tokens.ttl:
+            # Logouts would only be applied by the worker handling them: the other ones would accept the token
+            # until its entry expires
+            logger.warning("Token cache disabled: CACHE_BACKEND=memory is not shared by the workers")
+            cache.access_tokens.ttl = 0
+        if database.prepare():
+            registry.preload()
+        main.get_openapi_document()
+        # Done once here, workers only warm up their own pool
+        settings.env.DB_CREATE_SCHEMA = False
+        settings.env.CRON_ENABLED = False
+        database.engine.dispose()
+        return main.app
+
+
+def options():
+    return {
+        "bind": f"0.0.0.0:{settings.env.APP_PORT}",
+        "workers": settings.env.WORKERS or available_cpus(),
+        "worker_class": Worker,
+        "preload_app": True,
+        "max_requests": settings.env.WORKER_MAX_REQUESTS,
+        "max_requests_jitter": settings.env.WORKER_MAX_REQUESTS_JITTER,
+        "graceful_timeout": settings.env.WORKER_GRACEFUL_TIMEOUT,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+        "on_exit": on_exit,
+    }
+
+
+if __name__ == "__main__":
+    # Before the app and its metrics are loaded: files of a previous run must not be aggregated
+    metrics_exporter.prepare_multiprocess_dir()
+    Server(options()).run()
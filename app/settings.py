@@ -11,8 +11,108 @@ class Settings(BaseSettings):
     DB_NAME: str = os.getenv("DB_NAME")
     DB_USER: str = os.getenv("DB_USER")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD")
+    # Replaces the MySQL database built from the DB_* variables, e.g. sqlite:////tmp/fastapi-loadtest.db for the load tests
+    DATABASE_URL: str = ""
+    # Create missing tables when the app starts (disable in production, where the schema is managed by database/*.sql)
+    DB_CREATE_SCHEMA: bool = True
+    DB_POOL_SIZE: int = 5
+    # Connection attempts when the app starts, the delay doubles after each failure
+    DB_STARTUP_RETRIES: int = 4
+    DB_STARTUP_RETRY_DELAY: float = 0.5
+    # Roles and versions are kept in memory and reloaded after this many seconds
+    REGISTRY_TTL: int = 60
+    # Send a Server-Timing header (db, app and serialization durations) with the responses of the API routes
+    SERVER_TIMING_ENABLED: bool = False
+    # Log a warning when a request executes more SQL statements than this (0 to disable)
+    DB_QUERY_ALARM_THRESHOLD: int = 0
+    # Statements slower than this are logged and aggregated on GET /admin/slow-queries (0 to disable)
+    SLOW_QUERY_THRESHOLD_MS: float = 100
+    SLOW_QUERY_MAX_FINGERPRINTS: int = 200
+    # Durations kept per fingerprint to compute percentiles
+    SLOW_QUERY_RESERVOIR_SIZE: int = 100
+    # Share of slow SELECT statements explained in the background, at most once per fingerprint and interval (seconds)
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.1
+    SLOW_QUERY_EXPLAIN_INTERVAL: int = 300
+    # Allow admins to profile a request with the x-profile: 1 header (endpoints are not wrapped at all when disabled)
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_INTERVAL_MS: float = 5
+    PROFILING_MAX_SECONDS: int = 60
+    # Shared by the workers of a pod, only the most recent profiles are kept
+    PROFILING_DIR: str = "/tmp/fastapi-profiles"
+    PROFILING_MAX_PROFILES: int = 50
+    MEMORY_PROFILING_MAX_SNAPSHOTS: int = 5
+    # Export the memory allocated by each route, tracemalloc is started with the app (slows down allocations)
+    MEMORY_ROUTE_METRICS_ENABLED: bool = False
+    # Disabled in the workers started by server.py: crons run once, in the master process
+    CRON_ENABLED: bool = True
+    # A cron job runs in the process holding its lease (leases table), renewed every CRON_LEASE_RENEW_INTERVAL seconds.
+    # When the holder dies, another process takes the job over once the lease expires
+    CRON_LEASE_TTL: int = 60
+    CRON_LEASE_RENEW_INTERVAL: int = 20
+    # Worker processes started by server.py (0: one per CPU available to the container)
+    WORKERS: int = 0
+    # Workers are restarted after this many requests (+ random jitter) to contain memory growth (0 to disable)
+    WORKER_MAX_REQUESTS: int = 10000
+    WORKER_MAX_REQUESTS_JITTER: int = 1000
+    WORKER_GRACEFUL_TIMEOUT: int = 30
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    RESPONSE_CACHE_TTL_ROLES: int = 300
+    RESPONSE_CACHE_TTL_VERSIONS: int = 60
+    RESPONSE_CACHE_TTL_USERS: int = 30
+    # Identical concurrent GET requests on the read routes of utils/single_flight.py share a single execution
+    SINGLE_FLIGHT_ENABLED: bool = True
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_MEDIA_TYPES: str = "application/json,application/javascript,text/html,text/css,text/plain,image/svg+xml"
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_THREADPOOL_MIN_SIZE: int = 65536
+    STATIC_MAX_AGE: int = 86400
+    # Static files up to this size are kept in memory, bigger ones are streamed from disk
+    STATIC_MEMORY_MAX_FILE_SIZE: int = 262144
+    THREADPOOL_SIZE: int = 40
+    # Reject requests that waited longer than this for a thread (0 to disable)
+    THREADPOOL_MAX_QUEUE_WAIT_MS: int = 0
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000
+    # Share of access logs kept per status class, e.g. "2xx=0.01,5xx=1". Missing classes are always logged
+    ACCESS_LOG_SAMPLE_RATES: str = ""
+    # Successful Basic auth checks on the docs endpoints are remembered for this many seconds (0 to disable)
+    DOCS_CREDENTIALS_CACHE_TTL: int = 300
+    # "memory": entries and invalidations stay in each worker. "redis": shared by the workers and pods through CACHE_REDIS_URL
+    CACHE_BACKEND: str = "memory"
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_REDIS_TIMEOUT: float = 1
+    CACHE_KEY_PREFIX: str = "fastapi"
+    CACHE_MAX_ENTRIES: int = 10000
+    # Users of valid access tokens are remembered for this many seconds (0 to disable). Only applied with the memory
+    # backend when there is a single worker: a logout would not be seen by the other workers
+    TOKEN_CACHE_TTL: int = 30
+    # Token buckets per client (access token, or IP): requests per second and burst, a rate of 0 disables the rule
+    RATE_LIMIT_ENABLED: bool = True
+    # "memory": buckets of each worker. "redis": buckets shared by the workers and pods through CACHE_REDIS_URL
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_MAX_KEYS: int = 10000
+    RATE_LIMIT_DEFAULT_RATE: float = 20
+    RATE_LIMIT_DEFAULT_BURST: int = 40
+    # GET /items filtered by name or description (ILIKE scans)
+    RATE_LIMIT_SEARCH_RATE: float = 2
+    RATE_LIMIT_SEARCH_BURST: int = 10
+    # POST /auth/token and /auth/refresh (bcrypt)
+    RATE_LIMIT_AUTH_RATE: float = 1
+    RATE_LIMIT_AUTH_BURST: int = 10
+    # Identify anonymous clients by the last X-Forwarded-For entry (only behind a reverse proxy setting it)
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False
+    # Authenticated clients sharing an IP (NAT, egress proxy) that each get their full rate: the requests sent with
+    # any token from an IP are also limited to this many times the rate of the rule
+    RATE_LIMIT_TOKENS_PER_IP: int = 20
+    # Bulk writes on /items: items per request, and items per DELETE/UPDATE statement (size of its IN list)
+    BULK_MAX_ITEMS: int = 1000
+    BULK_CHUNK_SIZE: int = 200
 
 
 load_dotenv()
 env = Settings()
-SQLALCHEMY_DATABASE_URL = f"mysql+mysqlconnector://{env.DB_USER}:{env.DB_PASSWORD}@{env.DB_HOST}:{env.DB_PORT}/{env.DB_NAME}?autocommit=true&charset=utf8mb4"
+SQLALCHEMY_DATABASE_URL = env.DATABASE_URL or f"mysql+mysqlconnector://{env.DB_USER}:{env.DB_PASSWORD}@{env.DB_HOST}:{env.DB_PORT}/{env.DB_NAME}?autocommit=true&charset=utf8mb4"
@@ -0,0 +1,35 @@
+import os
+import pytest
+from benchmarks import micro
+
+
+# Slow and machine dependent: only run on demand, e.g. RUN_BENCHMARKS=1 BENCHMARK_BACKEND=mysql python -m pytest test/test_benchmarks.py
+pytestmark = pytest.mark.skipif(not os.getenv("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run the micro-benchmarks")
+
+BACKEND = os.getenv("BENCHMARK_BACKEND", "sqlite")
+
+
+@pytest.fixture(scope="module")
+def context():
+    context = micro.Context(BACKEND)
+    yield context
+    context.close()
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    return micro.load_baseline()
+
+
+@pytest.mark.parametrize("name", list(micro.BENCHMARKS))
+def test_benchmark(name, context, baseline):
+    expected = baseline.get(BACKEND, {}).get(name)
+    if expected is None:
+        pytest.skip(f"No {BACKEND} baseline for {name}: run python -m benchmarks.micro --backend {BACKEND} --update-baseline")
+    tolerance = float(os.getenv("BENCHMARK_TOLERANCE", baseline.get("tolerance", micro.DEFAULT_TOLERANCE)))
+
+    result = micro.run(micro.BENCHMARKS[name], context, baseline=expected, tolerance=tolerance)
+
+    # Check the function did not get slower than the baseline (relative to the speed of the machine)
+    assert not micro.is_regression(result, expected, tolerance), \
+        f"{name}: {result['relative']} vs {expected['relative']} in the baseline ({result['us']} us/op), more than {tolerance:.0%} slower"
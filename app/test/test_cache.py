@@ -0,0 +1,62 @@
+import json
+from fastapi.testclient import TestClient
+from main import app
+from utils import cache
+
+
+client = TestClient(app)
+
+
+class ReconnectingBackend(cache.MemoryBackend):
+    # Memory backend whose subscription can be dropped and restored, like a Redis one
+    def subscribe(self, channel: str, callback, on_reconnect=None):
+        super().subscribe(channel, callback, on_reconnect)
+        self.on_reconnect = on_reconnect
+
+
+def build_bus():
+    bus = cache.InvalidationBus(ReconnectingBackend(100), "invalidations")
+    received = []
+    bus.subscribe("items", received.append)
+    bus.start()
+    return bus, received
+
+
+def test_logout_evicts_token(monkeypatch):
+    monkeypatch.setattr(cache.access_tokens, "ttl", 30)
+    response = client.post("/auth/token", headers={'x-version': '1.0'}, json={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    headers = {'x-version': '1.0', 'Authorization': f"Bearer {token}"}
+
+    assert client.get("/items", headers=headers).status_code == 200
+    assert cache.access_tokens.get(token) is not None
+
+    # Check a logged out token is neither cached nor accepted anymore
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert cache.access_tokens.get(token) is None
+    assert client.get("/items", headers=headers).status_code == 401
+
+
+def test_remote_invalidation_applied():
+    bus, received = build_bus()
+
+    # Check a message published by another process is dispatched to the handlers of its topic
+    bus.receive(json.dumps({"origin": "other", "topic": "items", "key": 1}))
+    assert received == [1]
+
+
+def test_own_invalidation_ignored():
+    bus, received = build_bus()
+
+    # Check a published invalidation is applied once: at once, not again when received from the backend
+    bus.publish("items", 1)
+    assert received == [1]
+
+
+def test_reconnect_flushes():
+    bus, received = build_bus()
+
+    # Check the whole topic is invalidated after a reconnection: messages may have been lost meanwhile
+    bus.backend.on_reconnect()
+    assert received == [None]
@@ -0,0 +1,63 @@
+import json
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+from utils import compression, etags
+from utils.static_files import CachedStaticFiles
+
+CONTENT = json.dumps({"items": [{"id": index, "name": f"item {index}"} for index in range(200)]}).encode('utf8')
+ETAG = etags.compute_content(CONTENT)
+precompressed = compression.PrecompressedBody(CONTENT, "application/json")
+
+
+async def dynamic(request: Request):
+    if etags.is_not_modified(request, ETAG):
+        return etags.not_modified(ETAG)
+    return Response(CONTENT, media_type="application/json", headers={"etag": ETAG})
+
+
+async def static(request: Request):
+    return precompressed.response(request)
+
+
+app = Starlette(routes=[Route("/dynamic", dynamic), Route("/static", static)])
+app.add_middleware(compression.CompressionMiddleware)
+client = TestClient(app)
+
+
+def test_etag_per_encoding():
+    for path in ("/dynamic", "/static"):
+        responses = {encoding: client.get(path, headers={"Accept-Encoding": encoding}) for encoding in ("identity", "gzip", "br")}
+        # Check each content-coding has its own strong ETag
+        assert responses["identity"].headers["etag"] == ETAG
+        assert responses["gzip"].headers["content-encoding"] == "gzip"
+        assert responses["gzip"].headers["etag"] == etags.with_encoding(ETAG, "gzip")
+        assert responses["br"].headers["content-encoding"] == "br"
+        assert responses["br"].headers["etag"] == etags.with_encoding(ETAG, "br")
+
+
+def test_not_modified_per_encoding():
+    for path in ("/dynamic", "/static"):
+        for encoding in ("gzip", "br"):
+            etag = etags.with_encoding(ETAG, encoding)
+            # Check the ETag of a compressed representation validates the resource, and is sent back with the 304
+            response = client.get(path, headers={"Accept-Encoding": encoding, "If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.headers["etag"] == etag
+
+
+def test_range_not_compressed(tmp_path):
+    content = b"".join(b".item-%d { color: red; }\n" % index for index in range(100000))
+    (tmp_path / "style.css").write_bytes(content)
+    # Streamed from the disk: bigger than the files kept in memory
+    static_app = compression.CompressionMiddleware(CachedStaticFiles(directory=str(tmp_path), max_memory_size=1024))
+    static_client = TestClient(static_app)
+
+    # Check a range of a compressible file is sent as bytes of the file, not compressed
+    response = static_client.get("/style.css", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-5000"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-range"] == f"bytes 0-5000/{len(content)}"
+    assert response.content == content[:5001]
@@ -0,0 +1,234 @@
+import uuid
+import pytest
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from main import app
+import settings
+from api import item_routes
+from crud import item_crud, user_crud
+from db.database import SessionLocal
+from schemas import item_schema
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def headers():
+    response = client.post("/auth/token", headers={'x-version': '1.0'}, json={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    return {
+        'Content-Type': 'application/json',
+        'x-version': '1.0',
+        'Authorization': f"Bearer {response.json()['access_token']}"
+    }
+
+
+@pytest.fixture(scope="module")
+def user_headers():
+    db = SessionLocal()
+    try:
+        db_user = user_crud.create_user(db, SimpleNamespace(username=f"u{uuid.uuid4().hex[:8]}", role_id=2, password="test"))
+        username = db_user.username
+    finally:
+        db.close()
+    response = client.post("/auth/token", headers={'x-version': '1.0'}, json={"username": username, "password": "test"})
+    assert response.status_code == 200
+    return {
+        'Content-Type': 'application/json',
+        'x-version': '1.0',
+        'Authorization': f"Bearer {response.json()['access_token']}"
+    }
+
+
+def create_item(headers, name: str = None):
+    response = client.post("/items", headers=headers, json={"name": name or f"test-{uuid.uuid4().hex}", "description": "test"})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_get_item_etag(headers):
+    item = create_item(headers)
+
+    response = client.get(f"/items/{item['id']}", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers.get("etag")
+    assert etag
+
+    # Check a conditional GET with the same ETag returns an empty HTTP 304
+    response = client.get(f"/items/{item['id']}", headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers.get("etag") == etag
+    assert not response.content
+
+
+def test_update_item_if_match(headers):
+    item = create_item(headers)
+    etag = client.get(f"/items/{item['id']}", headers=headers).headers["etag"]
+
+    response = client.patch(f"/items/{item['id']}", headers={**headers, 'If-Match': etag}, json={"description": "first"})
+    assert response.status_code == 200
+    # Check two writes within the same second get different ETags
+    new_etag = response.headers["etag"]
+    assert new_etag != etag
+    response = client.patch(f"/items/{item['id']}", headers={**headers, 'If-Match': new_etag}, json={"description": "second"})
+    assert response.status_code == 200
+    assert response.headers["etag"] != new_etag
+
+    # Check a write based on an outdated version is rejected
+    response = client.patch(f"/items/{item['id']}", headers={**headers, 'If-Match': etag}, json={"description": "lost"})
+    assert response.status_code == 412
+    assert client.get(f"/items/{item['id']}", headers=headers).json()["description"] == "second"
+
+
+def test_update_item_concurrent_write(headers):
+    item = create_item(headers)
+    db = SessionLocal()
+    try:
+        version = item_crud.get_item_version(db, item['id']).version
+        # Written by another request after the If-Match check
+        assert item_crud.update_item(db, item['id'], item_schema.ItemUpdate(description="other"))
+        # Check the conditional update does not overwrite it
+        assert item_crud.update_item(db, item['id'], item_schema.ItemUpdate(description="lost"), version=version) is None
+        assert item_crud.get_item(db, item['id']).description == "other"
+    finally:
+        db.close()
+
+
+def test_update_deleted_item(headers, monkeypatch):
+    item = create_item(headers)
+    update_item = item_crud.update_item
+
+    def delete_then_update(db, item_id, item, version=None):
+        # Deleted by another request after the item was read
+        item_crud.delete_items(db, {item_id: item_crud.get_item_version(db, item_id).version})
+        return update_item(db, item_id, item, version)
+
+    monkeypatch.setattr(item_crud, "update_item", delete_then_update)
+    # Check an unconditional update of a deleted item is a HTTP 404, not a failed precondition
+    response = client.patch(f"/items/{item['id']}", headers=headers, json={"description": "lost"})
+    assert response.status_code == 404
+
+
+def test_bulk_results(headers, user_headers):
+    own_item = create_item(user_headers)
+    admin_item = create_item(headers)
+
+    # Check each listed id gets its own result
+    response = client.patch("/items", headers=user_headers, json={"ids": [own_item['id'], admin_item['id'], 0], "description": "bulk"})
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
+    assert [(result["id"], result["status"]) for result in response.json()["results"]] == [(own_item['id'], 200), (admin_item['id'], 403), (0, 404)]
+    assert client.get(f"/items/{own_item['id']}", headers=headers).json()["description"] == "bulk"
+    assert client.get(f"/items/{admin_item['id']}", headers=headers).json()["description"] == "test"
+
+    response = client.request("DELETE", "/items", headers=user_headers, json={"ids": [own_item['id'], admin_item['id']]})
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
+    assert [result["status"] for result in response.json()["results"]] == [200, 403]
+    assert client.get(f"/items/{own_item['id']}", headers=headers).status_code == 404
+
+
+@pytest.mark.parametrize("selection", [{}, {"ids": [1], "filter": {"name": "test"}}, {"filter": {}}])
+def test_bulk_invalid_selection(headers, selection):
+    # Check a bulk write selects items either by ids or by a non-empty filter
+    response = client.request("DELETE", "/items", headers=headers, json=selection)
+    assert response.status_code == 400
+
+
+def test_bulk_too_many_ids(headers, monkeypatch):
+    monkeypatch.setattr(settings.env, "BULK_MAX_ITEMS", 2)
+    response = client.request("DELETE", "/items", headers=headers, json={"ids": [1, 2, 3]})
+    assert response.status_code == 400
+
+
+def test_bulk_filter_truncated(headers, monkeypatch):
+    monkeypatch.setattr(settings.env, "BULK_MAX_ITEMS", 2)
+    prefix = f"bulk-{uuid.uuid4().hex}"
+    for index in range(3):
+        create_item(headers, f"{prefix}-{index}")
+
+    # Check a filter matching more items than allowed only writes the first ones, until no item is left
+    response = client.patch("/items", headers=headers, json={"filter": {"name": prefix}, "description": "bulk"})
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+    assert response.json()["truncated"]
+    response = client.patch("/items", headers=headers, json={"filter": {"name": prefix}, "description": "bulk"})
+    assert response.json()["count"] == 1
+    assert not response.json()["truncated"]
+
+
+def test_bulk_concurrent_write(headers):
+    items = [create_item(headers) for _ in range(2)]
+    db = SessionLocal()
+    try:
+        admin = SimpleNamespace(id=1)
+
+        def write(db, versions):
+            # Written by another request after the owners were checked
+            item_crud.update_item(db, items[0]['id'], item_schema.ItemUpdate(description="other"))
+            return item_crud.update_items(db, versions, "bulk")
+
+        count, results = item_routes._bulk_write(
+            db, [item['id'] for item in items], admin, True, write=write,
+            is_written=lambda row, version: row is not None and row.version > version and row.description == "bulk"
+        )
+        # Check the results match the rows actually written
+        assert count == 1
+        assert [result.status for result in results] == [412, 200]
+        assert item_crud.get_item(db, items[0]['id']).description == "other"
+    finally:
+        db.close()
+
+
+def test_item_fields(headers):
+    item = create_item(headers)
+
+    # Check only the requested fields are returned, in the order of the schema
+    response = client.get(f"/items/{item['id']}?fields=name,id", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"id": item['id'], "name": item['name']}
+    response = client.get(f"/items?name={item['name']}&fields=id", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["items"] == [{"id": item['id']}]
+
+
+@pytest.mark.parametrize("fields", ["unknown", "id,unknown", ","])
+def test_item_invalid_fields(headers, fields):
+    item = create_item(headers)
+    assert client.get(f"/items/{item['id']}?fields={fields}", headers=headers).status_code == 400
+    assert client.get(f"/items?fields={fields}", headers=headers).status_code == 400
+
+
+def test_item_expand_user(headers):
+    item = create_item(headers)
+
+    # Check the owner is embedded after the item fields, sparse fieldsets included
+    response = client.get(f"/items/{item['id']}?expand=user", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["user_id"] == 1
+    assert response.json()["user"]["id"] == 1
+    assert response.json()["user"]["username"] == "admin"
+    assert "hashed_password" not in response.json()["user"]
+    response = client.get(f"/items?name={item['name']}&fields=id&expand=user", headers=headers)
+    assert response.status_code == 200
+    assert [(item_json["id"], item_json["user"]["username"]) for item_json in response.json()["items"]] == [(item['id'], "admin")]
+    assert list(response.json()["items"][0]) == ["id", "user"]
+
+
+@pytest.mark.parametrize("expand", ["owner", "user,owner", ","])
+def test_item_invalid_expand(headers, expand):
+    assert client.get(f"/items?expand={expand}", headers=headers).status_code == 400
+
+
+def test_item_shapes_documented():
+    document = app.openapi()
+    schemas = document["components"]["schemas"]
+
+    # Check the OpenAPI document describes the embedded owner and the sparse shapes (every field optional)
+    response = document["paths"]["/items/{item_id}"]["get"]["responses"]["200"]
+    assert response["content"]["application/json"]["schema"]["$ref"].endswith("/ItemShaped")
+    assert "user" in schemas["ItemShaped"]["properties"]
+    assert not schemas["ItemShaped"].get("required")
+    response = document["paths"]["/items"]["get"]["responses"]["200"]
+    assert response["content"]["application/json"]["schema"]["$ref"].endswith("/ItemShapedList")
@@ -0,0 +1,62 @@
+import uuid
+import pytest
+from cron import leader
+from crud import lease_crud
+from db.database import SessionLocal
+
+
+@pytest.fixture()
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_lease_held_by_one_holder(db):
+    name = f"test-{uuid.uuid4().hex}"
+
+    # Check the first holder takes the lease and keeps renewing it, while the others are refused
+    assert lease_crud.acquire(db, name, "first", ttl=60)
+    assert not lease_crud.acquire(db, name, "second", ttl=60)
+    assert lease_crud.acquire(db, name, "first", ttl=60)
+    assert not lease_crud.acquire(db, name, "second", ttl=60)
+
+
+def test_expired_lease_taken_over(db):
+    name = f"test-{uuid.uuid4().hex}"
+
+    # Check another holder takes the lease over once it expired, and the former holder then loses it
+    assert lease_crud.acquire(db, name, "first", ttl=-1)
+    assert lease_crud.acquire(db, name, "second", ttl=60)
+    assert not lease_crud.acquire(db, name, "first", ttl=60)
+
+
+def test_released_lease_taken_over(db):
+    name = f"test-{uuid.uuid4().hex}"
+
+    assert lease_crud.acquire(db, name, "first", ttl=60)
+    # Check a lease is only released by its holder
+    lease_crud.release(db, name, "second")
+    assert not lease_crud.acquire(db, name, "second", ttl=60)
+    lease_crud.release(db, name, "first")
+    assert lease_crud.acquire(db, name, "second", ttl=60)
+
+
+def test_job_only_run_by_leader():
+    name = f"test-{uuid.uuid4().hex}"
+    runs = []
+    first, second = leader.LeaderElection(60), leader.LeaderElection(60)
+
+    # Check only the process holding the lease of a job runs it, until it releases its leases
+    for election in (first, second):
+        if election.acquire(name):
+            runs.append(election.holder)
+    assert runs == [first.holder]
+    assert first.held == {name}
+    assert second.held == set()
+
+    first.release_all()
+    assert second.acquire(name)
+    assert not first.acquire(name)
@@ -0,0 +1,28 @@
+import queue
+import logging
+from utils import logging_config
+
+
+def prepare(msg: str, *args):
+    handler = logging_config.DroppingQueueHandler(queue.Queue())
+    return handler.prepare(logging.LogRecord("test", logging.INFO, __file__, 0, msg, args, None))
+
+
+def test_immutable_args_deferred():
+    # Check immutable arguments are left to the listener thread
+    record = prepare("%s %d", "item", 1)
+    assert record.args == ("item", 1)
+    record = prepare("%(name)s %(id)d", {"name": "item", "id": 1})
+    assert record.args == {"name": "item", "id": 1}
+
+
+def test_mutable_args_formatted():
+    # Check mutable arguments are formatted in the calling thread, mappings included
+    values = ["item"]
+    record = prepare("%s", values)
+    values.append("changed")
+    assert record.getMessage() == "['item']"
+    values = {"names": ["item"]}
+    record = prepare("%(names)s", values)
+    values["names"].append("changed")
+    assert record.getMessage() == "['item']"
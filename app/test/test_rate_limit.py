@@ -0,0 +1,78 @@
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+import settings
+from utils import cache, rate_limit
+
+
+def build_client(burst: int = 2):
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/items", ok)])
+    rules = [rate_limit.RateLimitRule("test", None, r"^/items$", rate=0.5, burst=burst)]
+    app.add_middleware(rate_limit.RateLimitMiddleware, store=rate_limit.MemoryBucketStore(100), rate_limit_rules=rules)
+    return TestClient(app)
+
+
+def test_rate_limit_headers():
+    client = build_client()
+
+    response = client.get("/items")
+    # Check the limit and the remaining requests are sent with the response
+    assert response.status_code == 200
+    assert response.headers["x-ratelimit-limit"] == "2"
+    assert response.headers["x-ratelimit-remaining"] == "1"
+    assert int(response.headers["x-ratelimit-reset"]) >= 1
+
+
+def test_rate_limit_exceeded():
+    client = build_client()
+
+    assert client.get("/items").status_code == 200
+    assert client.get("/items").status_code == 200
+
+    # Check the request beyond the burst is rejected with a HTTP 429 and a Retry-After
+    response = client.get("/items")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests: Please retry later"}
+    assert response.headers["retry-after"] == "2"
+    assert response.headers["x-ratelimit-remaining"] == "0"
+
+
+def test_rate_limit_forwarded_for(monkeypatch):
+    monkeypatch.setattr(settings.env, "RATE_LIMIT_TRUST_FORWARDED_FOR", True)
+    client = build_client(burst=1)
+
+    # Check clients behind the same proxy get their own buckets
+    assert client.get("/items", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 200
+    assert client.get("/items", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
+    assert client.get("/items", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 429
+    # Check the entries sent by the client are ignored: the last one is set by the proxy
+    assert client.get("/items", headers={"X-Forwarded-For": "10.0.0.3, 10.0.0.1"}).status_code == 429
+
+
+def test_rate_limit_per_token(monkeypatch):
+    # Tokens are not looked up: the token cache is off with several workers and the memory backend
+    monkeypatch.setattr(cache.access_tokens, "ttl", 0)
+    client = build_client(burst=1)
+
+    # Check the clients sharing an IP get a bucket per access token, apart from the anonymous ones
+    assert client.get("/items", headers={"Authorization": "Bearer first"}).status_code == 200
+    assert client.get("/items", headers={"Authorization": "Bearer second"}).status_code == 200
+    assert client.get("/items").status_code == 200
+    assert client.get("/items", headers={"Authorization": "Bearer first"}).status_code == 429
+    assert client.get("/items").status_code == 429
+
+
+def test_rate_limit_tokens_per_ip(monkeypatch):
+    monkeypatch.setattr(settings.env, "RATE_LIMIT_TOKENS_PER_IP", 2)
+    client = build_client(burst=1)
+
+    # Check random tokens do not get an IP more than RATE_LIMIT_TOKENS_PER_IP buckets
+    assert client.get("/items", headers={"Authorization": "Bearer first"}).status_code == 200
+    assert client.get("/items", headers={"Authorization": "Bearer second"}).status_code == 200
+    response = client.get("/items", headers={"Authorization": "Bearer third"})
+    assert response.status_code == 429
+    assert response.headers["x-ratelimit-limit"] == "2"
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+from main import app
+
+
+client = TestClient(app)
+
+
+def test_list_roles_etag():
+
+    headers = {
+        'Content-Type': 'application/json',
+        'x-version': '1.0'
+    }
+
+    response = client.get("/roles", headers=headers)
+    # Check response code is the expected one
+    assert response.status_code == 200
+    # Check an ETag is returned
+    etag = response.headers.get("etag")
+    assert etag
+
+    # Check a conditional GET with the same ETag returns an empty HTTP 304
+    headers['If-None-Match'] = etag
+    response = client.get("/roles", headers=headers)
+    assert response.status_code == 304
+    assert response.headers.get("etag") == etag
+    assert not response.content
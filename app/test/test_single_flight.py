@@ -0,0 +1,136 @@
+import asyncio
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+from main import app as main_app
+from utils import cache, single_flight
+
+
+def build_app(status_code: int = 200, authorization: str = single_flight.AUTH_PUBLIC, token_check=None):
+    calls = []
+
+    async def slow(request):
+        calls.append(request.url.query)
+        await asyncio.sleep(0.1)
+        return PlainTextResponse(request.url.query, status_code=status_code)
+
+    app = Starlette(routes=[Route("/slow", slow)])
+    rules = [single_flight.SingleFlightRule("test", r"^/slow$", authorization)]
+    app.add_middleware(single_flight.SingleFlightMiddleware, single_flight_rules=rules, token_check=token_check)
+    return app, calls
+
+
+async def get_concurrently(app, *urls, tokens=()):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await asyncio.gather(*(client.get(url, headers={"Authorization": f"Bearer {token}"} if token else None) for url, token in zip(urls, tokens or [None] * len(urls))))
+
+
+def test_identical_requests_coalesced():
+    app, calls = build_app()
+
+    # Check concurrent identical requests (query strings in any order) run the route once and get its response
+    responses = asyncio.run(get_concurrently(app, "/slow?a=1&b=2", "/slow?b=2&a=1", "/slow?a=1&b=2"))
+    assert len(calls) == 1
+    assert [(response.status_code, response.text) for response in responses] == [(200, "a=1&b=2")] * 3
+
+
+def test_different_requests_not_coalesced():
+    app, calls = build_app()
+
+    responses = asyncio.run(get_concurrently(app, "/slow?a=1", "/slow?a=2"))
+    assert len(calls) == 2
+    assert [response.text for response in responses] == ["a=1", "a=2"]
+
+
+def test_sequential_requests_not_coalesced():
+    app, calls = build_app()
+
+    # Check a request arriving after the leader completed starts a new flight
+    asyncio.run(get_concurrently(app, "/slow"))
+    asyncio.run(get_concurrently(app, "/slow"))
+    assert len(calls) == 2
+
+
+def test_server_errors_not_shared():
+    app, calls = build_app(status_code=503)
+
+    # Check the waiters of a failed leader run the route on their own
+    responses = asyncio.run(get_concurrently(app, "/slow", "/slow"))
+    assert len(calls) == 2
+    assert [response.status_code for response in responses] == [503, 503]
+
+
+def test_anonymous_requests_not_coalesced():
+    app, calls = build_app(authorization=single_flight.AUTH_USER)
+
+    # Check requests without a known token run on their own, to get their own 401
+    asyncio.run(get_concurrently(app, "/slow", "/slow"))
+    assert len(calls) == 2
+
+
+def test_authenticated_requests_coalesced():
+    checked = []
+
+    def token_check(token):
+        checked.append(token)
+        return token != "invalid"
+
+    app, calls = build_app(authorization=single_flight.AUTH_USER, token_check=token_check)
+
+    # Check requests with different tokens share a flight without the token cache, each waiter's token being checked
+    responses = asyncio.run(get_concurrently(app, "/slow", "/slow", "/slow", tokens=["leader", "valid", "invalid"]))
+    assert len(calls) == 2
+    assert sorted(checked) == ["invalid", "valid"]
+    assert [response.status_code for response in responses] == [200, 200, 200]
+
+
+def test_unauthorized_leader_not_shared():
+    app, calls = build_app(status_code=401, authorization=single_flight.AUTH_USER, token_check=lambda token: True)
+
+    # Check the rejection of the leader's token is not sent to the waiters
+    asyncio.run(get_concurrently(app, "/slow", "/slow", tokens=["invalid", "valid"]))
+    assert len(calls) == 2
+
+
+def test_waiters_not_held_by_leader_client():
+    app, calls = build_app()
+    leader_client = asyncio.Event()
+
+    def request_scope():
+        return {"type": "http", "method": "GET", "path": "/slow", "query_string": b"", "headers": [], "root_path": ""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def slow_send(message):
+        # The client of the leader reads its response slowly
+        if message["type"] == "http.response.body":
+            await leader_client.wait()
+
+    async def run():
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        leader = asyncio.create_task(app(request_scope(), receive, slow_send))
+        await asyncio.sleep(0.01)
+        # Check the waiter is answered once the response is complete, while the leader is still sending it
+        await asyncio.wait_for(app(request_scope(), receive, send), timeout=1)
+        leader_client.set()
+        await leader
+        return messages
+
+    messages = asyncio.run(run())
+    assert len(calls) == 1
+    assert messages[0]["status"] == 200
+
+
+def test_token_check_without_cache(monkeypatch):
+    monkeypatch.setattr(cache.access_tokens, "ttl", 0)
+    response = TestClient(main_app).post("/auth/token", headers={'x-version': '1.0'}, json={"username": "admin", "password": "admin"})
+    # Check tokens are checked against the database when the token cache is off
+    assert single_flight.is_token_valid(response.json()["access_token"])
+    assert not single_flight.is_token_valid("invalid")
@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+from utils import compression
+from utils.static_files import CachedStaticFiles
+
+CONTENT = b"".join(b".item-%d { color: red; }\n" % index for index in range(20000))
+
+
+@pytest.fixture()
+def directory(tmp_path):
+    (tmp_path / "style.css").write_bytes(CONTENT)
+    return str(tmp_path)
+
+
+# Kept in memory (precompressed) and streamed from the disk
+@pytest.mark.parametrize("max_memory_size", [len(CONTENT), 1024])
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_range_never_encoded(directory, max_memory_size, encoding):
+    client = TestClient(compression.CompressionMiddleware(CachedStaticFiles(directory=directory, max_memory_size=max_memory_size)))
+
+    # Check a range is sent as bytes of the file, whatever the encodings accepted
+    response = client.get("/style.css", headers={"Accept-Encoding": encoding, "Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == CONTENT[100:200]
+
+    # Check the full response of the same URL is the one encoded
+    response = client.get("/style.css", headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == CONTENT
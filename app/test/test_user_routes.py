@@ -0,0 +1,89 @@
+import uuid
+import pytest
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from main import app
+from crud import user_crud
+from db.database import SessionLocal
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def headers():
+    response = client.post("/auth/token", headers={'x-version': '1.0'}, json={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    return {
+        'Content-Type': 'application/json',
+        'x-version': '1.0',
+        'Authorization': f"Bearer {response.json()['access_token']}"
+    }
+
+
+@pytest.fixture()
+def user():
+    db = SessionLocal()
+    try:
+        db_user = user_crud.create_user(db, SimpleNamespace(username=f"u{uuid.uuid4().hex[:8]}", role_id=2, password="test"))
+        return {"id": db_user.id, "username": db_user.username}
+    finally:
+        db.close()
+
+
+def test_get_user_etag(user):
+    headers = {'x-version': '1.0'}
+
+    response = client.get(f"/users/{user['id']}", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers.get("etag")
+    assert etag
+
+    # Check a conditional GET with the same ETag returns an empty HTTP 304
+    response = client.get(f"/users/{user['id']}", headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers.get("etag") == etag
+    assert not response.content
+
+
+def test_update_user_if_match(headers, user):
+    etag = client.get(f"/users/{user['id']}", headers={'x-version': '1.0'}).headers["etag"]
+
+    response = client.patch(f"/users/{user['id']}", headers={**headers, 'If-Match': etag}, json={"username": f"u{uuid.uuid4().hex[:8]}"})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    # Check a write based on an outdated version is rejected
+    response = client.patch(f"/users/{user['id']}", headers={**headers, 'If-Match': etag}, json={"username": f"u{uuid.uuid4().hex[:8]}"})
+    assert response.status_code == 412
+
+
+def test_user_fields(user):
+    headers = {'x-version': '1.0'}
+
+    # Check only the requested fields are returned, in the order of the schema
+    response = client.get(f"/users/{user['id']}?fields=username,id", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"id": user['id'], "username": user['username']}
+    response = client.get(f"/users?username={user['username']}&fields=username", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["users"] == [{"username": user['username']}]
+
+
+def test_user_invalid_fields(user):
+    headers = {'x-version': '1.0'}
+    # Check the fields which are not public are rejected too
+    for fields in ("unknown", "id,hashed_password", ","):
+        assert client.get(f"/users/{user['id']}?fields={fields}", headers=headers).status_code == 400
+        assert client.get(f"/users?fields={fields}", headers=headers).status_code == 400
+
+
+def test_user_shapes_documented():
+    document = app.openapi()
+
+    # Check the OpenAPI document describes the sparse shapes (every field optional)
+    response = document["paths"]["/users/{user_id}"]["get"]["responses"]["200"]
+    assert response["content"]["application/json"]["schema"]["$ref"].endswith("/UserShaped")
+    assert not document["components"]["schemas"]["UserShaped"].get("required")
+    response = document["paths"]["/users"]["get"]["responses"]["200"]
+    assert response["content"]["application/json"]["schema"]["$ref"].endswith("/UserShapedList")
@@ -0,0 +1,37 @@
+from fastapi.testclient import TestClient
+from main import app
+
+
+client = TestClient(app)
+
+
+def login():
+    response = client.post("/auth/token", headers={'x-version': '1.0'}, json={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def test_retired_version_not_served_from_cache():
+
+    headers = {
+        'Content-Type': 'application/json',
+        'x-version': '1.0'
+    }
+    admin_headers = {'Authorization': f"Bearer {login()}"}
+
+    # Cache the responses of the version
+    assert client.get("/roles", headers=headers).status_code == 200
+    assert client.get("/users/1", headers=headers).status_code == 200
+
+    response = client.patch("/versions/1.0", headers={**headers, **admin_headers}, json={"supported": False})
+    assert response.status_code == 200
+    try:
+        # Check the cached responses are not served to the retired version
+        assert client.get("/roles", headers=headers).status_code == 426
+        assert client.get("/users/1", headers=headers).status_code == 426
+    finally:
+        # Without X-Version: the version is supported again
+        response = client.patch("/versions/1.0", headers=admin_headers, json={"supported": True})
+        assert response.status_code == 200
+
+    assert client.get("/roles", headers=headers).status_code == 200
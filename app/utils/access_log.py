@@ -0,0 +1,73 @@
+import time
+import logging
+from utils import consts, logging_config
+
+logger = logging.getLogger()
+
+HEADER_USER_AGENT = b"user-agent"
+HEADER_VERSION = consts.Consts.HEADER_VERSION.encode('latin-1')
+
+
+class AccessLogMiddleware:
+    """
+    Pure ASGI access logger.
+    Status, size and X-Version are read from the messages sent to the server, so streaming responses
+    are logged once their last chunk has been sent. Exceptions raised by the app are never swallowed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        response = {"status_code": 500, "size": 0, "version": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+                for key, value in message.get("headers", []):
+                    if key.lower() == HEADER_VERSION:
+                        response["version"] = value.decode('latin-1')
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if logging_config.should_log_access(response["status_code"]):
+                self.log(scope, response, time.perf_counter() - start_time)
+
+    def log(self, scope, response: dict, process_time_seconds: float):
+        try:
+            user_agent = "-"
+            version = response["version"]
+            for key, value in scope["headers"]:
+                if key == HEADER_USER_AGENT:
+                    user_agent = value.decode('latin-1')
+                elif key == HEADER_VERSION and version is None:
+                    version = value.decode('latin-1')
+            request_time_milli = round(process_time_seconds * 1000, 2)
+            request_time_sec = round(process_time_seconds, 2)
+            query_string = scope["query_string"].decode('latin-1')
+            version = version or "-"
+            # Message is formatted by the logging listener thread, fields are kept for the JSON format
+            logger.info(
+                "[zz999] %s %s %s %s %s %s?%s %s %s",
+                response["status_code"], request_time_sec, request_time_milli, response["size"], scope["method"], scope["path"], query_string, version, user_agent,
+                extra={
+                    "status_code": response["status_code"],
+                    "duration_ms": request_time_milli,
+                    "response_size": response["size"],
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query_string": query_string,
+                    "version": version,
+                    "user_agent": user_agent
+                }
+            )
+        except Exception:
+            logger.exception("Can't log request")
@@ -21,7 +21,7 @@ def generate_random_password(n=12):
 
 
 def hash_password(password: str):
-    salt = bcrypt.gensalt()  # salt is unique
+    salt = bcrypt.gensalt().decode('utf8')  # salt is unique, stored as a string
     # bcrypt the password using the salt and concat a secret key not present in database (hardcoded on backend only)
     encrpyted_password = bcrypt.hashpw((f"{password}+{consts.Consts.SECRET_KEY}").encode('utf8'), salt.encode('utf-8'))
     hashed_password = hashlib.sha512(encrpyted_password).hexdigest()
@@ -0,0 +1,244 @@
+import os
+import json
+import hashlib
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+import settings
+from utils import consts
+from utils.metrics import CACHE_INVALIDATIONS
+
+try:
+    import redis
+except ImportError:  # Only required with CACHE_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger()
+
+
+class MemoryBackend:
+    """
+    Cache of this process only. Messages published are only received by the subscribers of this process:
+    with several workers, their caches are only consistent within the TTL of the entries.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.subscribers = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def publish(self, channel: str, message: str):
+        for callback in list(self.subscribers[channel]):
+            callback(message)
+
+    def subscribe(self, channel: str, callback, on_reconnect=None):
+        self.subscribers[channel].append(callback)
+
+    def close(self):
+        self.subscribers.clear()
+
+
+class RedisBackend:
+    """
+    Cache shared by the workers and pods through Redis (or any server speaking its protocol).
+    Messages are received by a background thread, which subscribes again after a connection loss.
+    """
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=settings.env.CACHE_REDIS_TIMEOUT, socket_connect_timeout=settings.env.CACHE_REDIS_TIMEOUT)
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def get(self, key: str):
+        return self.client.get(key)
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+    def publish(self, channel: str, message: str):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel: str, callback, on_reconnect=None):
+        thread = threading.Thread(target=self.listen, args=(channel, callback, on_reconnect), name=f"cache-subscriber-{channel}", daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def listen(self, channel: str, callback, on_reconnect):
+        connected_once = False
+        while not self.stopped.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(channel)
+                if connected_once and on_reconnect:
+                    # Messages published while disconnected are lost
+                    on_reconnect()
+                connected_once = True
+                while not self.stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        callback(message["data"])
+            except redis.RedisError as e:
+                logger.warning(f"Cache channel {channel} disconnected: {e}")
+                self.stopped.wait(1)
+            finally:
+                pubsub.close()
+
+    def close(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.client.close()
+
+
+class InvalidationBus:
+    """
+    Invalidations of the caches of each process (responses, registries, docs credentials, ...) by topic.
+    Published invalidations are applied at once in this process, then by the other workers and pods
+    when they receive them through the cache backend.
+    """
+
+    def __init__(self, backend, channel: str):
+        self.backend = backend
+        self.channel = channel
+        self.handlers = defaultdict(list)
+        # Set in each worker by start(): a process ignores its own messages, already applied
+        self.origin = None
+
+    def subscribe(self, topic: str, handler):
+        # handler(key): key is the id of the written entity, None when the whole topic is invalidated
+        self.handlers[topic].append(handler)
+
+    def publish(self, topic: str, key=None):
+        self.dispatch(topic, key, "local")
+        if self.origin is None:
+            return
+        try:
+            self.backend.publish(self.channel, json.dumps({"origin": self.origin, "topic": topic, "key": key}))
+        except Exception:
+            # The other processes catch up when their entries expire
+            logger.exception(f"Cannot publish the invalidation of {topic} {key}")
+
+    def dispatch(self, topic: str, key, source: str):
+        CACHE_INVALIDATIONS.labels(topic, source).inc()
+        for handler in self.handlers[topic]:
+            try:
+                handler(key)
+            except Exception:
+                logger.exception(f"Invalidation handler of {topic} failed")
+
+    def receive(self, message: str):
+        try:
+            invalidation = json.loads(message)
+        except ValueError:
+            logger.warning(f"Invalid message on the cache channel: {message!r}")
+            return
+        if invalidation.get("origin") != self.origin:
+            self.dispatch(invalidation["topic"], invalidation.get("key"), "remote")
+
+    def flush(self):
+        for topic in list(self.handlers):
+            self.dispatch(topic, None, "reconnect")
+
+    def start(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.backend.subscribe(self.channel, self.receive, on_reconnect=self.flush)
+
+    def stop(self):
+        self.origin = None
+        self.backend.close()
+
+
+class TokenCache:
+    """
+    Users of the valid access tokens, to authenticate a request without reading its token.
+    Tokens are only stored as sha256 digests, which are also the keys of the invalidations of the tokens topic.
+    """
+
+    def __init__(self, backend, bus, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        bus.subscribe(consts.Consts.CACHE_TAG_TOKENS, self.evict)
+
+    @staticmethod
+    def digest(token: str):
+        return hashlib.sha256(token.encode('utf8')).hexdigest()
+
+    def get(self, token: str):
+        if not self.ttl:
+            return None
+        try:
+            user_id = self.backend.get(key("token", self.digest(token)))
+        except Exception:
+            logger.exception("Cannot read the token cache")
+            return None
+        return int(user_id) if user_id is not None else None
+
+    def add(self, token: str, user_id: int, expiration: datetime):
+        # Never remembered after the expiration of the token
+        ttl = min(self.ttl, (expiration - datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            return
+        try:
+            self.backend.set(key("token", self.digest(token)), str(user_id), ttl)
+        except Exception:
+            logger.exception("Cannot write the token cache")
+
+    def evict(self, digest: str):
+        if digest is not None:
+            self.backend.delete(key("token", digest))
+
+
+def create_backend():
+    if settings.env.CACHE_BACKEND == "redis":
+        return RedisBackend(settings.env.CACHE_REDIS_URL)
+    return MemoryBackend(settings.env.CACHE_MAX_ENTRIES)
+
+
+def key(*parts):
+    return ":".join([settings.env.CACHE_KEY_PREFIX] + [str(part) for part in parts])
+
+
+backend = create_backend()
+bus = InvalidationBus(backend, key("invalidations"))
+access_tokens = TokenCache(backend, bus, settings.env.TOKEN_CACHE_TTL)
+
+
+def revoke_tokens(*tokens: str):
+    # Called once the tokens are deleted or replaced: evicted here and in the other workers
+    for token in tokens:
+        if token:
+            bus.publish(consts.Consts.CACHE_TAG_TOKENS, TokenCache.digest(token))
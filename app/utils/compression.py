@@ -0,0 +1,204 @@
+import zlib
+import brotli
+import anyio
+from fastapi import Request, Response
+import settings
+from utils import etags
+
+GZIP = 'gzip'
+BROTLI = 'br'
+# Preferred encoding first when the client accepts both with the same quality
+SUPPORTED_ENCODINGS = (BROTLI, GZIP)
+
+media_types = {media_type.strip() for media_type in settings.env.COMPRESSION_MEDIA_TYPES.split(',') if media_type.strip()}
+
+
+def negotiate_encoding(accept_encoding: str):
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best_encoding, best_quality = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def is_compressible(media_type: str):
+    if not media_type:
+        return False
+    return media_type.split(';')[0].strip().lower() in media_types
+
+
+def compress(body: bytes, encoding: str, best: bool = False):
+    # best=True is meant for bodies compressed once and served many times (static files, OpenAPI document)
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=11 if best else settings.env.COMPRESSION_BROTLI_QUALITY)
+    compressor = zlib.compressobj(9 if best else settings.env.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+class StreamCompressor:
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self.compressor = brotli.Compressor(quality=settings.env.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(settings.env.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes):
+        if self.encoding == BROTLI:
+            return self.compressor.process(chunk) + self.compressor.flush()
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == BROTLI:
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class PrecompressedBody:
+    """
+    A body compressed once with every supported encoding, served without any per-request compression cost.
+    Its content ETag is computed once too (suffixed per encoding), so If-None-Match is answered with a HTTP 304.
+    """
+
+    def __init__(self, body: bytes, media_type: str, headers: dict = None):
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.etag = etags.compute_content(body)
+        self.variants = {None: body}
+        if len(body) >= settings.env.COMPRESSION_MIN_SIZE and is_compressible(media_type):
+            for encoding in SUPPORTED_ENCODINGS:
+                self.variants[encoding] = compress(body, encoding, best=True)
+
+    def response(self, request: Request, status_code: int = 200):
+        headers = dict(self.headers)
+        encoding = None
+        if len(self.variants) > 1:
+            headers['vary'] = 'Accept-Encoding'
+            encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+        headers['etag'] = etags.with_encoding(self.etag, encoding)
+        if status_code == 200 and etags.is_not_modified(request, self.etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers['content-encoding'] = encoding
+        return Response(content=self.variants[encoding], status_code=status_code, media_type=self.media_type, headers=headers)
+
+
+def _get_header(headers, name: bytes):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _with_encoding(headers, encoding: str):
+    return [(key, etags.with_encoding(value.decode('latin-1'), encoding).encode('latin-1') if key.lower() == b"etag" else value) for key, value in headers]
+
+
+def _not_modified_etag(headers, if_none_match: str, encoding: str):
+    # A 304 carries the ETag the client holds: the one of the compressed representation if it was compressed
+    etag = _get_header(headers, b"etag")
+    if etag and if_none_match and etags.with_encoding(etag, encoding) in [tag.strip() for tag in if_none_match.split(',')]:
+        return _with_encoding(headers, encoding)
+    return headers
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip depending on Accept-Encoding.
+    Bodies under COMPRESSION_MIN_SIZE, media types outside COMPRESSION_MEDIA_TYPES, partial (206) and already
+    encoded responses are sent untouched. Large bodies are compressed in the threadpool to keep the event loop free.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.env.COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate_encoding(_get_header(scope["headers"], b"accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        response_start = None
+        stream_compressor = None
+
+        async def send_wrapper(message):
+            nonlocal response_start, stream_compressor
+
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                if message["status"] == 304:
+                    message["headers"] = _not_modified_etag(headers, _get_header(scope["headers"], b"if-none-match"), encoding)
+                if (
+                    message["status"] < 200 or message["status"] in (204, 206, 304)
+                    # A range is made of bytes of the identity representation: compressing it would corrupt it
+                    or _get_header(headers, b"content-range") is not None
+                    or _get_header(headers, b"content-encoding") is not None
+                    or not is_compressible(_get_header(headers, b"content-type"))
+                ):
+                    await send(message)
+                    return
+                # Wait for the first body chunk to know the size of the response
+                response_start = message
+                return
+
+            if response_start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = [(key, value) for key, value in response_start.get("headers", []) if key.lower() != b"content-length"]
+
+            if stream_compressor is None and not more_body:
+                # Whole body available at once
+                if len(body) < settings.env.COMPRESSION_MIN_SIZE:
+                    await send(response_start)
+                    await send(message)
+                    response_start = None
+                    return
+                if len(body) >= settings.env.COMPRESSION_THREADPOOL_MIN_SIZE:
+                    compressed = await anyio.to_thread.run_sync(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                headers = _with_encoding(headers, encoding) + [
+                    (b"content-encoding", encoding.encode('latin-1')),
+                    (b"content-length", str(len(compressed)).encode('latin-1')),
+                    (b"vary", b"Accept-Encoding")
+                ]
+                await send({**response_start, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed})
+                response_start = None
+                return
+
+            # Streaming response: compress chunk by chunk
+            if stream_compressor is None:
+                stream_compressor = StreamCompressor(encoding)
+                headers = _with_encoding(headers, encoding) + [
+                    (b"content-encoding", encoding.encode('latin-1')),
+                    (b"vary", b"Accept-Encoding")
+                ]
+                await send({**response_start, "headers": headers})
+            chunk = stream_compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += stream_compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -6,8 +6,11 @@ class Consts:
     ERROR_CODE_403 = 403
     ERROR_CODE_404 = 404
     ERROR_CODE_409 = 409
+    ERROR_CODE_412 = 412
     ERROR_CODE_426 = 426
+    ERROR_CODE_429 = 429
     ERROR_CODE_500 = 500
+    ERROR_CODE_503 = 503
 
     MAX_TOKENS_PER_USER = 2
     MAX_RESULTS_PER_PAGE = 20
@@ -22,6 +25,14 @@ class Consts:
     ROLE_USER = 'user'
     HEADER_VERSION = 'x-version'
     HEADER_AUTH = 'authorization'
+    HEADER_ETAG = 'ETag'
+    HEADER_IF_MATCH = 'if-match'
+    HEADER_IF_NONE_MATCH = 'if-none-match'
+    CACHE_TAG_ITEMS = 'items'
+    CACHE_TAG_ROLES = 'roles'
+    CACHE_TAG_TOKENS = 'tokens'
+    CACHE_TAG_USERS = 'users'
+    CACHE_TAG_VERSIONS = 'versions'
     PERMISSION_ADMIN = 'Admin'
     PERMISSION_ADMIN_OR_USER_OWNER = 'User Owner'
     PERMISSION_ADMIN_OR_ITEM_OWNER = 'Item Owner'
@@ -29,8 +40,18 @@ class Consts:
 
     INVALID_CREDENTIALS = "Invalid credentials"
     INVALID_CREDENTIALS_OR_DISABLED = "Invalid credentials or inactive account"
+    INVALID_FIELDS = "Invalid fields: Only fields of the resource can be requested"
+    INVALID_EXPAND = "Invalid expand: Only relations of the resource can be expanded"
+    EXPAND_USER = 'user'
+    INVALID_BULK_SELECTION = "Invalid selection: Provide either ids or a filter"
+    INVALID_BULK_FILTER = "Invalid filter: Provide at least one criterion"
+    TOO_MANY_ITEMS = "Too many items: Split the ids in several requests"
     ITEM_ALREADY_EXISTS = "Item with the same name already exists"
     ITEM_NOT_FOUND = "Item not found"
+    PROFILE_NOT_FOUND = "Profile not found"
+    PROFILE_ALREADY_RUNNING = "A process profile is already running"
+    SNAPSHOT_NOT_FOUND = "Memory snapshot not found"
+    MEMORY_TRACING_NOT_STARTED = "Memory tracing is not started"
     FAILED_TO_DELETE_ITEM = "Internal error: Failed to delete item"
     FAILED_TO_UPDATE_USER = "Internal error: Failed to update user"
     FAILED_TO_DISABLE_USER = "Internal error: Failed to disable user"
@@ -44,3 +65,7 @@ class Consts:
     NOT_AUTHENTIFIED = "Not authentified"
     FORBIDDEN_ACCESS = "Forbidden access: User cannot access this resource"
     VERSION_NOT_SUPPORTED = "Version not supported anymore"
+    VERSION_NOT_FOUND = "Version not found"
+    PRECONDITION_FAILED = "Precondition failed: Resource has been modified"
+    SERVER_BUSY = "Server busy: Please retry later"
+    TOO_MANY_REQUESTS = "Too many requests: Please retry later"
@@ -0,0 +1,64 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
+import settings
+from utils import cache, consts
+
+
+class CredentialsCache:
+    """
+    Remembers successful username/password checks for `ttl` seconds to skip bcrypt on repeated calls.
+    Only HMAC digests keyed with a random per-process key are kept: clear text passwords are never stored.
+    """
+
+    def __init__(self, ttl: int, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key = os.urandom(32)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def digest(self, username: str, password: str):
+        return hmac.new(self.key, f"{username}\0{password}".encode('utf8'), hashlib.sha256).digest()
+
+    def get(self, username: str, password: str):
+        if not self.ttl:
+            return False
+        digest = self.digest(username, password)
+        with self.lock:
+            expires_at = self.entries.get(digest)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self.entries[digest]
+                return False
+        return True
+
+    def add(self, username: str, password: str):
+        if not self.ttl:
+            return
+        digest = self.digest(username, password)
+        now = time.monotonic()
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {key: expires_at for key, expires_at in self.entries.items() if expires_at >= now}
+                if len(self.entries) >= self.max_entries:
+                    self.entries.clear()
+            self.entries[digest] = now + self.ttl
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+docs_credentials = CredentialsCache(settings.env.DOCS_CREDENTIALS_CACHE_TTL)
+
+
+def invalidate(user_id=None):
+    # Called when a user is updated or disabled: a changed password or role must be checked again
+    docs_credentials.clear()
+
+
+cache.bus.subscribe(consts.Consts.CACHE_TAG_USERS, invalidate)
@@ -0,0 +1,96 @@
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+from exceptions.CustomException import CustomException
+from utils import consts
+
+# Columns read by compute()
+FIELDS = ["id", "version"]
+# Content-codings of utils/compression.py: suffixed to the ETags of the compressed representations
+CONTENT_CODINGS = ("br", "gzip")
+
+
+def compute(resource, fields: list = None):
+    # Strong ETag derived from id + version counter, incremented by every write (timestamps have a 1 second resolution)
+    representation = f"{resource.id}:{resource.version}"
+    if fields:
+        # A sparse fieldset is another representation of the resource
+        representation += f":{','.join(fields)}"
+    return compute_content(representation.encode('utf8'))
+
+
+def compute_content(content: bytes):
+    return f'"{hashlib.sha1(content).hexdigest()}"'
+
+
+def with_encoding(etag: str, encoding: str):
+    # Each content-coding is a representation of its own, with its own strong ETag (RFC 9110 8.8.3)
+    if not etag or encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_encoding(tag: str):
+    for encoding in CONTENT_CODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return f'{tag[:-len(suffix)]}"'
+    return tag
+
+
+def matches(header_value: str, etag: str, weak: bool):
+    if header_value is None:
+        return False
+    if header_value.strip() == '*':
+        return True
+    for tag in header_value.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            if not weak:
+                continue
+            tag = tag[2:]
+        # The routes compute the ETag of the uncompressed representation
+        if strip_encoding(tag) == etag:
+            return True
+    return False
+
+
+def has_if_none_match(request: Request):
+    return consts.Consts.HEADER_IF_NONE_MATCH in request.headers
+
+
+def is_not_modified(request: Request, etag: str):
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2)
+    return matches(request.headers.get(consts.Consts.HEADER_IF_NONE_MATCH), etag, weak=True)
+
+
+def not_modified(etag: str):
+    return Response(status_code=304, headers={consts.Consts.HEADER_ETAG: etag})
+
+
+def has_if_match(request: Request):
+    return consts.Consts.HEADER_IF_MATCH in request.headers
+
+
+def precondition_failed(db: Session, info: str):
+    return CustomException(
+        db=db,
+        status_code=consts.Consts.ERROR_CODE_412,
+        detail=consts.Consts.PRECONDITION_FAILED,
+        info=info
+    )
+
+
+def check_if_match(request: Request, db: Session, etag: str):
+    # If-Match uses the strong comparison (RFC 9110 13.1.1)
+    if_match = request.headers.get(consts.Consts.HEADER_IF_MATCH)
+    if if_match is not None and not matches(if_match, etag, weak=False):
+        raise precondition_failed(db, f"ETag {etag} does not match If-Match header {if_match}")
+
+
+def content_response(request: Request, content: bytes, media_type: str = "application/json"):
+    # Content-hash ETag for resources without updated_at (roles, versions)
+    etag = compute_content(content)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return Response(content=content, media_type=media_type, headers={consts.Consts.HEADER_ETAG: etag})
@@ -0,0 +1,60 @@
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy.orm import Session
+from exceptions.CustomException import CustomException
+from utils import consts
+
+# Sparse fieldsets: ?fields=id,name returns (and selects) only these fields of the resources.
+# Expansions: ?expand=user embeds a related resource
+
+
+def parse(db: Session, fields: str, schema: type[BaseModel]):
+    """
+    Field names requested in the `fields` query parameter, in the order of the schema (None: every field).
+    Names must be fields of the schema, which are also the columns of the model.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = requested - schema.model_fields.keys()
+    if unknown or not requested:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_400,
+            detail=consts.Consts.INVALID_FIELDS,
+            info=f"Invalid fields {fields!r} for {schema.__name__}, available fields: {','.join(schema.model_fields)}"
+        )
+    return [name for name in schema.model_fields if name in requested]
+
+
+def parse_expand(db: Session, expand: str, allowed: tuple):
+    """
+    Relations requested in the `expand` query parameter (e.g. expand=user), empty when none is requested.
+    """
+    if expand is None:
+        return set()
+    requested = {name.strip() for name in expand.split(',') if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown or not requested:
+        raise CustomException(
+            db=db,
+            status_code=consts.Consts.ERROR_CODE_400,
+            detail=consts.Consts.INVALID_EXPAND,
+            info=f"Invalid expand {expand!r}, available relations: {','.join(allowed)}"
+        )
+    return requested
+
+
+def columns(model, fields):
+    return [getattr(model, name) for name in fields]
+
+
+@lru_cache(maxsize=256)
+def projection(schema: type[BaseModel], fields: tuple):
+    # Subset of the schema, built once per field combination: values are validated and serialized as in the schema
+    definitions = {name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in fields}
+    return create_model(f"{schema.__name__}Fields", __config__=ConfigDict(from_attributes=True), **definitions)
+
+
+def dump(schema: type[BaseModel], fields: list, row):
+    return projection(schema, tuple(fields)).model_validate(row).model_dump(mode="json")
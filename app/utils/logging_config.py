@@ -0,0 +1,119 @@
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from collections.abc import Mapping
+from logging.handlers import QueueHandler, QueueListener
+import settings
+from utils.metrics import LOG_RECORDS_DROPPED
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+# Arguments of these types can be formatted later by the listener thread
+IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+# Attributes of every LogRecord: anything else has been given through extra= and is added to the JSON document
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue without ever blocking the caller: records are dropped when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def prepare(self, record: logging.LogRecord):
+        # Only do in the calling thread what cannot be deferred: mutable arguments and tracebacks
+        # A single mapping argument (logger.info("%(id)s", {...})) is kept by logging as record.args itself
+        args = record.args.values() if isinstance(record.args, Mapping) else record.args
+        if record.args and not all(isinstance(arg, IMMUTABLE_TYPES) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord):
+        document = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                document[key] = value
+        if record.exc_text:
+            document["exception"] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+def _parse_sample_rates(value: str):
+    sample_rates = {}
+    for item in value.split(','):
+        status_class, _, rate = item.partition('=')
+        if rate:
+            sample_rates[int(status_class.strip()[0])] = float(rate)
+    return sample_rates
+
+
+access_log_sample_rates = _parse_sample_rates(settings.env.ACCESS_LOG_SAMPLE_RATES)
+
+
+def should_log_access(status_code: int):
+    rate = access_log_sample_rates.get(status_code // 100, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+listener = None
+
+
+def setup():
+    """
+    Route every log record through a bounded queue consumed by a background thread writing to stderr.
+    """
+    global listener
+    if listener is not None:
+        return listener
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if settings.env.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=settings.env.LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(settings.env.LOG_LEVEL)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Flush remaining records on exit
+    atexit.register(listener.stop)
+    return listener
+
+
+def after_fork():
+    """
+    The listener thread is not copied by fork(): a worker process needs its own queue and listener.
+    """
+    global listener
+    if listener is not None:
+        atexit.unregister(listener.stop)
+        listener = None
+    setup()
@@ -0,0 +1,166 @@
+import os
+import time
+import uuid
+import threading
+import tracemalloc
+from collections import OrderedDict
+from functools import wraps
+import settings
+from utils.metrics import ROUTE_ALLOCATED_NET_BYTES, ROUTE_ALLOCATED_PEAK_BYTES
+
+# Allocations made by tracemalloc itself and by the import machinery are noise in a leak hunt
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class MemorySnapshots:
+    """
+    tracemalloc snapshots of this worker, the MEMORY_PROFILING_MAX_SNAPSHOTS most recent ones are kept.
+    """
+
+    def __init__(self, max_snapshots: int):
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        snapshot_id = uuid.uuid4().hex
+        with self.lock:
+            self.snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return self.describe(snapshot_id)
+
+    def get(self, snapshot_id: str):
+        with self.lock:
+            return self.snapshots.get(snapshot_id)
+
+    def describe(self, snapshot_id: str):
+        taken_at, snapshot = self.get(snapshot_id)
+        return {
+            "id": snapshot_id,
+            "pid": os.getpid(),
+            "taken_at": taken_at,
+            "size_bytes": sum(trace.size for trace in snapshot.traces),
+            "count": len(snapshot.traces)
+        }
+
+    def list(self):
+        with self.lock:
+            snapshot_ids = list(self.snapshots)
+        return [self.describe(snapshot_id) for snapshot_id in reversed(snapshot_ids)]
+
+    def clear(self):
+        with self.lock:
+            self.snapshots.clear()
+
+
+snapshots = MemorySnapshots(settings.env.MEMORY_PROFILING_MAX_SNAPSHOTS)
+
+
+def status():
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "pid": os.getpid(),
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "peak_bytes": peak
+    }
+
+
+def start(frames: int):
+    # Changing the traceback limit requires a restart of tracemalloc
+    if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+        tracemalloc.stop()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return status()
+
+
+def stop():
+    tracemalloc.stop()
+    snapshots.clear()
+    return status()
+
+
+def _location(stat, group_by: str):
+    frame = stat.traceback[0]
+    return frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+
+
+def top(snapshot, group_by: str, limit: int):
+    return [
+        {"location": _location(stat, group_by), "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics(group_by)[:limit]
+    ]
+
+
+def diff(old_snapshot, new_snapshot, group_by: str, limit: int):
+    # Sorted by absolute size difference: what grew (or was freed) the most between both snapshots
+    return [
+        {"location": _location(stat, group_by), "size_bytes": stat.size, "size_diff_bytes": stat.size_diff, "count": stat.count, "count_diff": stat.count_diff}
+        for stat in new_snapshot.compare_to(old_snapshot, group_by)[:limit]
+    ]
+
+
+class RequestsInFlight:
+    """
+    Instrumented requests running in this worker. The peak of tracemalloc is process-wide and only has a meaning
+    for a request which ran alone: it is only reset and recorded then.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.started = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        # Returns the number of requests started so far when this one runs alone, None otherwise
+        with self.lock:
+            self.count += 1
+            self.started += 1
+            if self.count > 1:
+                return None
+            tracemalloc.reset_peak()
+            return self.started
+
+    def exit(self, started):
+        # Whether the request ran alone from start to end
+        with self.lock:
+            self.count -= 1
+            return started is not None and started == self.started
+
+
+requests_in_flight = RequestsInFlight()
+
+
+def instrument(func, route: str):
+    """
+    Wrap a sync endpoint to export the memory it allocated (peak and net) while tracemalloc is tracing.
+    tracemalloc counters are process-wide: with concurrent requests, the net figure of a route includes
+    the allocations of the requests running at the same time, and no peak is recorded.
+    Returns the endpoint untouched when MEMORY_ROUTE_METRICS_ENABLED is not set.
+    """
+    if not settings.env.MEMORY_ROUTE_METRICS_ENABLED:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not tracemalloc.is_tracing():
+            return func(*args, **kwargs)
+        started = requests_in_flight.enter()
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            if requests_in_flight.exit(started):
+                ROUTE_ALLOCATED_PEAK_BYTES.labels(route).observe(max(peak - before, 0))
+            ROUTE_ALLOCATED_NET_BYTES.labels(route).observe(current - before)
+    return wrapper
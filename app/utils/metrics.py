@@ -0,0 +1,122 @@
+from prometheus_client import Counter, Gauge, Histogram, Summary
+
+# Custom metrics exposed next to the default prometheus-fastapi-instrumentator ones
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests",
+    "Requests handled by the response cache, by route and result (hit/miss)",
+    ["route", "result"]
+)
+
+CACHE_INVALIDATIONS = Counter(
+    "cache_invalidations",
+    "Cache invalidations applied by this process, by topic and source (local, remote or reconnect)",
+    ["topic", "source"]
+)
+
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests",
+    "GET requests eligible to coalescing, by route and result (leader: ran the route, coalesced: shared the response of a leader)",
+    ["route", "result"]
+)
+
+RATE_LIMITED = Counter(
+    "rate_limited_requests",
+    "Requests rejected with a HTTP 429 by the rate limiter, by rule",
+    ["rule"]
+)
+
+CRON_RUNS = Counter(
+    "cron_runs",
+    "Scheduled cron runs, by job and outcome (success, failure, or skipped when another process holds the lease)",
+    ["job", "outcome"]
+)
+
+CRON_RUN_DURATION = Histogram(
+    "cron_run_duration_seconds",
+    "Duration of the cron runs, by job",
+    ["job"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+)
+
+CRON_LAST_RUN = Gauge(
+    "cron_last_run_timestamp_seconds",
+    "Time of the last run of a cron, by job and outcome",
+    ["job", "outcome"],
+    multiprocess_mode="max"
+)
+
+CRON_LEADER = Gauge(
+    "cron_leader",
+    "1 when this process holds the lease of the job (summed over the pods: 1 when a runner is elected)",
+    ["job"],
+    multiprocess_mode="livesum"
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped",
+    "Log records dropped because the logging queue was full"
+)
+
+THREADPOOL_SIZE = Gauge(
+    "threadpool_size",
+    "Number of threads available to run sync routes",
+    multiprocess_mode="livesum"
+)
+
+THREADPOOL_IN_USE = Gauge(
+    "threadpool_in_use",
+    "Number of threads currently borrowed from the threadpool (sync routes, sync dependencies and other blocking calls)",
+    multiprocess_mode="livesum"
+)
+
+THREADPOOL_QUEUE_WAIT = Histogram(
+    "threadpool_queue_wait_seconds",
+    "Time spent by a request waiting for a thread, by route",
+    ["route"]
+)
+
+THREADPOOL_RUN_TIME = Histogram(
+    "threadpool_run_seconds",
+    "Time spent by a route in its thread, by route",
+    ["route"]
+)
+
+THREADPOOL_REJECTED = Counter(
+    "threadpool_rejected",
+    "Requests rejected because they waited too long for a thread, by route",
+    ["route"]
+)
+
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed by a request, by route",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Time spent in SQL statements by a request, by route",
+    ["route"]
+)
+
+DB_QUERY_ALARMS = Counter(
+    "db_query_alarms",
+    "Requests that executed more SQL statements than DB_QUERY_ALARM_THRESHOLD, by route",
+    ["route"]
+)
+
+ROUTE_ALLOCATED_PEAK_BYTES = Histogram(
+    "route_allocated_peak_bytes",
+    "Peak memory allocated while running a route alone in its worker (tracemalloc), by route",
+    ["route"],
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+)
+
+# Net allocations can be negative (memory freed by the route): a summary keeps their sum and count
+ROUTE_ALLOCATED_NET_BYTES = Summary(
+    "route_allocated_net_bytes",
+    "Memory still allocated after running a route (tracemalloc), by route",
+    ["route"]
+)
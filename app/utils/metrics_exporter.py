@@ -0,0 +1,33 @@
+import os
+import glob
+from prometheus_client import multiprocess
+
+# Read by prometheus_client when it is imported: it must be set before the app is loaded
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def multiprocess_dir():
+    return os.environ.get(MULTIPROC_DIR_ENV)
+
+
+def prepare_multiprocess_dir():
+    """
+    Called once by the process starting the workers, before any of them is started:
+    files left by a previous run would otherwise be aggregated with the new ones.
+    """
+    directory = multiprocess_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+
+def mark_process_dead(pid: int = None):
+    # Removes the live gauges of a stopped worker, counters and histograms keep their values
+    if multiprocess_dir():
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+if __name__ == "__main__":
+    prepare_multiprocess_dir()
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import Counter
+from functools import wraps
+import settings
+from exceptions.CustomException import CustomException
+from utils import rights
+
+logger = logging.getLogger()
+
+HEADER_PROFILE = "x-profile"
+HEADER_PROFILE_ID = b"x-profile-id"
+KIND_REQUEST = "request"
+KIND_PROCESS = "process"
+
+
+def collapse(frame, thread_name: str = None):
+    # Collapsed stack format (root first, frames separated by ';') read by flamegraph.pl and speedscope
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    if thread_name:
+        frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread records the stacks of the profiled threads every
+    PROFILING_SAMPLE_INTERVAL_MS. Nothing runs in the profiled threads themselves.
+    """
+
+    def __init__(self, thread_ids: set = None):
+        # thread_ids=None profiles every thread of the process (the stacks are prefixed by the thread name)
+        self.thread_ids = thread_ids
+        self.interval = settings.env.PROFILING_SAMPLE_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.duration = time.time() - self.started_at
+        return self
+
+    def run(self):
+        own_thread_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()} if self.thread_ids is None else {}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                self.stacks[collapse(frame, thread_names.get(thread_id))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """
+    Profiles are written to PROFILING_DIR so that any worker of the pod can return them.
+    Only the PROFILING_MAX_PROFILES most recent ones are kept.
+    """
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def path(self, profile_id: str):
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def add(self, profiler: SamplingProfiler, kind: str, route: str = None):
+        profile = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "route": route,
+            "pid": os.getpid(),
+            "started_at": profiler.started_at,
+            "duration_ms": round(profiler.duration * 1000, 2),
+            "samples": profiler.samples,
+            "stacks": profiler.collapsed()
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(profile["id"]), "w") as f:
+            json.dump(profile, f)
+        self.prune()
+        return profile
+
+    def prune(self):
+        paths = sorted((os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")), key=os.path.getmtime)
+        for path in paths[:-self.max_profiles]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, profile_id: str):
+        # Ids are generated by uuid4().hex: anything else cannot be a profile (and cannot escape the folder)
+        if not (len(profile_id) == 32 and all(c in "0123456789abcdef" for c in profile_id)):
+            return None
+        try:
+            with open(self.path(profile_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            profile = self.get(name[:-len(".json")]) if name.endswith(".json") else None
+            if profile is not None:
+                profile.pop("stacks")
+                profiles.append(profile)
+        return sorted(profiles, key=lambda profile: profile["started_at"], reverse=True)
+
+
+store = ProfileStore(settings.env.PROFILING_DIR, settings.env.PROFILING_MAX_PROFILES)
+
+process_profiler = None
+process_profiler_lock = threading.Lock()
+
+
+def start_process_profile(seconds: int):
+    """
+    Samples every thread of this worker for `seconds`, then stores the profile. Returns False if one is already running.
+    """
+    global process_profiler
+    with process_profiler_lock:
+        if process_profiler is not None:
+            return False
+        process_profiler = SamplingProfiler().start()
+
+    def stop():
+        global process_profiler
+        with process_profiler_lock:
+            profiler, process_profiler = process_profiler, None
+        store.add(profiler.stop(), KIND_PROCESS)
+
+    timer = threading.Timer(seconds, stop)
+    timer.daemon = True
+    timer.start()
+    return True
+
+
+def is_profiling_requested(request, db):
+    if request is None or request.headers.get(HEADER_PROFILE) != "1":
+        return False
+    try:
+        rights.is_admin(db, rights.retrieve_token_from_header(request))
+    except CustomException:
+        # The header is ignored for anyone else, the request itself is not rejected
+        return False
+    return True
+
+
+def instrument(func, route: str):
+    """
+    Wrap a sync endpoint so that admins can profile a single request with the `x-profile: 1` header.
+    Returns the endpoint untouched when PROFILING_ENABLED is not set.
+    """
+    if not settings.env.PROFILING_ENABLED:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request = kwargs.get('request')
+        if not is_profiling_requested(request, kwargs.get('db')):
+            return func(*args, **kwargs)
+        profiler = SamplingProfiler(thread_ids={threading.get_ident()}).start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile = store.add(profiler.stop(), KIND_REQUEST, route)
+            request.state.profile_id = profile["id"]
+            logger.info(f"Request on {route} profiled: {profile['id']}")
+    return wrapper
+
+
+class ProfileIdMiddleware:
+    """
+    Returns the id of the profile of a request in the X-Profile-Id header. Only added when PROFILING_ENABLED is set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile_id = scope.get("state", {}).get("profile_id")
+                if profile_id:
+                    message["headers"] = list(message.get("headers", [])) + [(HEADER_PROFILE_ID, profile_id.encode('latin-1'))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,240 @@
+import re
+import json
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+import settings
+from utils import cache, consts
+from utils.metrics import RATE_LIMITED
+
+logger = logging.getLogger()
+
+HEADER_AUTH = consts.Consts.HEADER_AUTH.encode('latin-1')
+HEADER_FORWARDED_FOR = b"x-forwarded-for"
+
+
+class RateLimitRule:
+    """
+    Token bucket of `burst` requests refilled with `rate` requests per second, per client.
+    Each rule has its own buckets: a client throttled on a costly route can still call the others.
+    """
+
+    def __init__(self, name: str, method: str, path: str, rate: float, burst: int, is_limited_query=None):
+        self.name = name
+        self.method = method
+        self.path = re.compile(path)
+        self.rate = rate
+        self.burst = burst
+        self.is_limited_query = is_limited_query
+
+    def matches(self, scope):
+        if self.method and scope["method"] != self.method:
+            return False
+        if not self.path.match(scope["path"]):
+            return False
+        return self.is_limited_query is None or self.is_limited_query(scope["query_string"])
+
+
+class MemoryBucketStore:
+    """
+    Buckets of this process only: with several workers, a client can be served up to `burst` times per worker.
+    The least recently used buckets are dropped beyond max_keys (a dropped bucket starts full again).
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, tokens
+
+
+# Refilled with the clock of the server, so that the pods do not need synchronized clocks
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """
+    Buckets shared by the workers and pods, updated atomically by a Lua script.
+    When the server cannot be reached, requests are let through rather than failed.
+    """
+
+    def __init__(self, url: str):
+        if cache.redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        self.url = url
+        self.client = None
+        self.script = None
+
+    async def take(self, key: str, rate: float, burst: int):
+        if self.client is None:
+            # Created in the worker, by its event loop
+            import redis.asyncio
+            self.client = redis.asyncio.Redis.from_url(self.url, socket_timeout=settings.env.CACHE_REDIS_TIMEOUT, socket_connect_timeout=settings.env.CACHE_REDIS_TIMEOUT)
+            self.script = self.client.register_script(TAKE_SCRIPT)
+        try:
+            allowed, tokens = await self.script(keys=[key], args=[rate, burst])
+        except Exception as e:
+            logger.warning(f"Rate limit not applied, cannot reach the shared store: {e}")
+            return True, burst
+        return bool(allowed), float(tokens)
+
+
+def _is_search(query_string: bytes):
+    # Filtered lists run ILIKE scans, unfiltered pages use the primary key
+    return any(name in ("name", "description") and value for name, value in parse_qsl(query_string.decode('latin-1')))
+
+
+def _rule(name: str, method: str, path: str, rate: float, burst: int, is_limited_query=None):
+    # A rate of 0 disables the rule
+    return RateLimitRule(name, method, path, rate, burst, is_limited_query) if rate > 0 else None
+
+
+rules = [rule for rule in (
+    _rule("items_search", "GET", r"^/items$", settings.env.RATE_LIMIT_SEARCH_RATE, settings.env.RATE_LIMIT_SEARCH_BURST, _is_search),
+    _rule("auth", "POST", r"^/auth/(token|refresh)$", settings.env.RATE_LIMIT_AUTH_RATE, settings.env.RATE_LIMIT_AUTH_BURST),
+    _rule("default", None, r"^/(?!metrics$)", settings.env.RATE_LIMIT_DEFAULT_RATE, settings.env.RATE_LIMIT_DEFAULT_BURST),
+) if rule is not None]
+
+
+def create_store():
+    if settings.env.RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketStore(settings.env.CACHE_REDIS_URL)
+    return MemoryBucketStore(settings.env.RATE_LIMIT_MAX_KEYS)
+
+
+def _get_header(scope, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def client_ip(scope):
+    if settings.env.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded_for = _get_header(scope, HEADER_FORWARDED_FOR)
+        if forwarded_for:
+            # Appended by the reverse proxy: the previous entries are sent by the client
+            return forwarded_for.split(',')[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else '-'
+
+
+def token_digest(scope):
+    """
+    Digest of the access token of a request, None for anonymous requests. Tokens are not checked here (no database
+    access, no dependency on the token cache): the bucket of a token is only a bucket under the one of its IP.
+    """
+    auth_header = _get_header(scope, HEADER_AUTH)
+    if not auth_header:
+        return None
+    return cache.TokenCache.digest(auth_header.replace('Bearer ', ''))
+
+
+def _headers(rate: float, burst: int, tokens: float):
+    # Reset: seconds until the bucket is full again
+    return [
+        (b"x-ratelimit-limit", str(burst).encode('latin-1')),
+        (b"x-ratelimit-remaining", str(math.floor(tokens)).encode('latin-1')),
+        (b"x-ratelimit-reset", str(math.ceil((burst - tokens) / rate)).encode('latin-1')),
+    ]
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI token bucket rate limiter. The first rule matching a request applies, other requests are not limited.
+    Anonymous requests take from the bucket of their IP. Authenticated requests take from the bucket of their access
+    token, under a bucket of their IP RATE_LIMIT_TOKENS_PER_IP times larger: the clients sharing an IP get their own
+    rate, while random tokens cannot get more than that from a single IP.
+    Throttled requests get a HTTP 429 with Retry-After before reaching the app and its database.
+    """
+
+    def __init__(self, app, store=None, rate_limit_rules: list = None):
+        self.app = app
+        self.store = store or create_store()
+        self.rules = rules if rate_limit_rules is None else rate_limit_rules
+
+    def _match(self, scope):
+        for rule in self.rules:
+            if rule.matches(scope):
+                return rule
+        return None
+
+    async def _take(self, rule: RateLimitRule, scope):
+        # Returns whether the request is allowed, and the bucket to report: rate, burst and tokens left
+        ip_key = cache.key("ratelimit", rule.name, "ip", client_ip(scope))
+        digest = token_digest(scope)
+        if digest is None:
+            allowed, tokens = await self.store.take(ip_key, rule.rate, rule.burst)
+            return allowed, rule.rate, rule.burst, tokens
+
+        ip_rate, ip_burst = rule.rate * settings.env.RATE_LIMIT_TOKENS_PER_IP, rule.burst * settings.env.RATE_LIMIT_TOKENS_PER_IP
+        allowed, tokens = await self.store.take(ip_key + ":tokens", ip_rate, ip_burst)
+        if not allowed:
+            return False, ip_rate, ip_burst, tokens
+        allowed, tokens = await self.store.take(cache.key("ratelimit", rule.name, "token", digest), rule.rate, rule.burst)
+        return allowed, rule.rate, rule.burst, tokens
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        rule = self._match(scope)
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        allowed, rate, burst, tokens = await self._take(rule, scope)
+        headers = _headers(rate, burst, tokens)
+        if not allowed:
+            RATE_LIMITED.labels(rule.name).inc()
+            retry_after = math.ceil((1 - tokens) / rate)
+            body = json.dumps({"detail": consts.Consts.TOO_MANY_REQUESTS}).encode('utf8')
+            await send({
+                "type": "http.response.start",
+                "status": consts.Consts.ERROR_CODE_429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode('latin-1')),
+                    (b"retry-after", str(retry_after).encode('latin-1')),
+                ] + headers,
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
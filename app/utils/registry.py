@@ -0,0 +1,63 @@
+import time
+from sqlalchemy.orm import Session
+import settings
+from crud import role_crud, version_crud
+from db.database import SessionLocal
+from schemas import role_schema, version_schema
+from utils import cache, consts
+
+
+class Registry:
+    """
+    In-memory copy of a small table that rarely changes (roles, versions), reloaded every `ttl` seconds.
+    When loaded before the workers are forked, a single copy is shared by all of them until its first reload.
+    """
+
+    def __init__(self, loader, schema, ttl: int):
+        self.loader = loader
+        self.schema = schema
+        self.ttl = ttl
+        self.rows = None
+        self.loaded_at = 0
+
+    def load(self, db: Session):
+        # Rows are copied to schemas: they stay readable once the session is closed
+        self.rows = [self.schema.model_validate(row, from_attributes=True) for row in self.loader(db)]
+        self.loaded_at = time.monotonic()
+
+    def is_fresh(self):
+        return self.rows is not None and time.monotonic() - self.loaded_at <= self.ttl
+
+    def all(self, db: Session):
+        if not self.is_fresh():
+            self.load(db)
+        return self.rows
+
+    def expire(self, key=None):
+        # Reloaded by the next read
+        self.loaded_at = float('-inf')
+
+    def find(self, db: Session, **attributes):
+        for row in self.all(db):
+            if all(getattr(row, key) == value for key, value in attributes.items()):
+                return row
+        return None
+
+
+roles = Registry(role_crud.list_roles, role_schema.Role, settings.env.REGISTRY_TTL)
+versions = Registry(version_crud.list_versions, version_schema.Version, settings.env.REGISTRY_TTL)
+cache.bus.subscribe(consts.Consts.CACHE_TAG_ROLES, roles.expire)
+cache.bus.subscribe(consts.Consts.CACHE_TAG_VERSIONS, versions.expire)
+
+
+def is_loaded():
+    return roles.rows is not None and versions.rows is not None
+
+
+def preload():
+    db = SessionLocal()
+    try:
+        for registry in (roles, versions):
+            registry.load(db)
+    finally:
+        db.close()
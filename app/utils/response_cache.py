@@ -0,0 +1,209 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+import settings
+from utils import cache, consts, etags, registry
+from utils.metrics import RESPONSE_CACHE_REQUESTS
+
+
+class CacheRule:
+
+    def __init__(self, tag: str, path: str, ttl: int, is_cacheable_query=None):
+        self.tag = tag
+        self.path = re.compile(path)
+        self.ttl = ttl
+        self.is_cacheable_query = is_cacheable_query
+
+
+class CacheEntry:
+
+    def __init__(self, status: int, headers: list, body: bytes, expires_at: float, etag: str = None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+        self.etag = etag
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU of serialized responses, grouped by tag for invalidation.
+    Entries are written from the event loop and invalidated from threadpool workers, hence the lock.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry: CacheEntry, tag: str, generation: int):
+        with self.lock:
+            # The resource was written while the response was being computed: do not cache a stale body
+            if self.generations.get(tag, 0) != generation:
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def generation(self, tag: str):
+        with self.lock:
+            return self.generations.get(tag, 0)
+
+    def invalidate(self, tag: str):
+        with self.lock:
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+            for key in [key for key in self.entries if key[0] == tag]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _is_first_page(query_params):
+    # Unfiltered first page only: any filter or other page goes to the database
+    for name, value in query_params:
+        if name == 'page' and value == '1':
+            continue
+        if name == 'limit' and value == str(consts.Consts.MAX_RESULTS_PER_PAGE):
+            continue
+        return False
+    return True
+
+
+rules = [
+    CacheRule(consts.Consts.CACHE_TAG_ROLES, r"^/roles(/\d+)?$", settings.env.RESPONSE_CACHE_TTL_ROLES),
+    CacheRule(consts.Consts.CACHE_TAG_VERSIONS, r"^/versions$", settings.env.RESPONSE_CACHE_TTL_VERSIONS),
+    CacheRule(consts.Consts.CACHE_TAG_USERS, r"^/users/\d+$", settings.env.RESPONSE_CACHE_TTL_USERS),
+    CacheRule(consts.Consts.CACHE_TAG_USERS, r"^/users$", settings.env.RESPONSE_CACHE_TTL_USERS, _is_first_page),
+]
+
+response_cache = ResponseCache(max_entries=settings.env.RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def invalidate(tag: str):
+    response_cache.invalidate(tag)
+
+
+# Writes of any worker invalidate the responses cached by every worker
+for tag in {rule.tag for rule in rules}:
+    cache.bus.subscribe(tag, lambda key, tag=tag: invalidate(tag))
+
+
+def _get_header(scope, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _is_supported_version(version: str):
+    """
+    Hits skip the version check of the routes: they are only served while the versions in memory are up to date
+    and support the version. Otherwise the route runs, reloads the versions and answers a HTTP 426 if needed.
+    """
+    if version is None:
+        return True
+    if not registry.versions.is_fresh():
+        return False
+    return any(row.version == version and row.supported for row in registry.versions.rows)
+
+
+def _cache_control(ttl: float):
+    return f"public, max-age={max(int(ttl), 0)}".encode('latin-1')
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware serving public read endpoints from memory.
+    Responses are keyed by path, normalized query string and X-Version header, and sent with Cache-Control
+    so nginx can cache them as well. Retired versions are never served from the cache.
+    """
+
+    def __init__(self, app, cache: ResponseCache = response_cache, cache_rules: list = None):
+        self.app = app
+        self.cache = cache
+        self.rules = rules if cache_rules is None else cache_rules
+
+    def _match(self, path: str):
+        for rule in self.rules:
+            if rule.path.match(path):
+                return rule
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not settings.env.RESPONSE_CACHE_ENABLED:
+            return await self.app(scope, receive, send)
+
+        rule = self._match(scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        query_params = sorted(parse_qsl(scope["query_string"].decode('latin-1'), keep_blank_values=True))
+        if rule.is_cacheable_query and not rule.is_cacheable_query(query_params):
+            return await self.app(scope, receive, send)
+
+        version = _get_header(scope, consts.Consts.HEADER_VERSION.encode('latin-1'))
+        key = (rule.tag, scope["path"], urlencode(query_params), version)
+        entry = self.cache.get(key)
+        if entry is not None and _is_supported_version(version):
+            RESPONSE_CACHE_REQUESTS.labels(rule.tag, "hit").inc()
+            return await self._send_entry(scope, send, entry)
+
+        RESPONSE_CACHE_REQUESTS.labels(rule.tag, "miss").inc()
+        generation = self.cache.generation(rule.tag)
+        response_start = {}
+        body = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_start.update(message)
+                if message["status"] == 200:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"cache-control", _cache_control(rule.ttl)),
+                        (b"vary", consts.Consts.HEADER_VERSION.encode('latin-1'))
+                    ]
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self._store(key, rule, generation, response_start, b"".join(body))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _store(self, key, rule: CacheRule, generation: int, response_start: dict, body: bytes):
+        if response_start.get("status") != 200:
+            return
+        headers = [(name, value) for name, value in response_start.get("headers", []) if name.lower() not in (b"cache-control", b"vary", b"set-cookie")]
+        etag = next((value.decode('latin-1') for name, value in headers if name.lower() == b"etag"), None)
+        entry = CacheEntry(200, headers, body, time.monotonic() + rule.ttl, etag)
+        self.cache.set(key, entry, rule.tag, generation)
+
+    async def _send_entry(self, scope, send, entry: CacheEntry):
+        remaining_ttl = entry.expires_at - time.monotonic()
+        cache_headers = [
+            (b"cache-control", _cache_control(remaining_ttl)),
+            (b"vary", consts.Consts.HEADER_VERSION.encode('latin-1'))
+        ]
+        if_none_match = _get_header(scope, consts.Consts.HEADER_IF_NONE_MATCH.encode('latin-1'))
+        if entry.etag and if_none_match and etags.matches(if_none_match, entry.etag, weak=True):
+            await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", entry.etag.encode('latin-1'))] + cache_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": entry.status, "headers": entry.headers + cache_headers})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -1,9 +1,9 @@
 from sqlalchemy.orm import Session
-from crud import user_crud, version_crud, item_crud
+from crud import user_crud, item_crud
 from repository import token_repository
 from exceptions.VersionException import VersionException
 from exceptions.CustomException import CustomException
-from utils import consts
+from utils import consts, registry
 from fastapi import Request
 
 
@@ -93,7 +93,7 @@ def is_admin_or_user_owner(db: Session, token: str, user_id: int):
 
 def is_version_supported(db: Session, version: str):
     if version is not None:
-        db_version = version_crud.get_version(db, version)
+        db_version = registry.versions.find(db, version=version)
         if db_version is None or not db_version.supported:
             raise VersionException(
                 status_code=consts.Consts.ERROR_CODE_426,
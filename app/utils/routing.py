@@ -0,0 +1,23 @@
+import asyncio
+from fastapi import Depends
+from fastapi.routing import APIRoute
+from db import instrumentation
+from utils import memory_profiler, profiler, threadpool
+
+# Applied innermost first: the threadpool wrapper must stay outermost to measure the whole endpoint
+ENDPOINT_WRAPPERS = (memory_profiler.instrument, profiler.instrument, instrumentation.instrument, threadpool.instrument)
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Route class used by every APIRouter of the app.
+    Sync endpoints (run in the threadpool) are wrapped to export threadpool, database and profiling telemetry labelled by route template.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # include_router() builds a new route from an already instrumented one
+        if not asyncio.iscoroutinefunction(endpoint) and not getattr(endpoint, 'is_instrumented', False):
+            for wrap in ENDPOINT_WRAPPERS:
+                endpoint = wrap(endpoint, path)
+            kwargs['dependencies'] = list(kwargs.get('dependencies') or []) + [Depends(threadpool.mark_enqueued)]
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,152 @@
+import re
+import asyncio
+import logging
+from urllib.parse import parse_qsl, urlencode
+from anyio import to_thread
+from db.database import SessionLocal
+from repository import token_repository
+from utils import consts
+from utils.metrics import SINGLE_FLIGHT_REQUESTS
+
+logger = logging.getLogger()
+
+HEADER_AUTH = consts.Consts.HEADER_AUTH.encode('latin-1')
+HEADER_VERSION = consts.Consts.HEADER_VERSION.encode('latin-1')
+HEADER_IF_NONE_MATCH = consts.Consts.HEADER_IF_NONE_MATCH.encode('latin-1')
+
+# Authorization classes: requests of the same class get the same response
+AUTH_PUBLIC = "public"
+AUTH_USER = "user"
+# Answers about the caller rather than about the resource
+UNSHARED_STATUSES = (consts.Consts.ERROR_CODE_401, consts.Consts.ERROR_CODE_403)
+
+
+class SingleFlightRule:
+
+    def __init__(self, name: str, path: str, authorization: str):
+        self.name = name
+        self.path = re.compile(path)
+        self.authorization = authorization
+
+
+rules = [
+    SingleFlightRule("roles", r"^/roles(/\d+)?$", AUTH_PUBLIC),
+    SingleFlightRule("versions", r"^/versions$", AUTH_PUBLIC),
+    SingleFlightRule("users", r"^/users(/\d+)?$", AUTH_PUBLIC),
+    SingleFlightRule("items", r"^/items(/\d+)?$", AUTH_USER),
+]
+
+
+def _get_header(scope, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def authorization_class(scope, rule: SingleFlightRule):
+    """
+    AUTH_USER routes return the same response to any authenticated user: requests sending an access token share
+    a flight, whatever the state of the token cache. Their tokens are checked when the response is shared
+    (is_token_valid). Anonymous requests run on their own and get their own 401.
+    """
+    if rule.authorization == AUTH_PUBLIC:
+        return AUTH_PUBLIC
+    if _get_header(scope, HEADER_AUTH):
+        return AUTH_USER
+    return None
+
+
+def is_token_valid(token: str):
+    # The check of the permission PERMISSION_USER: a token cache hit when the cache is on, a query otherwise
+    db = SessionLocal()
+    try:
+        return token_repository.get_user_by_access_token(db, token) is not None
+    finally:
+        db.close()
+
+
+class SingleFlightMiddleware:
+    """
+    Pure ASGI middleware coalescing identical concurrent GET requests within a worker: the first request (leader)
+    runs the route, the requests arriving before it completes wait and are sent a copy of its response.
+    Requests are identical when they share route, path, normalized query string, X-Version, If-None-Match and
+    authorization class. When the leader fails or is not authorized, each waiter runs the route itself.
+    A waiter of an AUTH_USER flight is only sent the shared response once its own token is checked.
+    """
+
+    def __init__(self, app, single_flight_rules: list = None, token_check=None):
+        self.app = app
+        self.rules = rules if single_flight_rules is None else single_flight_rules
+        self.token_check = token_check or is_token_valid
+        self.flights = {}
+
+    async def _is_authorized(self, scope, authorization: str):
+        if authorization != AUTH_USER:
+            return True
+        token = _get_header(scope, HEADER_AUTH).replace('Bearer ', '')
+        return await to_thread.run_sync(self.token_check, token)
+
+    def _match(self, path: str):
+        for rule in self.rules:
+            if rule.path.match(path):
+                return rule
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+
+        rule = self._match(scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+        authorization = authorization_class(scope, rule)
+        if authorization is None:
+            return await self.app(scope, receive, send)
+
+        query_params = sorted(parse_qsl(scope["query_string"].decode('latin-1'), keep_blank_values=True))
+        key = (rule.name, scope["path"], urlencode(query_params), _get_header(scope, HEADER_VERSION), _get_header(scope, HEADER_IF_NONE_MATCH), authorization)
+
+        flight = self.flights.get(key)
+        if flight is not None:
+            SINGLE_FLIGHT_REQUESTS.labels(rule.name, "coalesced").inc()
+            # Shielded: a waiter cancelled by its client disconnection does not cancel the flight
+            response = await asyncio.shield(flight)
+            if response is not None and await self._is_authorized(scope, authorization):
+                return await self._send_response(send, *response)
+            return await self.app(scope, receive, send)
+
+        SINGLE_FLIGHT_REQUESTS.labels(rule.name, "leader").inc()
+        flight = asyncio.get_running_loop().create_future()
+        self.flights[key] = flight
+        response = {"start": None, "body": []}
+
+        def resolve(result):
+            if flight.done():
+                return
+            # Later requests start a new flight: they may follow a write
+            del self.flights[key]
+            flight.set_result(result)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Copied before the outer middlewares of the leader add their own headers to the message
+                response["start"] = {"status": message["status"], "headers": list(message.get("headers", []))}
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                start = response["start"]
+                # The waiters are answered as soon as the response is complete, without waiting for the client of
+                # the leader to receive it. Server errors and the rejections of the leader's token are not shared:
+                # the waiters try on their own
+                if not message.get("more_body", False) and start["status"] < 500 and start["status"] not in UNSHARED_STATUSES:
+                    resolve((start["status"], start["headers"], b"".join(response["body"])))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            resolve(None)
+
+    async def _send_response(self, send, status: int, headers: list, body: bytes):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,157 @@
+import os
+import mimetypes
+from email.utils import formatdate
+import anyio
+from fastapi import Request
+from starlette.responses import PlainTextResponse, Response
+import settings
+from utils import compression, etags
+
+CHUNK_SIZE = 65536
+ZEROCOPY_EXTENSION = "http.response.zerocopy"
+
+
+class StaticFile:
+
+    def __init__(self, full_path: str, stat_result: os.stat_result, max_memory_size: int):
+        self.full_path = full_path
+        self.size = stat_result.st_size
+        self.media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.body = None
+        if self.size <= max_memory_size:
+            with open(full_path, 'rb') as f:
+                content = f.read()
+            self.body = compression.PrecompressedBody(content, self.media_type)
+            self.etag = self.body.etag
+        else:
+            # Big files are not read at startup: their ETag is derived from size + modification date
+            self.etag = etags.compute_content(f"{self.size}:{stat_result.st_mtime_ns}".encode('utf8'))
+
+
+class CachedStaticFiles:
+    """
+    ASGI app serving the files found under `directory` when the app starts.
+    - Files are indexed once: unknown paths are answered with a HTTP 404 without touching the filesystem
+    - Small files are kept in memory (and precompressed), big files are streamed with sendfile when the server supports it
+    - Responses have a content ETag and a long Cache-Control, and support conditional and range requests
+    """
+
+    def __init__(self, directory: str, max_age: int = None, max_memory_size: int = None):
+        self.max_age = settings.env.STATIC_MAX_AGE if max_age is None else max_age
+        max_memory_size = settings.env.STATIC_MEMORY_MAX_FILE_SIZE if max_memory_size is None else max_memory_size
+        self.files = {}
+        for root, _, names in os.walk(directory):
+            for name in names:
+                full_path = os.path.join(root, name)
+                url_path = "/" + os.path.relpath(full_path, directory).replace(os.sep, "/")
+                static_file = StaticFile(full_path, os.stat(full_path), max_memory_size)
+                if static_file.body is not None:
+                    static_file.body.headers = self.headers(static_file)
+                self.files[url_path] = static_file
+
+    async def __call__(self, scope, receive, send):
+        static_file = self.files.get(scope["path"])
+        if static_file is None:
+            response = PlainTextResponse("Not Found", status_code=404)
+        elif scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+        else:
+            response = await self.file_response(scope, receive, send, static_file)
+        if response is not None:
+            await response(scope, receive, send)
+
+    def headers(self, static_file: StaticFile):
+        return {
+            "etag": static_file.etag,
+            "last-modified": static_file.last_modified,
+            "cache-control": f"public, max-age={self.max_age}",
+            "accept-ranges": "bytes"
+        }
+
+    async def file_response(self, scope, receive, send, static_file: StaticFile):
+        request = Request(scope, receive)
+        headers = self.headers(static_file)
+
+        if etags.is_not_modified(request, static_file.etag):
+            if static_file.body is not None:
+                # With the ETag of the encoding negotiated
+                return static_file.body.response(request)
+            return Response(status_code=304, headers=headers)
+
+        byte_range = None
+        range_header = request.headers.get("range")
+        if range_header and request.headers.get("if-range", static_file.etag) == static_file.etag:
+            byte_range = parse_range(range_header, static_file.size)
+            if byte_range is False:
+                headers["content-range"] = f"bytes */{static_file.size}"
+                return Response(status_code=416, headers=headers)
+
+        if byte_range is None and static_file.body is not None:
+            return static_file.body.response(request)
+
+        start, end = byte_range or (0, static_file.size - 1)
+        length = end - start + 1
+        status_code = 206 if byte_range else 200
+        headers["content-length"] = str(length)
+        if byte_range:
+            headers["content-range"] = f"bytes {start}-{end}/{static_file.size}"
+            # Ranges are never encoded (CompressionMiddleware leaves them untouched), but the full responses
+            # of the same URL may be: caches must key them on Accept-Encoding too
+            if compression.is_compressible(static_file.media_type):
+                headers["vary"] = "Accept-Encoding"
+
+        if static_file.body is not None:
+            content = static_file.body.variants[None][start:end + 1]
+            return Response(content=content, status_code=status_code, media_type=static_file.media_type, headers=headers)
+
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", static_file.media_type.encode('latin-1'))] + [(key.encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()]
+        })
+        if scope["method"] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+        elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(static_file.full_path, 'rb') as f:
+                await send({"type": ZEROCOPY_EXTENSION, "file": f, "offset": start, "count": length})
+        else:
+            await self.stream_file(send, static_file, start, length)
+        return None
+
+    async def stream_file(self, send, static_file: StaticFile, start: int, length: int):
+        async with await anyio.open_file(static_file.full_path, 'rb') as f:
+            await f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+
+def parse_range(range_header: str, size: int):
+    """
+    Returns (start, end) for a single satisfiable range, None when the header should be ignored
+    (unknown unit, malformed or multiple ranges) and False when the range cannot be satisfied.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            suffix_length = int(last)
+            if suffix_length == 0:
+                return False
+            return max(size - suffix_length, 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, end
@@ -13,6 +13,9 @@ responses = {
         "model": Status,
         "description": "Return created"
     },
+    304: {
+        "description": "Not modified: Resource matches the ETag sent in If-None-Match header"
+    },
     400: {
         "content": {"application/json": {
             "example": {"detail": "Invalid role_id 3"}
@@ -48,6 +51,13 @@ responses = {
         "model": Status,
         "description": "Conflict"
     },
+    412: {
+        "content": {"application/json": {
+            "example": {"detail": "Precondition failed: Resource has been modified"}
+        }},
+        "model": Status,
+        "description": "Resource does not match the ETag sent in If-Match header"
+    },
     422: {
         "content": {"application/json": {
             "example": {"detail": "Unexpected JSON payload"}
@@ -62,6 +72,13 @@ responses = {
         "model": Status,
         "description": "Version X is not supported anymore"
     },
+    429: {
+        "content": {"application/json": {
+            "example": {"detail": "Too many requests: Please retry later"}
+        }},
+        "model": Status,
+        "description": "Rate limit exceeded, retry after the number of seconds of the Retry-After header"
+    },
     500: {
         "content": {"application/json": {
             "example": {"detail": "Internal error: Failed to update User"}
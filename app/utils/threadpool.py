@@ -0,0 +1,68 @@
+import time
+from functools import wraps
+from anyio import to_thread
+from fastapi import Request
+import settings
+from exceptions.CustomException import CustomException
+from utils import consts
+from utils.metrics import THREADPOOL_IN_USE, THREADPOOL_QUEUE_WAIT, THREADPOOL_REJECTED, THREADPOOL_RUN_TIME, THREADPOOL_SIZE
+
+# Default limiter of anyio, shared by the sync routes, the sync dependencies and every to_thread.run_sync call
+limiter = None
+
+
+def configure():
+    # Must be called from the event loop: the limiter is bound to it
+    global limiter
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.env.THREADPOOL_SIZE
+    THREADPOOL_SIZE.set(limiter.total_tokens)
+
+
+def update_in_use(released: int = 0):
+    # Threads borrowed by anyone, not only by the instrumented routes. released: tokens about to be given back
+    if limiter is not None:
+        THREADPOOL_IN_USE.set(max(limiter.borrowed_tokens - released, 0))
+
+
+async def mark_enqueued(request: Request):
+    # Route-level dependencies are solved first: the queue wait measured from here also covers the other
+    # dependencies (get_db runs in the threadpool too) and the validation of the request body
+    request.state.threadpool_enqueued_at = time.perf_counter()
+    update_in_use()
+
+
+def instrument(func, route: str):
+    """
+    Wrap a sync endpoint to measure the time it waited for a thread and the time it ran in it.
+    """
+    max_queue_wait = settings.env.THREADPOOL_MAX_QUEUE_WAIT_MS / 1000
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        request = kwargs.get('request')
+        enqueued_at = getattr(request.state, 'threadpool_enqueued_at', None) if request else None
+        if enqueued_at is not None:
+            queue_wait = start_time - enqueued_at
+            THREADPOOL_QUEUE_WAIT.labels(route).observe(queue_wait)
+            if max_queue_wait and queue_wait > max_queue_wait:
+                # Give the thread back right away instead of adding DB work to a saturated server
+                THREADPOOL_REJECTED.labels(route).inc()
+                raise CustomException(
+                    db=kwargs.get('db'),
+                    status_code=consts.Consts.ERROR_CODE_503,
+                    detail=consts.Consts.SERVER_BUSY,
+                    info=f"Request waited {round(queue_wait * 1000, 2)} ms for a thread on {route}",
+                    headers={"Retry-After": "1"}
+                )
+
+        update_in_use()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # The thread of this request is given back once it returns
+            update_in_use(released=1)
+            THREADPOOL_RUN_TIME.labels(route).observe(time.perf_counter() - start_time)
+    wrapper.is_instrumented = True
+    return wrapper
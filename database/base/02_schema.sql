@@ -27,6 +27,7 @@ CREATE TABLE IF NOT EXISTS users (
   access_token_expiration DATETIME DEFAULT NULL,
   refresh_token VARCHAR(255) DEFAULT NULL,
   refresh_token_expiration DATETIME DEFAULT NULL,
+  version INT UNSIGNED NOT NULL DEFAULT 1,
   UNIQUE(access_token),
   UNIQUE(refresh_token),
   UNIQUE(username),
@@ -41,6 +42,7 @@ CREATE TABLE IF NOT EXISTS items (
   user_id INT(6) UNSIGNED NOT NULL,
   created_at DATETIME NOT NULL,
   updated_at DATETIME DEFAULT NULL,
+  version INT UNSIGNED NOT NULL DEFAULT 1,
   FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
@@ -56,3 +58,10 @@ CREATE TABLE IF NOT EXISTS tokens (
   UNIQUE(refresh_token),
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE ON UPDATE CASCADE
 );
+
+-- Cron leases: the holder of a lease runs the job
+CREATE TABLE IF NOT EXISTS leases (
+  name VARCHAR(64) NOT NULL PRIMARY KEY,
+  holder VARCHAR(255) DEFAULT NULL,
+  expires_at DATETIME DEFAULT NULL
+);
@@ -4,7 +4,7 @@ INSERT INTO roles(id, name) VALUES(1, 'admin');
 INSERT INTO roles(id, name) VALUES(2, 'user');
 
 INSERT INTO `users` VALUES
-(1,'admin','48579d7e8e12ababfe72f731abd7482a616d7e79cacd22508d8e0e296ae906f44e6c7b870c6e182e22b5c068ce44c1ccff8a5b3e114b721da0bc79bf920ece08',1,1,'2023-10-15 15:07:04',NULL,'$2b$12$6gH9uwwk/Mpputs36FtQAu',NULL,NULL,NULL,NULL);
+(1,'admin','48579d7e8e12ababfe72f731abd7482a616d7e79cacd22508d8e0e296ae906f44e6c7b870c6e182e22b5c068ce44c1ccff8a5b3e114b721da0bc79bf920ece08',1,1,'2023-10-15 15:07:04',NULL,'$2b$12$6gH9uwwk/Mpputs36FtQAu',NULL,NULL,NULL,NULL,1);
 
 INSERT INTO versions(version, supported) VALUES("0.1", 0);
 INSERT INTO versions(version, supported) VALUES("0.2", 0);